@@ -0,0 +1,241 @@
+"""Load test of the Streamlit app: N doctors working through the consultation
+flow at the same time against a database seeded by med4me_synthetic.
+
+Every simulated doctor drives med4me_streamlit.py headlessly with Streamlit's
+AppTest: log in, then for each round refresh the sidebar, open one of their
+patients and submit symptoms_form, which scores the consultation and waits
+for the visit to be saved. The wall time of each of those script runs is
+what the doctor would wait for; the report gives its percentiles per stage,
+the errors seen (exceptions, st.error messages, visits without the saved
+confirmation, run timeouts) and the app's own METRICS stages, including
+db.lock_wait, the time writers spent waiting for the SQLite write lock.
+
+AppTest keeps per-run state in process globals, so runs cannot overlap within
+one interpreter: each doctor is its own process. CPU and the database's write
+lock are shared as on a real server, but each process loads its own model and
+caches, so it warms up with one unmeasured round before the clock starts.
+
+    python benchmarks/bench_app_load.py [--doctors 8] [--rounds 5] [--patients 5] [--visits 3] [--think-ms 0] [--db PATH]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import med4me_db
+from med4me_metrics import Histogram, METRICS
+import med4me_synthetic
+
+APP = ROOT / 'med4me_streamlit.py'
+PREFIX = 'loaddoc'
+PASSWORD = 'loadtest'
+STAGES = ('login', 'sidebar', 'open_patient', 'save_visit')
+
+SYMPTOMS = [
+    "high fever and body ache", "frequent urination and excessive thirst", "severe headache with nausea",
+    "wheezing at night", "joint pain and stiffness", "itching rash after eating peanuts",
+    "acidity and bloating after meals", "anxious and cannot sleep", "runny nose sneezing sore throat",
+]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def seed(doctors, patients, visits):
+    """Synthetic doctor accounts, each with patients that already have visits"""
+    med4me_synthetic.generate(doctors, patients, visits, prefix=PREFIX, password=PASSWORD)
+
+
+class Doctor:
+    """One simulated doctor's session"""
+
+    def __init__(self, index, patients, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.name = med4me_synthetic.doctor_names(index + 1, PREFIX)[index]
+        self.patients = med4me_synthetic.patient_ids(index + 1, patients)
+        self.at = AppTest.from_file(str(APP), default_timeout=timeout)
+        self.rng = random.Random(index)
+        self.samples = {stage: [] for stage in STAGES}
+        self.errors = []
+
+    def _button(self, label):
+        for button in self.at.button:
+            if button.label == label:
+                return button
+        raise LookupError(f"no {label!r} button")
+
+    def _step(self, stage, action, check=None):
+        """Run one user action as a script run; time it and record its errors"""
+        start = time.perf_counter()
+        try:
+            action()
+            self.at.run()
+        except Exception as e:
+            self.samples[stage].append(time.perf_counter() - start)
+            self.errors.append((stage, f"{type(e).__name__}: {e}"))
+            return
+        self.samples[stage].append(time.perf_counter() - start)
+        for exception in self.at.exception:
+            self.errors.append((stage, exception.message))
+        for error in self.at.error:
+            self.errors.append((stage, error.value))
+        if check is not None and not self.at.exception and not check():
+            self.errors.append((stage, "expected output missing"))
+
+    def login(self):
+        self.at.run()
+
+        def submit():
+            self.at.text_input[0].input(self.name)
+            self.at.text_input[1].input(PASSWORD)
+            self._button("Login").click()
+        self._step('login', submit, lambda: self.at.session_state.authenticated)
+
+    def consult(self):
+        patient_id = self.rng.choice(self.patients)
+        self._step('sidebar', lambda: self._button("🔄 Refresh").click())
+        self._step('open_patient', lambda: self.at.button(key=patient_id).click(),
+                   lambda: any(b.label == "Generate Recommendation" for b in self.at.button))
+
+        def submit():
+            for text_area in self.at.text_area:
+                if text_area.label == "Enter current symptoms:":
+                    text_area.input(self.rng.choice(SYMPTOMS))
+            self._button("Generate Recommendation").click()
+        self._step('save_visit', submit, lambda: any(c.value == "✓ Visit saved" for c in self.at.caption))
+
+    def logout(self):
+        self._button("🚪 Logout").click()
+        self.at.run()
+
+
+def run_doctor(index, args, db_path, barrier, results):
+    warnings.simplefilter('ignore')
+    med4me_db.set_db_path(db_path)
+    try:
+        doctor = Doctor(index, args.patients, args.timeout)
+        # Warm-up: imports, model load and first queries stay off the clock
+        doctor.login()
+        doctor.consult()
+        doctor.logout()
+        if doctor.errors:
+            raise RuntimeError(f"warm-up failed: {doctor.errors[0]}")
+        doctor.samples = {stage: [] for stage in STAGES}
+        METRICS.reset()
+    except BaseException:
+        # Release the others from the barrier rather than leave them waiting
+        barrier.abort()
+        raise
+    barrier.wait()
+
+    doctor.login()
+    for _ in range(args.rounds):
+        time.sleep(args.think_ms / 1000)
+        doctor.consult()
+    results.put((index, doctor.samples, doctor.errors, METRICS.histograms()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=5, help="consultations per doctor")
+    parser.add_argument('--patients', type=int, default=5, help="seeded patients per doctor")
+    parser.add_argument('--visits', type=int, default=3, help="seeded visits per patient")
+    parser.add_argument('--think-ms', type=float, default=0, help="pause before each consultation")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds allowed per script run")
+    parser.add_argument('--db', help="database to use (default: a fresh temporary one)")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'load.db')
+    med4me_db.set_db_path(db_path)
+    seed(args.doctors, args.patients, args.visits)
+    med4me_db.get_pool().close()
+
+    context = multiprocessing.get_context('spawn')
+    # The parent joins the barrier too, so the clock starts once every doctor is warm
+    barrier = context.Barrier(args.doctors + 1)
+    results = context.Queue()
+    processes = [context.Process(target=run_doctor, args=(i, args, db_path, barrier, results))
+                 for i in range(args.doctors)]
+    for p in processes:
+        p.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        for p in processes:
+            p.join()
+        sys.exit("A simulated doctor failed during warm-up (traceback above)")
+    start = time.perf_counter()
+    reports = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.join()
+
+    samples = {stage: [] for stage in STAGES}
+    errors = []
+    histograms = {}
+    for _, doctor_samples, doctor_errors, doctor_histograms in reports:
+        for stage in STAGES:
+            samples[stage].extend(doctor_samples[stage])
+        errors.extend(doctor_errors)
+        for name, histogram in doctor_histograms.items():
+            histograms.setdefault(name, Histogram()).merge(histogram)
+
+    visits = len(samples['save_visit'])
+    print(f"{args.doctors} doctors x {args.rounds} consultations, {os.cpu_count()} cores, db {db_path}")
+    print(f"  {visits} consultations in {elapsed:.1f} s ({visits / elapsed:.1f}/s)")
+    report = {'doctors': args.doctors, 'rounds': args.rounds, 'elapsed_s': elapsed,
+              'stages': {}, 'app_stages': {}, 'errors': errors}
+
+    print("\n  stage (script run)         runs    p50 ms    p95 ms    p99 ms    max ms  errors")
+    for stage in STAGES:
+        runs = samples[stage]
+        if not runs:
+            continue
+        summary = {'runs': len(runs), 'errors': sum(1 for s, _ in errors if s == stage)}
+        for q in (0.5, 0.95, 0.99, 1.0):
+            summary[f'p{round(q * 100)}_ms'] = percentile(runs, q) * 1000
+        report['stages'][stage] = summary
+        print(f"  {stage:24s} {summary['runs']:6d} {summary['p50_ms']:9.1f} {summary['p95_ms']:9.1f}"
+              f" {summary['p99_ms']:9.1f} {summary['p100_ms']:9.1f} {summary['errors']:7d}")
+
+    print("\n  app stage (METRICS)           calls    p50 ms    p95 ms    p99 ms    max ms")
+    for name, histogram in sorted(histograms.items()):
+        summary = histogram.summary()
+        report['app_stages'][name] = summary
+        print(f"  {name:28s} {summary['count']:6d} {summary['p50_ms']:9.2f} {summary['p95_ms']:9.2f}"
+              f" {summary['p99_ms']:9.2f} {summary['max_ms']:9.2f}")
+
+    lock_wait = histograms.get('db.lock_wait')
+    if lock_wait is not None:
+        print(f"\n  write lock: {lock_wait.count} transactions waited {lock_wait.sum * 1000:.1f} ms in total,"
+              f" longest {lock_wait.max * 1000:.1f} ms")
+    if errors:
+        print(f"\n  {len(errors)} errors, first {min(len(errors), 10)}:")
+        for stage, message in errors[:10]:
+            print(f"    {stage}: {message}")
+    else:
+        print("\n  no errors")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Cold-start cost of the model: pickled sklearn objects loaded at import vs the
+compact ml_model.npz loaded on the first recommendation.
+
+Every measurement runs in a fresh interpreter, so import and page-cache
+warmup are included the way a new Streamlit server process would pay them.
+
+    python benchmarks/bench_cold_start.py [--repeat 3]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+basedir = Path(__file__).resolve().parent.parent
+APP = basedir / 'med4me_streamlit.py'
+
+# First paint of the login page: the old app unpickled the model before
+# rendering anything, the new one renders without touching the model
+FIRST_PAINT = """
+import json, time, warnings
+warnings.simplefilter('ignore')
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_{source}.run()
+assert not at.exception, at.exception
+print(json.dumps({{'seconds': time.perf_counter() - start}}))
+"""
+
+EAGER_PREFIX = """
+import pickle
+with open({model!r}, 'rb') as f:
+    pickle.load(f)
+with open({vectorizer!r}, 'rb') as f:
+    pickle.load(f)
+"""
+
+# Load + first recommendation, as paid by the first doctor to submit a form
+FIRST_PREDICTION = """
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{load}
+loaded = time.perf_counter()
+label, confidence, _ = engine.predict("high fever and body ache", "30", "male")
+done = time.perf_counter()
+print(json.dumps({{'load': loaded - start, 'first': done - loaded, 'label': str(label), 'confidence': confidence}}))
+"""
+
+LOAD_PICKLE = """
+from med4me_inference import load_engine
+engine = load_engine({model!r}, {vectorizer!r})
+"""
+
+LOAD_COMPACT = """
+from med4me_artifacts import load_compact_engine
+engine = load_compact_engine({artifact!r})
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=basedir)
+    if out.returncode:
+        raise SystemExit(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def best(code, repeat, key):
+    return min(run(code)[key] for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = {
+        'model': str(basedir / 'ml_model.pkl'),
+        'vectorizer': str(basedir / 'vectorizer.pkl'),
+        'artifact': str(basedir / 'ml_model.npz'),
+        'root': str(basedir),
+    }
+    eager_app = EAGER_PREFIX.format(**paths) + APP.read_text()
+    eager = best(FIRST_PAINT.format(source=f"string({eager_app!r}, default_timeout=120)"), args.repeat, 'seconds')
+    lazy = best(FIRST_PAINT.format(source=f"file({str(APP)!r}, default_timeout=120)"), args.repeat, 'seconds')
+    print(f"Time to first paint (login page), best of {args.repeat}")
+    print(f"  eager pickle load : {eager * 1000:8.0f} ms")
+    print(f"  lazy model load   : {lazy * 1000:8.0f} ms   ({eager / lazy:.1f}x)")
+
+    pickled = [run(FIRST_PREDICTION.format(load=LOAD_PICKLE.format(**paths), **paths)) for _ in range(args.repeat)]
+    compact = [run(FIRST_PREDICTION.format(load=LOAD_COMPACT.format(**paths), **paths)) for _ in range(args.repeat)]
+    print("\nFirst recommendation in a fresh process (load + first predict), best of", args.repeat)
+    for name, runs in (('pickle + sklearn', pickled), ('compact .npz', compact)):
+        load = min(r['load'] for r in runs)
+        first = min(r['first'] for r in runs)
+        print(f"  {name:16s}: load {load * 1000:6.0f} ms + predict {first * 1000:5.1f} ms")
+
+    if (pickled[0]['label'], pickled[0]['confidence']) != (compact[0]['label'], compact[0]['confidence']):
+        raise SystemExit(f"✗ Predictions differ: {pickled[0]} vs {compact[0]}")
+    print(f"\n✓ Same prediction from both: {compact[0]['label']} ({compact[0]['confidence']:.4f})")
+    sizes = {name: Path(p).stat().st_size for name, p in paths.items() if name != 'root'}
+    print(f"  on disk: pickles {(sizes['model'] + sizes['vectorizer']) / 1024:.0f} KB, "
+          f"npz {sizes['artifact'] / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Reruns per second: per-call sqlite3.connect vs the pooled WAL connection layer.
+
+A simulated Streamlit rerun runs init_db (the app calls it at the top of every
+script run), reads the sidebar and the selected patient's history; every tenth
+rerun also submits a visit. Several threads play concurrent doctors.
+
+    python benchmarks/bench_db_pool.py [--doctors 8] [--reruns 300]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import med4me_db
+import med4me_synthetic
+
+RECOMMENDATION = {
+    "Diagnosis": "Acute febrile illness", "Medicine": "- Paracetamol 500 mg",
+    "Lifestyle": "Rest", "Follow-Up": "48 hours", "ml_prediction": "fever", "ml_confidence": 0.8
+}
+
+
+# Baseline data access (one connection per call, rollback journal)
+def legacy_init_db(db_path):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(med4me_db.SELECT_USER, ('admin',))
+    if not cur.fetchone():
+        cur.execute(med4me_db.INSERT_USER, ('admin', med4me_db.hash_password('admin123')))
+    conn.commit()
+    conn.close()
+
+def legacy_get_doctor_patients(db_path, doctor_id):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(med4me_db.SELECT_DOCTOR_PATIENTS, (doctor_id,))
+    patients = cur.fetchall()
+    conn.close()
+    return patients
+
+def legacy_get_patient_history(db_path, patient_id, doctor_id):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(med4me_db.SELECT_PATIENT_HISTORY, (patient_id, doctor_id))
+    history = cur.fetchall()
+    conn.close()
+    return history
+
+def legacy_add_doctor_patient_mapping(db_path, doctor_id, patient_id):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute(med4me_db.INSERT_MAPPING, (doctor_id, patient_id))
+    conn.commit()
+    conn.close()
+
+def legacy_save_visit(db_path, patient_id, doctor_id, data, recommendation):
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    legacy_add_doctor_patient_mapping(db_path, doctor_id, patient_id)
+    cur.execute(med4me_db.INSERT_VISIT, (
+        patient_id, doctor_id, data['symptoms'], data['age'], data['gender'], None,
+        recommendation['Medicine'], recommendation['Diagnosis'], recommendation['Lifestyle'],
+        recommendation['Follow-Up'], recommendation['ml_prediction'], recommendation['ml_confidence'], None
+    ))
+    conn.commit()
+    conn.close()
+
+
+def seed(db_path, doctors, patients, visits):
+    """Synthetic fixture; returns {doctor_id: one of their patient ids}"""
+    med4me_db.set_db_path(db_path)
+    doctor_ids = med4me_synthetic.generate(doctors, patients, visits)
+    med4me_db.get_pool().close()
+    return {doctor_id: med4me_synthetic.patient_ids(number, 1)[0]
+            for number, doctor_id in enumerate(doctor_ids, start=1)}
+
+
+def run(label, rerun, patients, reruns):
+    def worker(doctor_id, patient_id):
+        for i in range(reruns):
+            rerun(doctor_id, patient_id, i)
+
+    threads = [threading.Thread(target=worker, args=item) for item in patients.items()]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = len(patients) * reruns
+    print(f"  {label:<10} {total / elapsed:10.1f} reruns/s  ({total} reruns in {elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=8)
+    parser.add_argument("--patients", type=int, default=10)
+    parser.add_argument("--visits", type=int, default=2)
+    parser.add_argument("--reruns", type=int, default=300)
+    args = parser.parse_args()
+
+    data = {"symptoms": "fever headache", "age": "30", "gender": "male"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+        patients = seed(legacy_path, args.doctors, args.patients, args.visits)
+        seed(pooled_path, args.doctors, args.patients, args.visits)
+        # The baseline ran with SQLite's default rollback journal
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+
+        def legacy_rerun(doctor_id, patient_id, i):
+            legacy_init_db(legacy_path)
+            legacy_get_doctor_patients(legacy_path, doctor_id)
+            legacy_get_patient_history(legacy_path, patient_id, doctor_id)
+            if i % 10 == 0:
+                legacy_save_visit(legacy_path, patient_id, doctor_id, data, RECOMMENDATION)
+
+        def pooled_rerun(doctor_id, patient_id, i):
+            med4me_db.init_db()
+            med4me_db.get_doctor_patients(doctor_id)
+            med4me_db.get_patient_history(patient_id, doctor_id)
+            if i % 10 == 0:
+                med4me_db.save_visit(patient_id, doctor_id, data, RECOMMENDATION)
+
+        print(f"{args.doctors} doctors x {args.reruns} reruns, "
+              f"{args.patients} patients/doctor, {args.visits} visits/patient")
+        run("before", legacy_rerun, patients, args.reruns)
+        med4me_db.set_db_path(pooled_path)
+        run("after", pooled_rerun, patients, args.reruns)
+        med4me_db.get_pool().close()
+
+
+if __name__ == "__main__":
+    main()
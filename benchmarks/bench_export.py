@@ -0,0 +1,72 @@
+"""Visit export: throughput and peak Python memory of the streaming exporter
+in each format, against materializing the table with fetchall() first.
+
+Peak memory is traced with tracemalloc (Python allocations only), so it
+shows whether it grows with the row count.
+
+    python benchmarks/bench_export.py [--visits 200000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import med4me_db
+import med4me_export
+import med4me_synthetic
+
+def fill(count):
+    """About count synthetic visits: 20 doctors, 10 visits per patient"""
+    return med4me_synthetic.generate(doctors=20, patients=max(1, count // 200), visits=10)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    written = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return written, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--visits', type=int, default=200000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    med4me_db.set_db_path(os.path.join(directory, 'bench.db'))
+    doctor_ids = fill(args.visits)
+    print(f"{args.visits} visits")
+
+    def fetchall_csv():
+        with med4me_db.get_pool().connection() as conn:
+            rows = conn.execute(med4me_export.export_query()[0]).fetchall()
+        with open(os.devnull, 'wb') as out:
+            return sum(len(chunk) for chunk in med4me_export.encode_csv([rows]) if out.write(chunk) or True)
+
+    def streamed(fmt, **scope):
+        def run():
+            with open(os.devnull, 'wb') as out:
+                return med4me_export.write_export(out, fmt, **scope)
+        return run
+
+    cases = [('fetchall csv', fetchall_csv)]
+    for fmt in sorted(med4me_export.FORMATS):
+        if fmt != 'parquet' or med4me_export.parquet_available():
+            cases.append((f"stream {fmt}", streamed(fmt)))
+    cases.append(("stream csv, doctor", streamed('csv', doctor_id=doctor_ids[0])))
+
+    for name, fn in cases:
+        written, elapsed, peak = measure(fn)
+        print(f"  {name:20s} {elapsed:6.2f} s  {written / 1e6:8.1f} MB out  peak memory {peak / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
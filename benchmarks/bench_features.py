@@ -0,0 +1,74 @@
+"""Feature rows for a whole visit table: re-tokenizing visit.symptoms with
+the vectorizer vs reading the feature store (table, and packed + mmapped).
+
+A temporary database is filled with synthetic visits, backfilled and packed,
+then each way of getting the full CSR matrix is timed.
+
+    python benchmarks/bench_features.py [--visits 50000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import med4me_db
+import med4me_features
+import med4me_synthetic
+from med4me_inference import load_engine
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def fill(count):
+    """About count synthetic visits: 10 doctors, 10 visits per patient"""
+    med4me_synthetic.generate(doctors=10, patients=max(1, count // 100), visits=10)
+
+
+def best_of(fn, repeats=3):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--visits', type=int, default=50000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    med4me_db.set_db_path(os.path.join(directory, 'bench.db'))
+    fill(args.visits)
+    engine = load_engine(ROOT / 'ml_model.pkl', ROOT / 'vectorizer.pkl')
+
+    start = time.perf_counter()
+    version, _ = med4me_features.backfill(engine, log=lambda *_: None)
+    print(f"{args.visits} visits, vectorizer {version}: backfill {time.perf_counter() - start:.2f}s")
+    packed_dir = os.path.join(directory, 'features')
+    start = time.perf_counter()
+    med4me_features.pack(version, packed_dir, log=lambda *_: None)
+    print(f"  pack {time.perf_counter() - start:.2f}s")
+
+    def transform():
+        with med4me_db.get_pool().connection() as conn:
+            rows = conn.execute("SELECT symptoms, age, gender FROM visit ORDER BY id").fetchall()
+        symptoms, ages, genders = zip(*rows)
+        return engine.features([s.lower() for s in symptoms], ages, genders)
+
+    for name, fn in (
+        ('re-tokenize', transform),
+        ('store table', lambda: med4me_features.read_matrix(version)[1]),
+        ('packed mmap', lambda: med4me_features.load_matrix(version, packed_dir)[1]),
+    ):
+        seconds, X = best_of(fn)
+        print(f"  {name:12s} {seconds * 1000:8.1f} ms   {X.shape[0]} x {X.shape[1]}, {X.nnz} non-zeros")
+
+
+if __name__ == "__main__":
+    main()
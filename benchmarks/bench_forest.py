@@ -0,0 +1,99 @@
+"""Forest evaluation latency: RandomForestClassifier.predict_proba vs the
+depth-stepping CompactForest, on the same feature rows, at several batch sizes.
+The engine column is InferenceEngine.predict_proba, which picks one of the two
+by batch size (COMPACT_MAX_ROWS).
+
+With --sparse it instead times one CHUNK_ROWS block of CSR rows, widened
+with empty columns, through CompactForest.apply both densified and read in
+place, which is where SPARSE_MIN_FEATURES comes from.
+
+    python benchmarks/bench_forest.py [--batches 1 64 10000] [--repeat 20] [--sparse]
+"""
+import argparse
+import random
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+basedir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(basedir))
+
+from med4me_forest import CHUNK_ROWS
+from med4me_inference import load_engine
+
+SPARSE_WIDTHS = [0, 2000, 10000, 30000, 100000]
+
+
+def synthetic_rows(vectorizer, count, seed=7):
+    """Random symptom texts drawn from the model's own vocabulary"""
+    rng = random.Random(seed)
+    terms = vectorizer.get_feature_names_out().tolist()
+    symptoms = [' '.join(rng.sample(terms, rng.randint(1, 6))) for _ in range(count)]
+    ages = [str(rng.randint(1, 90)) for _ in range(count)]
+    genders = [rng.choice(['male', 'female']) for _ in range(count)]
+    return symptoms, ages, genders
+
+
+def timed(fn, X, repeat):
+    """Median seconds per call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(X)
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2]
+
+
+def sparse_widths(engine, repeat):
+    """apply() on one CSR block, densified vs read in place, by feature count"""
+    forest = engine.forest
+    X = engine.features(*synthetic_rows(engine.vectorizer, CHUNK_ROWS))
+    print(f"{'features':>9} {'densified':>12} {'in place':>12}")
+    for extra in SPARSE_WIDTHS:
+        wide = sp.hstack([X, sp.csr_matrix((X.shape[0], extra))], format='csr')
+        if not np.array_equal(forest.apply(wide), forest.apply(wide.toarray())):
+            raise SystemExit(f"✗ {wide.shape[1]} features: leaves differ")
+        dense = timed(lambda block: forest.apply(block.toarray()), wide, repeat)
+        in_place = timed(forest.apply, wide, repeat)
+        print(f"{wide.shape[1]:>9} {dense * 1000:>10.2f}ms {in_place * 1000:>10.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 64, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--sparse', action='store_true', help="compare densified and in-place CSR blocks by width")
+    args = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        engine = load_engine(basedir / 'ml_model.pkl', basedir / 'vectorizer.pkl')
+    model, forest = engine.model, engine.forest
+    print(f"{len(forest.roots)} trees, {len(forest.threshold)} nodes, depth {forest.depth}")
+    if args.sparse:
+        sparse_widths(engine, args.repeat)
+        return
+    print(f"{'batch':>7} {'sklearn':>12} {'compact':>12} {'speedup':>8} {'engine':>12}")
+
+    for batch in args.batches:
+        X = engine.features(*synthetic_rows(engine.vectorizer, batch))
+        repeat = max(3, args.repeat if batch < 1000 else args.repeat // 4)
+        expected = model.predict_proba(X)
+        actual = forest.predict_proba(X)
+        if not np.array_equal(expected, actual):
+            raise SystemExit(f"✗ batch {batch}: probabilities differ (max {np.abs(expected - actual).max()})")
+        sk = timed(model.predict_proba, X, repeat)
+        compact = timed(forest.predict_proba, X, repeat)
+        dispatched = timed(engine.predict_proba, X, repeat)
+        print(f"{batch:>7} {sk * 1000:>10.2f}ms {compact * 1000:>10.2f}ms {sk / compact:>7.1f}x "
+              f"{dispatched * 1000:>10.2f}ms")
+
+    print("✓ Probabilities identical to sklearn at every batch size")
+
+
+if __name__ == "__main__":
+    main()
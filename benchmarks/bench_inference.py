@@ -0,0 +1,79 @@
+"""Per-call latency of ml_recommendation's model step: dense hstack + predict +
+predict_proba vs InferenceEngine (sparse row, one predict_proba).
+
+    python benchmarks/bench_inference.py [--calls 200]
+"""
+import argparse
+import pickle
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+basedir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(basedir))
+
+from med4me_inference import InferenceEngine
+
+CASES = [
+    ("high fever and body ache", "30", "male"),
+    ("frequent urination and excessive thirst", "55", "female"),
+    ("severe headache with nausea", "35", "female"),
+    ("wheezing and shortness of breath at night", "28", "male"),
+]
+
+
+def legacy_predict(model, vectorizer, symptoms, age, gender):
+    text_vector = vectorizer.transform([symptoms.lower()])
+    age_val = int(age) if str(age).isdigit() else 30
+    gender_val = 0 if gender.lower() in ['male', 'm'] else 1
+    X = np.hstack([
+        text_vector.toarray(),
+        np.array([[age_val]]),
+        np.array([[gender_val]])
+    ])
+    prediction = model.predict(X)[0]
+    probabilities = model.predict_proba(X)[0]
+    return prediction, float(max(probabilities))
+
+
+def time_calls(fn, calls):
+    samples = []
+    for i in range(calls):
+        symptoms, age, gender = CASES[i % len(CASES)]
+        start = time.perf_counter()
+        fn(symptoms, age, gender)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return np.median(samples), np.percentile(samples, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    with open(basedir / 'ml_model.pkl', 'rb') as f:
+        model = pickle.load(f)
+    with open(basedir / 'vectorizer.pkl', 'rb') as f:
+        vectorizer = pickle.load(f)
+    engine = InferenceEngine(model, vectorizer)
+
+    for symptoms, age, gender in CASES:
+        label, confidence, _ = engine.predict(symptoms.lower(), age, gender)
+        assert (label, confidence) == legacy_predict(model, vectorizer, symptoms, age, gender)
+
+    print(f"{args.calls} single-row calls, {model.n_estimators} trees")
+    for name, fn in [
+        ("before", lambda s, a, g: legacy_predict(model, vectorizer, s, a, g)),
+        ("after", lambda s, a, g: engine.predict(s.lower(), a, g)),
+    ]:
+        p50, p95 = time_calls(fn, args.calls)
+        print(f"  {name:<8} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
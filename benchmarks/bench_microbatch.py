@@ -0,0 +1,85 @@
+"""Concurrent recommendation scoring: every session scoring its own row
+inline vs the MicroBatcher gathering rows into batched calls, with a few
+batching windows.
+
+--sessions threads (default 200) each run --requests consultations
+back to back, as doctors submitting at the same moment would.
+
+    python benchmarks/bench_microbatch.py [--sessions 200] [--requests 20] [--windows 0,2,5]
+"""
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from med4me_registry import ActiveModel
+from med4me_scheduler import MicroBatcher, BATCH_MAX
+
+SYMPTOMS = [
+    "high fever and body ache", "frequent urination and excessive thirst", "severe headache with nausea",
+    "wheezing at night", "joint pain and stiffness", "itching rash after eating peanuts",
+    "acidity and bloating after meals", "anxious and cannot sleep", "runny nose sneezing sore throat",
+]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load(call, sessions, requests):
+    latencies = [[] for _ in range(sessions)]
+    barrier = threading.Barrier(sessions + 1)
+
+    def session(index):
+        barrier.wait()
+        for i in range(requests):
+            record = (SYMPTOMS[(index + i) % len(SYMPTOMS)], str(20 + (index * 7 + i) % 60),
+                      'female' if i % 2 else 'male')
+            start = time.perf_counter()
+            call(record)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return [s for samples in latencies for s in samples], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--windows', default='0,2,5', help="batching windows in ms")
+    parser.add_argument('--max-batch', type=int, default=BATCH_MAX)
+    args = parser.parse_args()
+
+    engine = ActiveModel().get().engine
+
+    def score(records):
+        symptoms, ages, genders = zip(*records)
+        labels, confidences, _ = engine.predict_many([s.lower() for s in symptoms], ages, genders)
+        return list(zip(labels.tolist(), confidences.tolist()))
+
+    print(f"{args.sessions} sessions x {args.requests} requests")
+    cases = [('inline', lambda record: score([record])[0], None)]
+    for window in args.windows.split(','):
+        batcher = MicroBatcher(score, window_ms=float(window), max_batch=args.max_batch)
+        cases.append((f"batched {window} ms/{args.max_batch}", batcher.run, batcher))
+
+    for name, call, batcher in cases:
+        samples, elapsed = load(call, args.sessions, args.requests)
+        extra = f"   mean batch {batcher.stats()['mean_batch']:5.1f}" if batcher else ''
+        print(f"  {name:18s} {len(samples) / elapsed:7.0f} req/s   p50 {percentile(samples, 0.5) * 1000:7.2f} ms"
+              f"   p99 {percentile(samples, 0.99) * 1000:7.2f} ms{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Recommendation rendering: inline CSS and seven sections vs a stylesheet link and one card.
+
+For a rerun that shows a recommendation, compares what the app builds and
+sends to the browser. The original sends its <style> block and the heading,
+then formats seven rec-section markdown elements. The current app sends a
+stylesheet link and the catalog's pre-rendered card with the notes appended.
+Payload is the serialized ForwardMsg of each of those elements, which is what
+goes over the websocket. Time covers building the recommendation, rendering
+its markup and serializing the messages.
+
+    python benchmarks/bench_render.py [--reruns 20000]
+"""
+import argparse
+import json
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.string_util import clean_text
+
+from med4me_catalog import card_markdown, catalog_for, fallback_recommendation, model_recommendation
+from med4me_rules import FALLBACK_DEFAULT, FALLBACK_TREATMENTS, match_categories
+
+STYLESHEET = ROOT / 'static' / 'med4me.css'
+LEGACY_CSS = "\n<style>\n" + textwrap.indent(STYLESHEET.read_text(), '    ') + "</style>\n"
+LINK = '<link rel="stylesheet" href="app/static/med4me.css?v=0123456789ab">'
+
+
+# Baseline rendering, as show_recommendation and its callers had it
+def legacy_recommendation(prediction, confidence, treatment, model_version):
+    diagnosis_map = {
+        'fever': 'Acute Febrile Illness',
+        'diabetes': 'Type 2 Diabetes Mellitus',
+        'cold': 'Upper Respiratory Tract Infection (URTI)',
+        'headache': 'Tension Headache / Migraine',
+        'hypertension': 'Hypertension',
+        'asthma': 'Asthma',
+        'gastric': 'Gastritis',
+        'allergy': 'Allergic Reaction',
+        'arthritis': 'Osteoarthritis',
+        'mental_health': 'Anxiety/Depression - Requires Specialist',
+        'general': 'General Symptomatic Care'
+    }
+    return {
+        "Diagnosis": diagnosis_map.get(prediction, 'Condition Requiring Further Assessment'),
+        "Medicine": treatment.get("Medicine", "Symptomatic treatment recommended"),
+        "Alternative": treatment.get("Alternative", "Consult specialist for alternatives"),
+        "Lifestyle": treatment.get("Lifestyle", "Healthy lifestyle, adequate rest"),
+        "Red Flags": treatment.get("Red Flags", "Worsening symptoms, no improvement in 3 days"),
+        "Follow-Up": treatment.get("Follow-Up", "Review in 48-72 hours"),
+        "Notes": f"ML Model Prediction: {prediction} (Confidence: {confidence*100:.1f}%). This is an AI-assisted recommendation.",
+        "ml_prediction": prediction,
+        "ml_confidence": confidence,
+        "model_version": model_version
+    }
+
+def legacy_fallback(symptoms):
+    rec = dict(FALLBACK_DEFAULT)
+    categories = match_categories(symptoms)
+    if categories:
+        rec.update(FALLBACK_TREATMENTS[categories[0]])
+    return rec
+
+def legacy_bodies(rec):
+    """Markdown bodies of the original CSS block and recommendation elements"""
+    return [LEGACY_CSS, "### 📋 Medical Recommendation", f"""
+    <div class="rec-section">
+    <strong>🔍 Diagnosis:</strong><br/>
+    {rec.get('Diagnosis', 'N/A')}
+    </div>
+    """, f"""
+    <div class="rec-section">
+    <strong>💊 Medication:</strong><br/>
+    {rec.get('Medicine', 'N/A').replace('- ', '<br/>- ')}
+    </div>
+    """, f"""
+    <div class="rec-section">
+    <strong>🔄 Alternative Medication:</strong><br/>
+    {rec.get('Alternative', 'N/A').replace('- ', '<br/>- ')}
+    </div>
+    """, f"""
+    <div class="rec-section">
+    <strong>🏃 Lifestyle Recommendations:</strong><br/>
+    {rec.get('Lifestyle', 'N/A')}
+    </div>
+    """, f"""
+    <div class="rec-section warning">
+    <strong>⚠️ Red Flags / Warning Signs:</strong><br/>
+    {rec.get('Red Flags', 'N/A')}
+    </div>
+    """, f"""
+    <div class="rec-section">
+    <strong>📅 Follow-Up:</strong><br/>
+    {rec.get('Follow-Up', 'N/A')}
+    </div>
+    """, f"""
+    <div class="rec-section">
+    <strong>📝 Notes:</strong><br/>
+    <em>{rec.get('Notes', 'N/A')}</em>
+    </div>
+    """]
+
+
+def current_bodies(rec):
+    return [LINK, card_markdown(rec)]
+
+
+def messages(bodies):
+    """Serialized markdown deltas, as st.markdown(body, unsafe_allow_html=True) sends them"""
+    out = []
+    for index, body in enumerate(bodies):
+        msg = ForwardMsg()
+        msg.metadata.delta_path.extend([0, index])
+        msg.delta.new_element.markdown.body = clean_text(body)
+        msg.delta.new_element.markdown.allow_html = True
+        out.append(msg.SerializeToString())
+    return out
+
+
+def time_reruns(rerun, reruns):
+    start = time.perf_counter()
+    for i in range(reruns):
+        rerun(i)
+    return (time.perf_counter() - start) / reruns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(ROOT / 'treatment_db.json') as f:
+        treatment_db = json.load(f)
+    labels = list(treatment_db)
+    symptoms = ["high fever and body ache", "wheezing at night", "feeling unwell"]
+    general = treatment_db.get('general', {})
+
+    cases = {
+        "model": (
+            lambda i: legacy_bodies(legacy_recommendation(
+                labels[i % len(labels)], 0.61, treatment_db.get(labels[i % len(labels)], general), 'v1')),
+            lambda i: current_bodies(model_recommendation(
+                catalog_for('v1', treatment_db).lookup(labels[i % len(labels)]), labels[i % len(labels)], 0.61, 'v1')),
+        ),
+        "fallback": (
+            lambda i: legacy_bodies(legacy_fallback(symptoms[i % len(symptoms)])),
+            lambda i: current_bodies(fallback_recommendation(symptoms[i % len(symptoms)], 30, 'male')),
+        ),
+    }
+
+    print(f"Rendering one recommendation per rerun, {args.reruns} reruns per case")
+    print("  case       path      elements   bytes/rerun   us/rerun")
+    for case, (legacy, current) in cases.items():
+        results = []
+        for path, bodies_for in (("before", legacy), ("after", current)):
+            sizes = [sum(len(m) for m in messages(bodies_for(i))) for i in range(len(labels))]
+            elapsed = time_reruns(lambda i: messages(bodies_for(i)), args.reruns)
+            results.append((sum(sizes) / len(sizes), elapsed))
+            print(f"  {case:<10} {path:<8} {len(bodies_for(0)):9d} {results[-1][0]:13.0f} {elapsed * 1e6:10.1f}")
+        (before_bytes, before_s), (after_bytes, after_s) = results
+        print(f"  {case:<10} saved    {'':9} {before_bytes - after_bytes:13.0f} {(before_s - after_s) * 1e6:10.1f}"
+              f"  ({1 - after_bytes / before_bytes:.0%} of the bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Fallback matching: sequential re.search chain vs the compiled RuleMatcher.
+
+Times both on ~10 KB symptom notes: ordinary clinical text, text with no
+matching rule (the chain runs all 15 searches), and adversarial inputs that
+make the ``.*`` patterns backtrack. The chain stops at the first rule; the
+matcher reports every matching category, and both must agree on priority.
+
+    python benchmarks/bench_rules.py [--size 10000] [--repeat 5]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from med4me_rules import FALLBACK_RULES, FALLBACK_MATCHER
+
+FILLER = ("patient reports feeling unwell for several days with reduced appetite and "
+          "poor concentration at work no recent travel vitals recorded at triage ").split()
+
+
+def legacy_first_match(s):
+    for key, pattern, _ in FALLBACK_RULES:
+        if re.search(pattern, s):
+            return key
+    return None
+
+
+def note(size, rng, tail=""):
+    words = []
+    while sum(len(w) + 1 for w in words) < size - len(tail):
+        words.append(rng.choice(FILLER))
+    return " ".join(words) + tail
+
+
+def inputs(size):
+    rng = random.Random(7)
+    return {
+        "clinical note": note(size, rng, " complains of joint pain and mild fever"),
+        "no match": note(size, rng),
+        "high ... (no sugar)": "high " * (size // 5),
+        "high blood ... (no pressure)": "high blood " * (size // 11),
+        "head / joint / back ...": "head joint back knee " * (size // 21),
+    }
+
+
+def best_of(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'input (' + str(args.size // 1000) + ' KB)':<32} {'chain':>10} {'matcher':>10}")
+    for name, text in inputs(args.size).items():
+        categories = FALLBACK_MATCHER.match(text)
+        assert (categories[0] if categories else None) == legacy_first_match(text)
+        chain = best_of(legacy_first_match, text, args.repeat)
+        matcher = best_of(FALLBACK_MATCHER.match, text, args.repeat)
+        print(f"{name:<32} {chain:8.2f}ms {matcher:8.2f}ms   {categories}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Load test for the inference service: throughput and latency with 1, 2, 4 ...
+worker processes (up to the core count), against scoring inline in the
+calling threads as the app does without the service.
+
+Each run starts med4me_service.py as a subprocess on a free port, then
+--clients threads (playing concurrent Streamlit sessions) send --requests
+consultations each through ServiceClient.
+
+    python benchmarks/bench_service.py [--clients 32] [--requests 100] [--workers 1,2,4]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from med4me_registry import ActiveModel
+from med4me_service import ServiceClient
+
+SYMPTOMS = [
+    "high fever and body ache", "frequent urination and excessive thirst", "severe headache with nausea",
+    "wheezing at night", "joint pain and stiffness", "itching rash after eating peanuts",
+    "acidity and bloating after meals", "anxious and cannot sleep", "runny nose sneezing sore throat",
+]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def load(call, clients, requests):
+    """Latencies of every call and the wall-clock seconds for all of them"""
+    latencies = [[] for _ in range(clients)]
+
+    def client(index):
+        for i in range(requests):
+            symptoms = SYMPTOMS[(index + i) % len(SYMPTOMS)]
+            start = time.perf_counter()
+            call(symptoms, str(20 + (index * 7 + i) % 60), 'female' if i % 2 else 'male')
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [s for samples in latencies for s in samples], time.perf_counter() - start
+
+
+def report(name, samples, elapsed, extra=''):
+    print(f"  {name:18s} {len(samples) / elapsed:7.0f} req/s   p50 {percentile(samples, 0.5) * 1000:7.2f} ms"
+          f"   p99 {percentile(samples, 0.99) * 1000:7.2f} ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--workers', help="comma-separated worker counts (default: 1, 2, 4 ... cores)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(',')]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cores:
+            worker_counts.append(worker_counts[-1] * 2)
+    print(f"{args.clients} clients x {args.requests} requests, {cores} cores")
+
+    engine = ActiveModel().get().engine
+    samples, elapsed = load(lambda s, a, g: engine.predict(s.lower(), a, g), args.clients, args.requests)
+    report('inline', samples, elapsed)
+
+    for workers in worker_counts:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, str(ROOT / 'med4me_service.py'), '--port', str(port), '--workers', str(workers)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            server.stdout.readline()  # "✓ Inference service on ..." once the workers are warm
+            client = ServiceClient(f"http://127.0.0.1:{port}", timeout=30)
+            samples, elapsed = load(client.recommend, args.clients, args.requests)
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health") as response:
+                health = json.load(response)
+            report(f"service x{workers}", samples, elapsed, f"   mean batch {health['mean_batch']:5.1f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Sidebar query: correlated subqueries vs the indexed patient_summary join.
+
+Builds a synthetic database with 100k visits (by default), then times
+get_doctor_patients using the original unindexed query (on --sample doctors,
+since it is slow) and the migrated schema (on every doctor).
+
+    python benchmarks/bench_sidebar.py [--doctors 20] [--patients 250] [--visits 20]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import med4me_db
+import med4me_synthetic
+
+LEGACY_SELECT_DOCTOR_PATIENTS = """
+    SELECT DISTINCT dp.patient_id, dp.created_at,
+           (SELECT COUNT(*) FROM visit WHERE doctor_id = ? AND patient_id = dp.patient_id) as visit_count,
+           (SELECT date FROM visit WHERE doctor_id = ? AND patient_id = dp.patient_id ORDER BY date DESC LIMIT 1) as last_visit,
+           (SELECT symptoms FROM visit WHERE doctor_id = ? AND patient_id = dp.patient_id ORDER BY date DESC LIMIT 1) as last_symptoms
+    FROM doctor_patient dp
+    WHERE dp.doctor_id = ?
+    ORDER BY dp.created_at DESC
+"""
+
+
+def seed_legacy(db_path, doctors, patients, visits):
+    """Create the pre-migration schema and fill it with synthetic visits"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.executescript("""
+        CREATE TABLE user (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE doctor_patient (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doctor_id INTEGER NOT NULL,
+            patient_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(doctor_id, patient_id)
+        );
+        CREATE TABLE visit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT NOT NULL,
+            doctor_id INTEGER,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            symptoms TEXT, age TEXT, gender TEXT, genetic_history TEXT,
+            medicine TEXT, diagnosis TEXT, lifestyle TEXT, follow_up TEXT,
+            ml_prediction TEXT, ml_confidence REAL
+        );
+    """)
+    doctor_ids = med4me_synthetic.populate(conn, doctors, patients, visits)
+    conn.close()
+    return doctor_ids
+
+
+def time_query(conn, sql, params_for, doctors):
+    start = time.perf_counter()
+    for d in doctors:
+        conn.execute(sql, params_for(d)).fetchall()
+    return (time.perf_counter() - start) / len(doctors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--patients", type=int, default=250)
+    parser.add_argument("--visits", type=int, default=20)
+    parser.add_argument("--sample", type=int, default=1,
+                        help="doctors to time with the (slow) original query")
+    args = parser.parse_args()
+    total = args.doctors * args.patients * args.visits
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        doctor_ids = seed_legacy(db_path, args.doctors, args.patients, args.visits)
+        print(f"Synthetic database: {args.doctors} doctors x {args.patients} patients, {total} visits")
+
+        conn = sqlite3.connect(db_path)
+        before = time_query(conn, LEGACY_SELECT_DOCTOR_PATIENTS, lambda d: (d, d, d, d),
+                            doctor_ids[:args.sample])
+        conn.close()
+        print(f"  before   {before * 1000:9.2f} ms per sidebar")
+
+        med4me_db.set_db_path(db_path)
+        start = time.perf_counter()
+        med4me_db.init_db()
+        print(f"  migrate  {(time.perf_counter() - start) * 1000:9.2f} ms (indexes + summary backfill)")
+
+        with med4me_db.get_pool().connection() as conn:
+            after = time_query(conn, med4me_db.SELECT_DOCTOR_PATIENTS, lambda d: (d,), doctor_ids)
+        print(f"  after    {after * 1000:9.2f} ms per sidebar  ({before / after:.0f}x)")
+
+        # The summary must agree with the original query
+        legacy = sqlite3.connect(db_path)
+        for d in doctor_ids[:args.sample]:
+            expected = sorted(legacy.execute(LEGACY_SELECT_DOCTOR_PATIENTS, (d, d, d, d)).fetchall())
+            actual = sorted(med4me_db.get_doctor_patients(d))
+            assert [r[:4] for r in expected] == [r[:4] for r in actual], "summary mismatch"
+        legacy.close()
+        med4me_db.get_pool().close()
+
+
+if __name__ == "__main__":
+    main()
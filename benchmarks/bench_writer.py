@@ -0,0 +1,100 @@
+"""Visit submit latency and throughput: synchronous save_visit vs the
+write-behind VisitWriter, with several threads playing concurrent doctors.
+
+"direct" is save_visit as the app called it before (synchronous=NORMAL, one
+commit per visit); "direct-full" is the same with synchronous=FULL, i.e. the
+durability the writer acknowledges with; "writer" submits through
+VisitWriter and waits for the acknowledgement. "render blocked" is how long
+the submit call holds up drawing the recommendation.
+
+    python benchmarks/bench_writer.py [--doctors 16] [--visits 100] [--patients 100]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import med4me_db
+import med4me_synthetic
+from med4me_writer import VisitWriter
+
+RECOMMENDATION = {
+    "Diagnosis": "Acute febrile illness", "Medicine": "- Paracetamol 500 mg",
+    "Lifestyle": "Rest", "Follow-Up": "48 hours", "ml_prediction": "fever", "ml_confidence": 0.8
+}
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(mode, doctors, visits, patients):
+    """Latencies of every submit (until durable) and wall-clock seconds"""
+    directory = tempfile.mkdtemp()
+    med4me_db.set_db_path(os.path.join(directory, 'bench.db'))
+    # Visits land in an already populated table, indexes and all
+    doctor_ids = med4me_synthetic.generate(doctors, patients, visits=10)
+    if mode == 'direct-full':
+        # Pooled connections are reused, so setting it once per idle connection sticks
+        pool = med4me_db.get_pool()
+        conns = [med4me_db.connect(pool.db_path) for _ in range(pool.size)]
+        for conn in conns:
+            conn.execute("PRAGMA synchronous = FULL")
+            pool._idle.put(conn)
+    writer = VisitWriter(med4me_db.get_pool().db_path) if mode == 'writer' else None
+
+    latencies = [[] for _ in range(doctors)]
+    blocking = [[] for _ in range(doctors)]
+
+    def doctor(index):
+        doctor_id = doctor_ids[index]
+        patient_ids = med4me_synthetic.patient_ids(index + 1, min(patients, 10))
+        for i in range(visits):
+            data = {'symptoms': f"fever {i}", 'age': '30', 'gender': 'male', 'genetic_history': None}
+            start = time.perf_counter()
+            if writer:
+                ack = writer.submit(patient_ids[i % len(patient_ids)], doctor_id, data, RECOMMENDATION)
+                blocking[index].append(time.perf_counter() - start)
+                ack.result()
+            else:
+                med4me_db.save_visit(patient_ids[i % len(patient_ids)], doctor_id, data, RECOMMENDATION)
+                blocking[index].append(time.perf_counter() - start)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=doctor, args=(i,)) for i in range(doctors)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    batches = writer.stats()['mean_batch'] if writer else 1.0
+    if writer:
+        writer.close()
+    flatten = lambda per_doctor: [s for samples in per_doctor for s in samples]
+    return flatten(latencies), flatten(blocking), elapsed, batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=16)
+    parser.add_argument('--visits', type=int, default=100)
+    parser.add_argument('--patients', type=int, default=100, help="seeded patients per doctor, 10 visits each")
+    args = parser.parse_args()
+
+    print(f"{args.doctors} doctors x {args.visits} visits")
+    for mode in ('direct', 'direct-full', 'writer'):
+        samples, blocking, elapsed, batch = run(mode, args.doctors, args.visits, args.patients)
+        print(f"  {mode:12s} {len(samples) / elapsed:6.0f} visits/s   durable p50 {percentile(samples, 0.5) * 1000:6.2f} ms"
+              f"  p99 {percentile(samples, 0.99) * 1000:6.2f} ms   render blocked p99 "
+              f"{percentile(blocking, 0.99) * 1000:6.2f} ms   mean batch {batch:4.1f}")
+
+
+if __name__ == "__main__":
+    main()
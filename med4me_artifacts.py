@@ -0,0 +1,183 @@
+"""Compact model artifacts.
+
+export_artifacts() flattens a fitted TfidfVectorizer and RandomForestClassifier
+into plain arrays in a single uncompressed .npz file: the vocabulary and idf
+weights, and every tree's nodes (see med4me_forest). CompactEngine scores
+with those arrays using numpy alone, so serving needs neither sklearn nor
+unpickling, and it reproduces sklearn's predict_proba exactly.
+
+    python med4me_artifacts.py    # ml_model.pkl + vectorizer.pkl -> ml_model.npz
+"""
+import argparse
+import math
+import re
+from pathlib import Path
+
+import numpy as np
+
+from med4me_encoding import encode_age, encode_gender
+from med4me_forest import CompactForest, forest_arrays
+
+basedir = Path(__file__).parent
+ARTIFACT_PATH = basedir / 'ml_model.npz'
+FORMAT_VERSION = 1
+
+
+def export_artifacts(model, vectorizer, path):
+    """Write model and vectorizer to path as a compact .npz"""
+    params = vectorizer.get_params()
+    if params['analyzer'] != 'word' or any(
+            params[name] is not None for name in ('tokenizer', 'preprocessor', 'stop_words', 'strip_accents')):
+        raise ValueError("only word analyzers with default preprocessing can be exported")
+
+    np.savez(
+        path,
+        format_version=np.array(FORMAT_VERSION),
+        classes=np.array([str(c) for c in model.classes_]),
+        n_features=np.array(model.n_features_in_),
+        terms=np.array(vectorizer.get_feature_names_out().tolist()),
+        idf=vectorizer.idf_.astype(np.float64),
+        ngram_range=np.array(params['ngram_range']),
+        lowercase=np.array(params['lowercase']),
+        token_pattern=np.array(params['token_pattern']),
+        norm=np.array(params['norm'] or ''),
+        sublinear_tf=np.array(params['sublinear_tf']),
+        **forest_arrays(model),
+    )
+
+
+class CompactVectorizer:
+    """TF-IDF transform over an exported vocabulary (mirrors TfidfVectorizer)"""
+
+    def __init__(self, terms, idf, ngram_range, lowercase, token_pattern, norm, sublinear_tf):
+        self.vocabulary = {term: index for index, term in enumerate(terms)}
+        self.idf = idf.tolist()
+        self.min_n, self.max_n = ngram_range
+        self.lowercase = lowercase
+        self.token_pattern = re.compile(token_pattern)
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    def ngrams(self, tokens):
+        min_n, max_n = self.min_n, self.max_n
+        if max_n == 1:
+            return tokens
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            for i in range(len(tokens) - n + 1):
+                grams.append(' '.join(tokens[i:i + n]))
+        return grams
+
+    def transform_into(self, text, row):
+        """Write the TF-IDF weights of text into the float row"""
+        if self.lowercase:
+            text = text.lower()
+        counts = {}
+        for gram in self.ngrams(self.token_pattern.findall(text)):
+            index = self.vocabulary.get(gram)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+
+        # Same arithmetic, in the same (sorted column) order, as sklearn
+        indices = sorted(counts)
+        values = [float(counts[index]) for index in indices]
+        if self.sublinear_tf:
+            values = [math.log(v) + 1.0 for v in values]
+        values = [v * self.idf[index] for v, index in zip(values, indices)]
+        if self.norm == 'l2':
+            total = 0.0
+            for v in values:
+                total += v * v
+            total = math.sqrt(total)
+        elif self.norm == 'l1':
+            total = 0.0
+            for v in values:
+                total += abs(v)
+        else:
+            total = 0.0
+        if total != 0.0:
+            values = [v / total for v in values]
+        for index, v in zip(indices, values):
+            row[index] = v
+
+
+class CompactEngine:
+    """Drop-in replacement for InferenceEngine backed by an exported .npz"""
+
+    def __init__(self, classes, n_features, vectorizer, forest):
+        self.classes = classes
+        self.n_features = n_features
+        self.vectorizer = vectorizer
+        self.forest = forest
+
+    def features(self, symptoms, ages, genders):
+        """float32 feature rows: TF-IDF columns, then age and gender"""
+        X = np.zeros((len(symptoms), self.n_features), dtype=np.float64)
+        for row, text, age, gender in zip(X, symptoms, ages, genders):
+            self.vectorizer.transform_into(text, row)
+            row[-2] = encode_age(age)
+            row[-1] = encode_gender(gender)
+        # sklearn's trees compare float32 features
+        return X.astype(np.float32)
+
+    def predict_proba(self, X):
+        return self.forest.predict_proba(X)
+
+    def predict_many(self, symptoms, ages, genders):
+        """Return (labels, confidences, probabilities) for a batch of consultations"""
+        probabilities = self.predict_proba(self.features(symptoms, ages, genders))
+        best = np.argmax(probabilities, axis=1)
+        return self.classes[best], probabilities[np.arange(len(best)), best], probabilities
+
+    def predict(self, symptoms, age, gender):
+        """Return (label, confidence, probabilities) for one consultation"""
+        probabilities = self.predict_proba(self.features([symptoms], [age], [gender]))[0]
+        best = int(np.argmax(probabilities))
+        return self.classes[best], float(probabilities[best]), probabilities
+
+
+def load_compact_engine(path=ARTIFACT_PATH):
+    """Load an exported .npz into a CompactEngine"""
+    with np.load(path, allow_pickle=False) as data:
+        if int(data['format_version']) != FORMAT_VERSION:
+            raise ValueError(f"unsupported artifact format {int(data['format_version'])}")
+        vectorizer = CompactVectorizer(
+            data['terms'].tolist(), data['idf'], tuple(data['ngram_range'].tolist()),
+            bool(data['lowercase']), str(data['token_pattern']), str(data['norm']) or None,
+            bool(data['sublinear_tf']),
+        )
+        forest = CompactForest(data['roots'], data['feature'], data['threshold'],
+                               data['left'], data['right'], data['proba'])
+        return CompactEngine(data['classes'], int(data['n_features']), vectorizer, forest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the pickled model to a compact .npz")
+    parser.add_argument('--model', default=str(basedir / 'ml_model.pkl'))
+    parser.add_argument('--vectorizer', default=str(basedir / 'vectorizer.pkl'))
+    parser.add_argument('-o', '--output', default=str(ARTIFACT_PATH))
+    args = parser.parse_args(argv)
+
+    from med4me_inference import load_engine
+
+    engine = load_engine(args.model, args.vectorizer)
+    export_artifacts(engine.model, engine.vectorizer, args.output)
+    compact = load_compact_engine(args.output)
+
+    # Check the export against sklearn on every vocabulary term plus a few sentences
+    texts = list(compact.vectorizer.vocabulary) + [
+        "high fever and body ache", "frequent urination and excessive thirst",
+        "severe headache with nausea", "",
+    ]
+    ages = [(7 * i) % 90 for i in range(len(texts))]
+    genders = ['male' if i % 2 else 'female' for i in range(len(texts))]
+    expected = engine.model.predict_proba(engine.features(texts, ages, genders))
+    actual = compact.predict_proba(compact.features(texts, ages, genders))
+    if not np.array_equal(expected, actual):
+        raise SystemExit(f"✗ Export does not match sklearn (max diff {np.abs(expected - actual).max()})")
+    print(f"✓ Exported {len(compact.forest.roots)} trees to {args.output} "
+          f"({Path(args.output).stat().st_size / 1024:.0f} KB), predictions identical on {len(texts)} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Bulk recommendation scoring.
+
+Scores (symptoms, age, gender) records in chunks: each chunk is vectorized
+with a single transform call and passed through the forest once, and results
+are yielded as soon as their chunk is done, so inputs of any size stream
+through in bounded memory.
+
+    python med4me_batch.py intake.jsonl -o scored.jsonl
+    python med4me_batch.py intake.csv -o scored.csv
+    python med4me_batch.py --rescore-db [--db med4me.db]
+
+Scoring uses the model the app serves: the registry's CURRENT version, else
+the bundled files. --version picks another published version and
+--model/--vectorizer score with pickles from anywhere.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+from med4me_inference import differential, load_engine
+
+basedir = Path(__file__).parent
+CHUNK_SIZE = 2048
+
+
+def served_engine(version=None, model_path=None, vectorizer_path=None):
+    """(model_version, engine): explicit pickles, a registry version, CURRENT, else the bundled model"""
+    import med4me_registry
+
+    if model_path or vectorizer_path:
+        model_path = Path(model_path or basedir / med4me_registry.MODEL_FILE)
+        engine = load_engine(model_path, vectorizer_path or basedir / med4me_registry.VECTORIZER_FILE)
+        return f"file-{hashlib.sha256(model_path.read_bytes()).hexdigest()[:12]}", engine
+    version = version or med4me_registry.current_version()
+    if version:
+        engine, _ = med4me_registry.load_version(version)
+        return version, engine
+    version, engine, _ = med4me_registry.load_bundled(basedir)
+    return version, engine
+
+def chunked(iterable, size):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def recommend_batch(engine, records, chunk_size=CHUNK_SIZE):
+    """Yield (label, confidence) for each (symptoms, age, gender) record, in order"""
+    for chunk in chunked(records, chunk_size):
+        symptoms, ages, genders = zip(*chunk)
+        labels, confidences, _ = engine.predict_many(
+            [(s or "").lower() for s in symptoms], ages, genders)
+        yield from zip(labels.tolist(), confidences.tolist())
+
+
+# File input/output
+def read_records(path, fmt):
+    """Yield dict rows from a JSONL or CSV file"""
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def score_file(engine, input_path, output_path, fmt, chunk_size=CHUNK_SIZE):
+    """Score every row of input_path into output_path; returns the row count"""
+    count = 0
+    with open(output_path, 'w', newline='') as out:
+        writer = None
+        for chunk in chunked(read_records(input_path, fmt), chunk_size):
+            triples = [(row.get('symptoms'), row.get('age'), row.get('gender') or '') for row in chunk]
+            for row, (label, confidence) in zip(chunk, recommend_batch(engine, triples, chunk_size)):
+                row['ml_prediction'] = label
+                row['ml_confidence'] = confidence
+                if fmt == 'csv':
+                    if writer is None:
+                        writer = csv.DictWriter(out, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(row) + '\n')
+            count += len(chunk)
+    return count
+
+
+# Database re-scoring
+SELECT_VISIT_CHUNK = """
+    SELECT id, symptoms, age, gender FROM visit
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+UPDATE_VISIT_PREDICTION = """
+    UPDATE visit SET ml_prediction = ?, ml_confidence = ?, model_version = ? WHERE id = ?
+"""
+
+DELETE_VISIT_DIFFERENTIAL = "DELETE FROM visit_differential WHERE visit_id = ?"
+
+def rescore_visits(engine, model_version, chunk_size=CHUNK_SIZE):
+    """Recompute every visit's prediction, confidence, model version and differential;
+    returns the row count"""
+    from med4me_db import INSERT_VISIT_DIFFERENTIAL, get_pool, init_db
+
+    # Brings older databases up to the schema with visit_differential
+    init_db()
+    pool = get_pool()
+    last_id, count = 0, 0
+    while True:
+        # Keyset walk over visit ids; each chunk is updated in its own transaction
+        with pool.connection() as conn:
+            rows = conn.execute(SELECT_VISIT_CHUNK, (last_id, chunk_size)).fetchall()
+        if not rows:
+            return count
+        _, symptoms, ages, genders = zip(*rows)
+        labels, confidences, probabilities = engine.predict_many(
+            [(s or "").lower() for s in symptoms], ages, [g or '' for g in genders])
+        tops = differential(engine.classes, probabilities)
+        visit_ids = [(row[0],) for row in rows]
+        with pool.transaction() as cur:
+            cur.executemany(UPDATE_VISIT_PREDICTION, [
+                (label, confidence, model_version, row[0])
+                for row, label, confidence in zip(rows, labels.tolist(), confidences.tolist())
+            ])
+            # The stored differential must agree with the new prediction
+            cur.executemany(DELETE_VISIT_DIFFERENTIAL, visit_ids)
+            cur.executemany(INSERT_VISIT_DIFFERENTIAL, [
+                (row[0], rank, label, probability)
+                for row, top in zip(rows, tops) for rank, (label, probability) in enumerate(top)
+            ])
+        last_id = rows[-1][0]
+        count += len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk Med4Me recommendation scoring")
+    parser.add_argument('input', nargs='?', help="JSONL or CSV file with symptoms, age, gender columns")
+    parser.add_argument('-o', '--output', help="where to write scored rows (same format as input)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="override format detection")
+    parser.add_argument('--rescore-db', action='store_true',
+                        help="rescore every stored visit (prediction, confidence, model version, differential)")
+    parser.add_argument('--db', help="database path (default: med4me.db next to the app)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--version', help="registry version to score with (default: CURRENT, else bundled)")
+    parser.add_argument('--model', help="score with this model pickle instead")
+    parser.add_argument('--vectorizer', help="vectorizer pickle for --model")
+    args = parser.parse_args(argv)
+
+    if not args.rescore_db and not (args.input and args.output):
+        parser.error("give an input and --output file, or --rescore-db")
+
+    model_version, engine = served_engine(args.version, args.model, args.vectorizer)
+    print(f"✓ Model {model_version}", file=sys.stderr)
+    start = time.perf_counter()
+
+    if args.rescore_db:
+        if args.db:
+            from med4me_db import set_db_path
+            set_db_path(args.db)
+        count = rescore_visits(engine, model_version, args.chunk_size)
+    else:
+        fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+        count = score_file(engine, args.input, args.output, fmt, args.chunk_size)
+
+    elapsed = time.perf_counter() - start
+    print(f"✓ Scored {count} rows in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from med4me_encoding import age_band, encode_gender
+
+CACHE_SIZE = 1024
+CACHE_TTL = 3600
+QUERY_CACHE_SIZE = 128
+QUERY_CACHE_TTL = float(os.environ.get('MED4ME_QUERY_CACHE_TTL', 30))
+
+
+def recommendation_key(symptoms, age, gender):
+    """Cache key for a consultation: normalized symptom tokens, age band, gender.
+
+    Tokens keep their order (the vectorizer uses bigrams), apostrophes and
+    line breaks (the fallback rules match ``can't`` and do not cross lines),
+    so two inputs share a key only if both recommendation paths would score
+    them identically. Ages within one band are treated as equivalent.
+    """
+    tokens = re.findall(r"[\w']+|\n", (symptoms or "").lower())
+    return ' '.join(tokens), age_band(age), encode_gender(gender)
+
+
+class RecommendationCache:
+    """Thread-safe LRU cache with a TTL, cleared when watched files change.
+
+    ``watch`` lists the model artifacts; their (mtime, size) signature is
+    checked on every lookup and the cache empties itself when it moves, so a
+    retrained model or edited treatment database is never served stale.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, watch=()):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.watch = list(watch)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature = self._current_signature()
+
+    def _current_signature(self):
+        signature = []
+        for path in self.watch:
+            try:
+                stat = path.stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return signature
+
+    def get(self, key):
+        """Return a copy of the cached value, or None"""
+        signature = self._current_signature()
+        now = time.monotonic()
+        with self._lock:
+            if signature != self._signature:
+                self._entries.clear()
+                self._signature = signature
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (dict(value), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+            }
+
+
+class QueryCache:
+    """Per-session LRU of database reads, invalidated by the doctor's data version.
+
+    Each entry remembers the version (``versions.get(doctor_id)``, normally
+    med4me_db.DATA_VERSIONS) it was read at; any write for that doctor moves
+    the version on, so the next lookup misses and reads again. The TTL bounds
+    how stale a result can get through writes from other processes, which the
+    version does not see. One session runs one script at a time, so there is
+    no lock.
+    """
+
+    def __init__(self, versions, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.versions = versions
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def call(self, fn, doctor_id, *args, **kwargs):
+        """fn(*args, **kwargs), from the cache while doctor_id's data is unchanged"""
+        key = (fn.__name__, doctor_id, args, tuple(sorted(kwargs.items())))
+        # Read the version before the query: a write landing in between leaves
+        # the entry at the old version, so it is never served
+        version = self.versions.get(doctor_id)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] == version and entry[2] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        result = fn(*args, **kwargs)
+        self._entries[key] = (result, version, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._entries),
+        }
@@ -0,0 +1,177 @@
+"""Compiled treatment catalog.
+
+A recommendation's treatment text depends only on its category and on the
+served model's treatment_db, so it is compiled once into TreatmentRecords
+instead of being assembled per request: the recommendation fields as a
+read-only mapping, plus the recommendation card show_recommendation
+displays, already rendered as one markdown/HTML fragment. A request looks
+its record up, copies the fields and adds what is its own (notes with the
+confidence, prediction, model version, differential), which card_markdown()
+appends to the card as its last sections.
+
+TreatmentCatalog holds the model categories of one treatment_db, keyed by
+label; catalog_for() keeps one per served model version, so a swapped-in
+version gets a catalog built from its own treatment_db. FALLBACK_CATALOG
+holds the rule-based categories of med4me_rules, compiled at import.
+"""
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from med4me_rules import FALLBACK_DEFAULT, FALLBACK_RULES, match_categories
+
+DIAGNOSES = {
+    'fever': 'Acute Febrile Illness',
+    'diabetes': 'Type 2 Diabetes Mellitus',
+    'cold': 'Upper Respiratory Tract Infection (URTI)',
+    'headache': 'Tension Headache / Migraine',
+    'hypertension': 'Hypertension',
+    'asthma': 'Asthma',
+    'gastric': 'Gastritis',
+    'allergy': 'Allergic Reaction',
+    'arthritis': 'Osteoarthritis',
+    'mental_health': 'Anxiety/Depression - Requires Specialist',
+    'general': 'General Symptomatic Care'
+}
+# Classes retraining learns from the fallback rules use the rule's diagnosis
+DIAGNOSES.update({key: fields['Diagnosis'] for key, _, fields in FALLBACK_RULES if key not in DIAGNOSES})
+UNKNOWN_DIAGNOSIS = 'Condition Requiring Further Assessment'
+
+# Fields a model label's treatment_db entry may leave out
+TREATMENT_DEFAULTS = {
+    "Medicine": "Symptomatic treatment recommended",
+    "Alternative": "Consult specialist for alternatives",
+    "Lifestyle": "Healthy lifestyle, adequate rest",
+    "Red Flags": "Worsening symptoms, no improvement in 3 days",
+    "Follow-Up": "Review in 48-72 hours"
+}
+
+# (field, heading, css class, list field) in display order; list fields put
+# each "- " item on its own line
+SECTIONS = [
+    ("Diagnosis", "🔍 Diagnosis:", "rec-section", False),
+    ("Medicine", "💊 Medication:", "rec-section", True),
+    ("Alternative", "🔄 Alternative Medication:", "rec-section", True),
+    ("Lifestyle", "🏃 Lifestyle Recommendations:", "rec-section", False),
+    ("Red Flags", "⚠️ Red Flags / Warning Signs:", "rec-section warning", False),
+    ("Follow-Up", "📅 Follow-Up:", "rec-section", False),
+]
+
+# Unindented and without blank lines, so markdown keeps the whole card as
+# one HTML block
+SECTION_HTML = '<div class="{css}">\n<strong>{heading}</strong><br/>\n{body}\n</div>'
+NOTES_HTML = '\n<div class="rec-section">\n<strong>📝 Notes:</strong><br/>\n<em>{notes}</em>\n</div>'
+DIFFERENTIAL_HTML = '\n<div class="rec-section">\n<strong>🧭 Differential Diagnosis:</strong><br/>\n{rows}\n</div>'
+DIFFERENTIAL_ROW = '{diagnosis} · {probability:.0%}'
+CARD_HEADING = "### 📋 Medical Recommendation\n\n"
+
+# Model versions whose catalogs are kept; older ones are rebuilt if served again
+CATALOG_VERSIONS = 4
+
+TreatmentRecord = namedtuple('TreatmentRecord', 'category fields card')
+
+
+def render_card(fields):
+    """Heading and rec-section HTML of every displayed field, as one fragment"""
+    sections = []
+    for field, heading, css, is_list in SECTIONS:
+        body = fields.get(field, 'N/A')
+        if is_list:
+            body = body.replace('- ', '<br/>- ')
+        sections.append(SECTION_HTML.format(css=css, heading=heading, body=body))
+    return CARD_HEADING + '\n'.join(sections)
+
+
+def card_markdown(rec):
+    """The recommendation's card with its differential and notes, for a single st.markdown call"""
+    card = rec['card']
+    differential = rec.get('differential') or ()
+    # A lone entry would only repeat the diagnosis
+    if len(differential) > 1:
+        card += DIFFERENTIAL_HTML.format(rows='<br/>\n'.join(
+            DIFFERENTIAL_ROW.format(diagnosis=DIAGNOSES.get(label, label), probability=probability)
+            for label, probability in differential))
+    return card + NOTES_HTML.format(notes=rec.get('Notes', 'N/A'))
+
+
+def make_record(category, fields):
+    return TreatmentRecord(category, MappingProxyType(dict(fields)), render_card(fields))
+
+
+def model_record(label, treatment):
+    """Record for a model label and its treatment_db entry"""
+    fields = {"Diagnosis": DIAGNOSES.get(label, UNKNOWN_DIAGNOSIS)}
+    for field, default in TREATMENT_DEFAULTS.items():
+        fields[field] = treatment.get(field, default)
+    return make_record(label, fields)
+
+
+class TreatmentCatalog:
+    """Records for the model labels of one treatment_db"""
+
+    def __init__(self, treatment_db=None):
+        treatment_db = treatment_db or {}
+        self.general = treatment_db.get('general', {})
+        self._records = {label: model_record(label, treatment) for label, treatment in treatment_db.items()}
+
+    def lookup(self, label, treatment=None):
+        """The label's record; a label missing from treatment_db gets treatment,
+        else the general entry (compiled on first use, then kept)"""
+        record = self._records.get(label)
+        if record is None:
+            record = model_record(label, self.general if treatment is None else treatment)
+            self._records[label] = record
+        return record
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def catalog_for(model_version, treatment_db=None):
+    """The catalog of a served model version, compiled on its first request.
+
+    Without treatment_db (the inference service sends one treatment per
+    answer) the catalog starts empty and lookup() fills it label by label.
+    """
+    catalog = _catalogs.get(model_version)
+    if catalog is not None:
+        return catalog
+    with _catalogs_lock:
+        catalog = _catalogs.get(model_version)
+        if catalog is None:
+            catalog = TreatmentCatalog(treatment_db)
+            _catalogs[model_version] = catalog
+            while len(_catalogs) > CATALOG_VERSIONS:
+                del _catalogs[next(iter(_catalogs))]
+        return catalog
+
+
+# Rule-based categories: their notes and ml fields never change, so the
+# whole recommendation is static
+FALLBACK_CATALOG = {key: make_record(key, {**FALLBACK_DEFAULT, **fields}) for key, _, fields in FALLBACK_RULES}
+FALLBACK_RECORD = make_record(None, FALLBACK_DEFAULT)
+
+
+def model_recommendation(record, prediction, confidence, model_version, differential=()):
+    """Recommendation for a model prediction from its catalog record
+
+    differential is ((label, probability), ...) from med4me_inference.differential.
+    """
+    rec = dict(record.fields)
+    rec["Notes"] = (f"ML Model Prediction: {prediction} (Confidence: {confidence*100:.1f}%). "
+                    "This is an AI-assisted recommendation.")
+    rec["ml_prediction"] = prediction
+    rec["ml_confidence"] = confidence
+    rec["model_version"] = model_version
+    rec["differential"] = tuple(differential)
+    rec["card"] = record.card
+    return rec
+
+
+def fallback_recommendation(symptoms, age, gender, genetic_history=None):
+    """Rule-based fallback recommendation"""
+    categories = match_categories(symptoms)
+    record = FALLBACK_CATALOG[categories[0]] if categories else FALLBACK_RECORD
+    rec = dict(record.fields)
+    rec["card"] = record.card
+    return rec
@@ -0,0 +1,721 @@
+import re
+import functools
+import sqlite3
+import threading
+import time
+import queue
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+
+from med4me_metrics import METRICS, timed, timer
+
+# Database setup
+basedir = Path(__file__).parent
+DB_PATH = basedir / 'med4me.db'
+
+# Connection tuning
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16384
+MMAP_SIZE = 256 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 128
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports every execute and fetch to METRICS"""
+
+    def execute(self, sql, parameters=()):
+        self.sql = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            METRICS.observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.sql = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            METRICS.observe_query(sql, time.perf_counter() - start)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            METRICS.observe_query(getattr(self, 'sql', ''), time.perf_counter() - start, 'fetch')
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors, including implicit ones, are TimedCursors"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(db_path=None):
+    """Open a tuned SQLite connection"""
+    # isolation_level=None leaves transaction control to ConnectionPool.transaction,
+    # so writers take the lock up front with BEGIN IMMEDIATE instead of upgrading
+    # a read lock mid-transaction (which fails with SQLITE_BUSY under WAL).
+    conn = sqlite3.connect(
+        db_path or DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=TimedConnection if METRICS.enabled else sqlite3.Connection,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Pool of long-lived SQLite connections shared across Streamlit sessions.
+
+    A thread holds at most one connection at a time: nested ``connection()``
+    calls on the same thread reuse it, so helpers can call each other without
+    opening a second connection. Connections are handed back to an idle stack
+    when the outermost block exits, and each keeps its own prepared-statement
+    cache, so the module-level SQL constants below are compiled once per
+    connection rather than once per call.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.db_path)
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run a block in a single write transaction, committing on success"""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn.cursor()
+                return
+
+            # Under WAL only writers wait for each other, and they all wait here
+            with timer('db.lock_wait'):
+                conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool for DB_PATH"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def set_db_path(path):
+    """Point the module at another database file (benchmarks, tooling)"""
+    global DB_PATH, _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        DB_PATH = Path(path)
+        _pool = None
+
+
+class DataVersions:
+    """Per-doctor counters of committed writes, for caches of that doctor's reads.
+
+    Bumped after every commit that changes what the doctor's reads return
+    (save_visit, VisitWriter batches, add_doctor_patient_mapping), so a result
+    cached at an older version is known to be stale. Only writes made by this
+    process are counted.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, doctor_id):
+        return self._versions.get(doctor_id, 0)
+
+    def bump(self, doctor_id):
+        with self._lock:
+            self._versions[doctor_id] = self._versions.get(doctor_id, 0) + 1
+
+
+DATA_VERSIONS = DataVersions()
+
+
+# Password hashing functions
+def hash_password(password):
+    """Hash a password using SHA-256"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def verify_password(password, hashed):
+    """Verify a password against its hash"""
+    return hash_password(password) == hashed
+
+
+# SQL statements (kept as constants so the per-connection statement cache hits)
+SELECT_USER = "SELECT id, password_hash FROM user WHERE username = ?"
+
+INSERT_USER = "INSERT INTO user (username, password_hash) VALUES (?, ?)"
+
+SELECT_DOCTOR_PATIENTS = """
+    SELECT dp.patient_id, dp.created_at,
+           COALESCE(ps.visit_count, 0) as visit_count,
+           ps.last_visit,
+           ps.last_symptoms
+    FROM doctor_patient dp
+    LEFT JOIN patient_summary ps
+           ON ps.doctor_id = dp.doctor_id AND ps.patient_id = dp.patient_id
+    WHERE dp.doctor_id = ?
+    ORDER BY dp.created_at DESC, dp.id DESC
+"""
+
+# Keyset-paginated sidebar pages. Listings and symptom searches run newest
+# first with the (created_at, id) of the previous page's last row as cursor; a
+# patient-ID search walks the UNIQUE(doctor_id, patient_id) index as a prefix
+# range in ID order, with the last patient_id as cursor.
+PATIENT_PAGE_COLUMNS = """
+    SELECT dp.patient_id, dp.created_at,
+           COALESCE(ps.visit_count, 0) as visit_count,
+           ps.last_visit,
+           ps.last_symptoms,
+           dp.id
+    FROM doctor_patient dp
+    LEFT JOIN patient_summary ps
+           ON ps.doctor_id = dp.doctor_id AND ps.patient_id = dp.patient_id
+"""
+
+SELECT_PATIENT_PAGE = PATIENT_PAGE_COLUMNS + """
+    WHERE dp.doctor_id = ? AND (dp.created_at, dp.id) < (?, ?)
+    ORDER BY dp.created_at DESC, dp.id DESC
+    LIMIT ?
+"""
+
+SELECT_PATIENT_PAGE_BY_ID = PATIENT_PAGE_COLUMNS + """
+    WHERE dp.doctor_id = ? AND dp.patient_id >= ? AND dp.patient_id < ?
+      AND dp.patient_id > ?
+    ORDER BY dp.patient_id
+    LIMIT ?
+"""
+
+SELECT_PATIENT_PAGE_BY_SYMPTOMS = """
+    WITH hits AS (
+        SELECT DISTINCT v.patient_id
+        FROM visit_fts f CROSS JOIN visit v ON v.id = f.rowid
+        WHERE visit_fts MATCH ? AND v.doctor_id = ?
+    )
+""" + PATIENT_PAGE_COLUMNS + """
+    JOIN hits h ON h.patient_id = dp.patient_id
+    WHERE dp.doctor_id = ? AND (dp.created_at, dp.id) < (?, ?)
+    ORDER BY dp.created_at DESC, dp.id DESC
+    LIMIT ?
+"""
+
+SELECT_PATIENT_PAGE_BY_SYMPTOMS_SCAN = PATIENT_PAGE_COLUMNS + """
+    WHERE dp.doctor_id = ? AND (dp.created_at, dp.id) < (?, ?)
+      AND EXISTS (SELECT 1 FROM visit v
+                  WHERE v.doctor_id = dp.doctor_id AND v.patient_id = dp.patient_id
+                    AND v.symptoms LIKE ? ESCAPE '\\')
+    ORDER BY dp.created_at DESC, dp.id DESC
+    LIMIT ?
+"""
+
+SELECT_PATIENT_HISTORY = """
+    SELECT v.*, u.username
+    FROM visit v
+    LEFT JOIN user u ON v.doctor_id = u.id
+    WHERE v.patient_id = ? AND v.doctor_id = ?
+    ORDER BY v.date ASC
+"""
+
+# Lazy history view: a keyset-paginated timeline of (id, date, diagnosis),
+# newest first with the (date, id) of the previous page's last row as cursor,
+# both served by idx_visit_doctor_patient_date; the latest visit's
+# demographics for the consultation pre-fill; one visit's full text by id.
+SELECT_VISIT_TIMELINE = """
+    SELECT id, date, diagnosis
+    FROM visit
+    WHERE doctor_id = ? AND patient_id = ? AND (date, id) < (?, ?)
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+"""
+
+SELECT_LAST_VISIT = """
+    SELECT id, date, age, gender, genetic_history
+    FROM visit
+    WHERE doctor_id = ? AND patient_id = ?
+    ORDER BY date DESC, id DESC
+    LIMIT 1
+"""
+
+SELECT_VISIT = """
+    SELECT id, date, symptoms, diagnosis, medicine, lifestyle, follow_up,
+           ml_prediction, ml_confidence, model_version
+    FROM visit
+    WHERE id = ? AND doctor_id = ?
+"""
+
+INSERT_MAPPING = "INSERT OR IGNORE INTO doctor_patient (doctor_id, patient_id) VALUES (?, ?)"
+
+INSERT_VISIT = """
+    INSERT INTO visit (patient_id, doctor_id, symptoms, age, gender, genetic_history,
+                      medicine, diagnosis, lifestyle, follow_up, ml_prediction, ml_confidence,
+                      model_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Feature store rows (see med4me_features): one sparse row per visit and
+# vectorizer version, written in the visit's own transaction
+INSERT_FEATURE_SET = """
+    INSERT OR IGNORE INTO feature_set (vectorizer_version, n_features) VALUES (?, ?)
+"""
+
+INSERT_VISIT_FEATURES = """
+    INSERT OR REPLACE INTO visit_features (vectorizer_version, visit_id, indices, data)
+    VALUES (?, ?, ?, ?)
+"""
+
+INSERT_VISIT_DIFFERENTIAL = """
+    INSERT INTO visit_differential (visit_id, rank, label, probability) VALUES (?, ?, ?, ?)
+"""
+
+# The new visit is normally the latest one, but compare dates so a backdated
+# insert cannot overwrite a newer summary.
+UPSERT_PATIENT_SUMMARY = """
+    INSERT INTO patient_summary (doctor_id, patient_id, visit_count, last_visit, last_symptoms)
+    SELECT doctor_id, patient_id, 1, date, symptoms FROM visit WHERE id = ?
+    ON CONFLICT (doctor_id, patient_id) DO UPDATE SET
+        visit_count = visit_count + 1,
+        last_visit = CASE WHEN last_visit IS NULL OR excluded.last_visit >= last_visit
+                          THEN excluded.last_visit ELSE last_visit END,
+        last_symptoms = CASE WHEN last_visit IS NULL OR excluded.last_visit >= last_visit
+                             THEN excluded.last_symptoms ELSE last_symptoms END
+"""
+
+
+# Schema migrations
+# Each entry upgrades the schema by one step; PRAGMA user_version records how
+# many have been applied. Append new steps, never edit or reorder old ones.
+def rebuild_patient_summary(cur):
+    """Recompute patient_summary from the visit table"""
+    cur.execute("DELETE FROM patient_summary")
+    cur.execute("""
+        INSERT INTO patient_summary (doctor_id, patient_id, visit_count, last_visit, last_symptoms)
+        SELECT doctor_id, patient_id, visit_count, date, symptoms
+        FROM (
+            SELECT doctor_id, patient_id, date, symptoms,
+                   COUNT(*) OVER (PARTITION BY doctor_id, patient_id) as visit_count,
+                   ROW_NUMBER() OVER (PARTITION BY doctor_id, patient_id
+                                      ORDER BY date DESC, id DESC) as rn
+            FROM visit
+            WHERE doctor_id IS NOT NULL
+        )
+        WHERE rn = 1
+    """)
+
+def _migration_1_sidebar_indexes(cur):
+    # Covering index for per-patient visit lookups ordered by date
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_visit_doctor_patient_date
+                   ON visit (doctor_id, patient_id, date)""")
+    # Sidebar ordering
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_doctor_patient_doctor_created
+                   ON doctor_patient (doctor_id, created_at)""")
+    # Denormalized per-patient summary maintained by save_visit
+    cur.execute("""CREATE TABLE IF NOT EXISTS patient_summary (
+        doctor_id INTEGER NOT NULL,
+        patient_id TEXT NOT NULL,
+        visit_count INTEGER NOT NULL DEFAULT 0,
+        last_visit TIMESTAMP,
+        last_symptoms TEXT,
+        PRIMARY KEY (doctor_id, patient_id)
+    ) WITHOUT ROWID""")
+    rebuild_patient_summary(cur)
+
+@functools.lru_cache(maxsize=None)
+def fts5_available():
+    """True if this process's SQLite has FTS5"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE probe USING fts5(text)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+def build_symptom_search(cur):
+    """Create and fill visit_fts and the triggers that keep it current"""
+    cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS visit_fts
+                   USING fts5(symptoms, content='visit', content_rowid='id')""")
+    cur.execute("INSERT INTO visit_fts (visit_fts) VALUES ('rebuild')")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS visit_fts_insert AFTER INSERT ON visit BEGIN
+        INSERT INTO visit_fts (rowid, symptoms) VALUES (new.id, new.symptoms);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS visit_fts_delete AFTER DELETE ON visit BEGIN
+        INSERT INTO visit_fts (visit_fts, rowid, symptoms) VALUES ('delete', old.id, old.symptoms);
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS visit_fts_update AFTER UPDATE OF symptoms ON visit BEGIN
+        INSERT INTO visit_fts (visit_fts, rowid, symptoms) VALUES ('delete', old.id, old.symptoms);
+        INSERT INTO visit_fts (rowid, symptoms) VALUES (new.id, new.symptoms);
+    END""")
+
+def _migration_2_symptom_search(cur):
+    # Full-text index over visit symptoms for the sidebar search. Builds of
+    # SQLite without FTS5 skip it and search falls back to a LIKE scan; once
+    # FTS5 is there, init_db builds it (see schema_ready).
+    if fts5_available():
+        build_symptom_search(cur)
+
+def _migration_3_visit_model_version(cur):
+    # Registry version (or bundled model checksum) that scored the visit;
+    # NULL for fallback-rule recommendations and visits saved before this
+    cur.execute("ALTER TABLE visit ADD COLUMN model_version TEXT")
+
+def _migration_4_feature_store(cur):
+    # Vectorizer versions known to the feature store and their row width
+    cur.execute("""CREATE TABLE IF NOT EXISTS feature_set (
+        vectorizer_version TEXT PRIMARY KEY,
+        n_features INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""")
+    # One CSR row per visit: int32 column indices and float32 values as blobs
+    cur.execute("""CREATE TABLE IF NOT EXISTS visit_features (
+        vectorizer_version TEXT NOT NULL,
+        visit_id INTEGER NOT NULL,
+        indices BLOB NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (vectorizer_version, visit_id)
+    ) WITHOUT ROWID""")
+
+def _migration_5_visit_differential(cur):
+    # The model's likeliest categories for a visit, rank 0 being ml_prediction;
+    # no rows for fallback-rule recommendations and visits saved before this
+    cur.execute("""CREATE TABLE IF NOT EXISTS visit_differential (
+        visit_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        label TEXT NOT NULL,
+        probability REAL NOT NULL,
+        PRIMARY KEY (visit_id, rank)
+    ) WITHOUT ROWID""")
+
+MIGRATIONS = [
+    _migration_1_sidebar_indexes,
+    _migration_2_symptom_search,
+    _migration_3_visit_model_version,
+    _migration_4_feature_store,
+    _migration_5_visit_differential,
+]
+
+def migrate(cur):
+    """Apply pending schema migrations"""
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(cur)
+        cur.execute(f"PRAGMA user_version = {number}")
+
+
+def schema_ready(conn):
+    """True if every migration is applied, the symptom index exists where
+    SQLite supports it, and the admin account exists"""
+    if conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+        return False
+    if fts5_available() and not _has_table(conn, 'visit_fts'):
+        return False
+    return conn.execute(SELECT_USER, ('admin',)).fetchone() is not None
+
+
+# Database functions
+def init_db():
+    """Initialize database tables"""
+    # The app calls this on every rerun: only take the write lock when there
+    # is something to create, so reruns never queue behind visit commits
+    with get_pool().connection() as conn:
+        if schema_ready(conn):
+            return
+    with get_pool().transaction() as cur:
+        # Users table
+        cur.execute('''CREATE TABLE IF NOT EXISTS user (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+
+        # Doctor-Patient mapping
+        cur.execute('''CREATE TABLE IF NOT EXISTS doctor_patient (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doctor_id INTEGER NOT NULL,
+            patient_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(doctor_id, patient_id),
+            FOREIGN KEY (doctor_id) REFERENCES user(id)
+        )''')
+
+        # Visits table
+        cur.execute('''CREATE TABLE IF NOT EXISTS visit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT NOT NULL,
+            doctor_id INTEGER,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            symptoms TEXT,
+            age TEXT,
+            gender TEXT,
+            genetic_history TEXT,
+            medicine TEXT,
+            diagnosis TEXT,
+            lifestyle TEXT,
+            follow_up TEXT,
+            ml_prediction TEXT,
+            ml_confidence REAL,
+            FOREIGN KEY (doctor_id) REFERENCES user(id)
+        )''')
+
+        migrate(cur)
+        # Migration 2 ran on an SQLite without FTS5 that has since gained it
+        if fts5_available() and not _has_table(cur, 'visit_fts'):
+            build_symptom_search(cur)
+
+        # Create default admin user
+        cur.execute(SELECT_USER, ('admin',))
+        if not cur.fetchone():
+            cur.execute(INSERT_USER, ('admin', hash_password('admin123')))
+
+# Authentication functions
+@timed('db.authenticate_user')
+def authenticate_user(username, password):
+    """Authenticate user credentials"""
+    with get_pool().connection() as conn:
+        result = conn.execute(SELECT_USER, (username,)).fetchone()
+
+    if result and verify_password(password, result[1]):
+        return result[0]
+    return None
+
+@timed('db.register_user')
+def register_user(username, password):
+    """Register new user"""
+    try:
+        with get_pool().transaction() as cur:
+            cur.execute(INSERT_USER, (username, hash_password(password)))
+            return cur.lastrowid, None
+    except sqlite3.IntegrityError:
+        return None, "Username already exists"
+    except Exception as e:
+        return None, str(e)
+
+# Patient management functions
+@timed('db.get_doctor_patients')
+def get_doctor_patients(doctor_id):
+    """Get all patients for a doctor"""
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_DOCTOR_PATIENTS, (doctor_id,)).fetchall()
+
+PAGE_SIZE = 25
+
+# Sorts after every real cursor value: TEXT timestamps compare below a BLOB
+FIRST_PAGE = (b'', 0)
+
+@timed('db.get_doctor_patients_page')
+def get_doctor_patients_page(doctor_id, after=None, search=None, limit=PAGE_SIZE):
+    """Get one page of a doctor's patients, optionally filtered by a search.
+
+    A search that looks like a patient ID (``P12``, ``p12``, ``12``) matches
+    IDs by prefix; anything else matches words in any visit's symptoms.
+    Returns ``(patients, next_cursor)``; pass ``next_cursor`` back as ``after``
+    with the same search to load the next page. ``next_cursor`` is None on the
+    last page.
+    """
+    search = (search or "").strip()
+
+    if re.match(r'^[Pp]?\d+$', search):
+        prefix = 'P' + search.lstrip('Pp')
+        last_patient_id = after[0] if after else ''
+        with get_pool().connection() as conn:
+            rows = conn.execute(SELECT_PATIENT_PAGE_BY_ID,
+                                (doctor_id, prefix, prefix + '\U0010ffff', last_patient_id,
+                                 limit + 1)).fetchall()
+        if len(rows) > limit:
+            return [row[:5] for row in rows[:limit]], (rows[limit - 1][0],)
+        return [row[:5] for row in rows], None
+
+    created_at, last_id = after or FIRST_PAGE
+    with get_pool().connection() as conn:
+        if not search:
+            rows = conn.execute(SELECT_PATIENT_PAGE,
+                                (doctor_id, created_at, last_id, limit + 1)).fetchall()
+        elif _has_table(conn, 'visit_fts'):
+            terms = ' '.join(f'"{word}"*' for word in re.findall(r'\w+', search))
+            if not terms:
+                return [], None
+            rows = conn.execute(SELECT_PATIENT_PAGE_BY_SYMPTOMS,
+                                (terms, doctor_id, doctor_id, created_at, last_id,
+                                 limit + 1)).fetchall()
+        else:
+            # A typed % or _ is a literal character, not a wildcard
+            pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            rows = conn.execute(SELECT_PATIENT_PAGE_BY_SYMPTOMS_SCAN,
+                                (doctor_id, created_at, last_id, f'%{pattern}%',
+                                 limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][1], rows[-1][5])
+    return [row[:5] for row in rows], next_cursor
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+@timed('db.get_patient_history')
+def get_patient_history(patient_id, doctor_id):
+    """Get patient visit history"""
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_PATIENT_HISTORY, (patient_id, doctor_id)).fetchall()
+
+TIMELINE_PAGE_SIZE = 20
+
+@timed('db.get_visit_timeline')
+def get_visit_timeline(patient_id, doctor_id, after=None, limit=TIMELINE_PAGE_SIZE):
+    """Get one page of a patient's visits as (id, date, diagnosis), newest first.
+
+    Returns ``(visits, next_cursor)``; pass ``next_cursor`` back as ``after``
+    to load older visits. ``next_cursor`` is None on the last page.
+    """
+    date, last_id = after or FIRST_PAGE
+    with get_pool().connection() as conn:
+        rows = conn.execute(SELECT_VISIT_TIMELINE,
+                            (doctor_id, patient_id, date, last_id, limit + 1)).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][1], rows[-1][0])
+    return rows, None
+
+@timed('db.get_last_visit')
+def get_last_visit(patient_id, doctor_id):
+    """Get (id, date, age, gender, genetic_history) of the latest visit, or None"""
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_LAST_VISIT, (doctor_id, patient_id)).fetchone()
+
+@timed('db.get_visit')
+def get_visit(visit_id, doctor_id):
+    """Get one of the doctor's visits in full, or None"""
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_VISIT, (visit_id, doctor_id)).fetchone()
+
+@timed('db.add_doctor_patient_mapping')
+def add_doctor_patient_mapping(doctor_id, patient_id):
+    """Add doctor-patient mapping"""
+    try:
+        with get_pool().transaction() as cur:
+            cur.execute(INSERT_MAPPING, (doctor_id, patient_id))
+    except sqlite3.Error:
+        return
+    DATA_VERSIONS.bump(doctor_id)
+
+def insert_visit(cur, patient_id, doctor_id, data, recommendation, features=None):
+    """Write mapping, visit and summary row on cur; returns the visit id
+
+    features, if given, is (vectorizer_version, n_features, indices, data)
+    from med4me_features.encode_row and is stored with the visit, as is the
+    recommendation's differential, if it has one.
+    """
+    cur.execute(INSERT_MAPPING, (doctor_id, patient_id))
+    cur.execute(INSERT_VISIT, (
+        patient_id, doctor_id, data.get('symptoms'), data.get('age'), data.get('gender'),
+        data.get('genetic_history'), recommendation.get('Medicine'), recommendation.get('Diagnosis'),
+        recommendation.get('Lifestyle'), recommendation.get('Follow-Up'),
+        recommendation.get('ml_prediction'), recommendation.get('ml_confidence'),
+        recommendation.get('model_version')
+    ))
+    visit_id = cur.lastrowid
+    cur.execute(UPSERT_PATIENT_SUMMARY, (visit_id,))
+    if features is not None:
+        vectorizer_version, n_features, indices, values = features
+        cur.execute(INSERT_FEATURE_SET, (vectorizer_version, n_features))
+        cur.execute(INSERT_VISIT_FEATURES, (vectorizer_version, visit_id, indices, values))
+    differential = recommendation.get('differential')
+    if differential:
+        cur.executemany(INSERT_VISIT_DIFFERENTIAL, [
+            (visit_id, rank, label, probability) for rank, (label, probability) in enumerate(differential)
+        ])
+    return visit_id
+
+@timed('db.save_visit')
+def save_visit(patient_id, doctor_id, data, recommendation, features=None):
+    """Save visit to database"""
+    # Mapping, visit, summary and feature row share one connection and one commit
+    with get_pool().transaction() as cur:
+        visit_id = insert_visit(cur, patient_id, doctor_id, data, recommendation, features)
+    DATA_VERSIONS.bump(doctor_id)
+    return visit_id
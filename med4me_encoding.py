@@ -0,0 +1,26 @@
+from bisect import bisect_left
+
+DEFAULT_AGE = 30
+
+# Age bands used by train.py (pd.cut bins: right-inclusive, 0 < age <= 100)
+AGE_BINS = [0, 18, 35, 50, 65, 100]
+AGE_BAND_LABELS = ['child', 'young_adult', 'middle_age', 'senior', 'elderly']
+
+
+# Feature encoding shared by train.py, the app and the compact runtime.
+# Standard library only, so importing it does not pull in numpy.
+def encode_age(age):
+    """Numeric age, defaulting when the input is missing or not a number"""
+    return int(age) if str(age).isdigit() else DEFAULT_AGE
+
+def age_band(age):
+    """Band label for an age, matching pd.cut(bins=AGE_BINS); None outside the bins"""
+    age = encode_age(age)
+    index = bisect_left(AGE_BINS, age)
+    if 0 < index < len(AGE_BINS):
+        return AGE_BAND_LABELS[index - 1]
+    return None
+
+def encode_gender(gender):
+    """0 for male, 1 otherwise"""
+    return 0 if str(gender).lower() in ['male', 'm'] else 1
@@ -0,0 +1,223 @@
+"""Streaming export of the visit table.
+
+Visits are read with a single SELECT on a dedicated connection and pulled
+EXPORT_BATCH rows at a time with fetchmany, so memory stays flat however
+many rows match, and the export is one consistent snapshot even while
+visits keep arriving (WAL readers see the database as of their first read).
+Each batch is encoded and handed on as bytes: CSV, JSON lines, or Parquet
+(one row group per batch, if pyarrow is installed).
+
+Scopes are one doctor, a date range, both, or everything. A doctor's visits
+come out in (patient, date) order straight from the
+idx_visit_doctor_patient_date index; everything else in visit id order, a
+plain rowid scan. Neither needs a sort.
+
+The app's sidebar offers the same exports, capped at UI_MAX_ROWS visits:
+Streamlit holds a download in memory in full, so exports of any size go
+through this command line instead.
+
+    python med4me_export.py [--doctor NAME] [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+                            [--format csv|jsonl|parquet] [--out FILE] [--db PATH]
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+
+from med4me_db import connect, get_pool
+
+EXPORT_BATCH = 5000
+UI_MAX_ROWS = 100000
+
+COLUMNS = (
+    'id', 'patient_id', 'doctor_id', 'doctor', 'date', 'symptoms', 'age', 'gender',
+    'genetic_history', 'medicine', 'diagnosis', 'lifestyle', 'follow_up',
+    'ml_prediction', 'ml_confidence', 'model_version',
+)
+
+SELECT_EXPORT = """
+    SELECT v.id, v.patient_id, v.doctor_id, u.username, v.date, v.symptoms, v.age, v.gender,
+           v.genetic_history, v.medicine, v.diagnosis, v.lifestyle, v.follow_up,
+           v.ml_prediction, v.ml_confidence, v.model_version
+    FROM visit v
+    LEFT JOIN user u ON u.id = v.doctor_id
+"""
+
+SELECT_DOCTOR_ID = "SELECT id FROM user WHERE username = ?"
+
+
+def export_query(doctor_id=None, since=None, until=None):
+    """SQL and parameters for a scope; since/until are inclusive dates"""
+    where, params = [], []
+    if doctor_id is not None:
+        where.append("v.doctor_id = ?")
+        params.append(doctor_id)
+    if since:
+        where.append("v.date >= ?")
+        params.append(str(since))
+    if until:
+        where.append("v.date < date(?, '+1 day')")
+        params.append(str(until))
+    sql = SELECT_EXPORT
+    if where:
+        sql += "    WHERE " + " AND ".join(where) + "\n"
+    if doctor_id is not None:
+        sql += "    ORDER BY v.doctor_id, v.patient_id, v.date\n"
+    else:
+        sql += "    ORDER BY v.id\n"
+    return sql, params
+
+
+def iter_batches(doctor_id=None, since=None, until=None, batch=EXPORT_BATCH, limit=None, db_path=None):
+    """Yield lists of visit rows (COLUMNS order) for a scope"""
+    sql, params = export_query(doctor_id, since, until)
+    if limit is not None:
+        sql += "    LIMIT ?\n"
+        params.append(limit)
+    # Own connection: a long export must not hold one of the pool's
+    conn = connect(db_path or get_pool().db_path)
+    try:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_jsonl(batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def encode_parquet(batches):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([
+        (name, pa.int64() if name in ('id', 'doctor_id') else pa.float64() if name == 'ml_confidence'
+         else pa.string())
+        for name in COLUMNS
+    ])
+    sink = _Chunks()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+FORMATS = {
+    # name: (encoder, mime type, file extension)
+    'csv': (encode_csv, 'text/csv', 'csv'),
+    'jsonl': (encode_jsonl, 'application/x-ndjson', 'jsonl'),
+    'parquet': (encode_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_export(fmt='csv', doctor_id=None, since=None, until=None, limit=None, db_path=None):
+    """Yield the encoded export as a sequence of byte chunks"""
+    encoder = FORMATS[fmt][0]
+    return encoder(iter_batches(doctor_id, since, until, limit=limit, db_path=db_path))
+
+
+def write_export(out, fmt='csv', doctor_id=None, since=None, until=None, db_path=None):
+    """Stream an export into a binary file object; returns bytes written"""
+    written = 0
+    for chunk in stream_export(fmt, doctor_id, since, until, db_path=db_path):
+        if chunk:
+            out.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def export_filename(fmt, doctor=None, since=None, until=None):
+    parts = ['med4me_visits', doctor or 'all']
+    if since or until:
+        parts.append(f"{since or 'start'}_{until or 'now'}")
+    return '_'.join(parts) + '.' + FORMATS[fmt][2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export visits as CSV, JSON lines or Parquet")
+    parser.add_argument('--doctor', help="username of the doctor whose visits to export (default: all)")
+    parser.add_argument('--since', help="first visit date, YYYY-MM-DD")
+    parser.add_argument('--until', help="last visit date, YYYY-MM-DD")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--out', help="output file (default: stdout)")
+    parser.add_argument('--db', help="database path (default: med4me.db next to the app)")
+    args = parser.parse_args()
+
+    from med4me_db import set_db_path
+    if args.db:
+        set_db_path(args.db)
+
+    doctor_id = None
+    if args.doctor:
+        with get_pool().connection() as conn:
+            row = conn.execute(SELECT_DOCTOR_ID, (args.doctor,)).fetchone()
+        if row is None:
+            parser.error(f"unknown doctor {args.doctor!r}")
+        doctor_id = row[0]
+
+    if args.out:
+        with open(args.out, 'wb') as out:
+            written = write_export(out, args.format, doctor_id, args.since, args.until)
+        print(f"✓ {written} bytes written to {args.out}", file=sys.stderr)
+    else:
+        write_export(sys.stdout.buffer, args.format, doctor_id, args.since, args.until)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""Feature store for visit symptoms.
+
+Every visit's model input row (TF-IDF symptom columns, then age and gender)
+is stored once as a sparse row, keyed by visit id and vectorizer version, so
+re-scoring, retraining and analytics jobs read precomputed rows instead of
+re-tokenizing visit.symptoms.
+
+The vectorizer version is a fingerprint of the vocabulary, idf weights and
+tokenizer settings, not the model version: retrained versions keep the
+vocabulary, so they share one set of rows.
+
+Rows live in the visit_features table, written by save_visit in the visit's
+own transaction when the app has a model loaded. backfill() fills in older
+visits in bulk. pack() writes every stored row of a version as one CSR
+matrix of plain .npy files under features/<version>/. load_matrix()
+memory-maps that matrix and appends only the rows stored since it was
+packed.
+
+    python med4me_features.py stats | backfill | pack [--db PATH]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+from med4me_db import get_pool, INSERT_FEATURE_SET, INSERT_VISIT_FEATURES
+
+basedir = Path(__file__).parent
+FEATURES_DIR = basedir / 'features'
+FEATURE_LAYOUT = 1  # TF-IDF columns, encode_age, encode_gender
+BACKFILL_BATCH = 5000
+PACK_BATCH = 50000
+ARRAYS = ('visit_ids', 'indptr', 'indices', 'data')
+
+SELECT_UNFEATURIZED = """
+    SELECT v.id, v.symptoms, v.age, v.gender FROM visit v
+    WHERE v.id > ? AND NOT EXISTS (
+        SELECT 1 FROM visit_features f WHERE f.vectorizer_version = ? AND f.visit_id = v.id
+    )
+    ORDER BY v.id
+    LIMIT ?
+"""
+
+SELECT_FEATURE_ROWS = """
+    SELECT visit_id, indices, data FROM visit_features
+    WHERE vectorizer_version = ? AND visit_id > ? AND visit_id <= ?
+    ORDER BY visit_id
+    LIMIT ?
+"""
+
+SELECT_FEATURE_COUNT_UPTO = """
+    SELECT COUNT(*) FROM visit_features WHERE vectorizer_version = ? AND visit_id <= ?
+"""
+
+SELECT_FEATURE_TOTALS = """
+    SELECT COUNT(*), COALESCE(SUM(LENGTH(indices)), 0) / 4, COALESCE(MAX(visit_id), 0)
+    FROM visit_features WHERE vectorizer_version = ?
+"""
+
+SELECT_FEATURE_SETS = """
+    SELECT s.vectorizer_version, s.n_features, s.created_at, COUNT(f.visit_id)
+    FROM feature_set s LEFT JOIN visit_features f USING (vectorizer_version)
+    GROUP BY s.vectorizer_version
+    ORDER BY s.created_at
+"""
+
+SELECT_N_FEATURES = "SELECT n_features FROM feature_set WHERE vectorizer_version = ?"
+
+
+def _vectorizer_description(vectorizer):
+    if hasattr(vectorizer, 'transform_into'):
+        # CompactVectorizer
+        terms = sorted(vectorizer.vocabulary, key=vectorizer.vocabulary.get)
+        return [terms, vectorizer.idf, [vectorizer.min_n, vectorizer.max_n], vectorizer.lowercase,
+                vectorizer.token_pattern.pattern, vectorizer.norm, vectorizer.sublinear_tf]
+    params = vectorizer.get_params()
+    return [vectorizer.get_feature_names_out().tolist(), vectorizer.idf_.tolist(), list(params['ngram_range']),
+            params['lowercase'], params['token_pattern'], params['norm'], params['sublinear_tf']]
+
+
+def vectorizer_version(engine):
+    """Fingerprint of an engine's feature rows; equal for sklearn and compact engines"""
+    # Kept on the engine rather than in a cache keyed by it, so a swapped-out
+    # engine is freed along with its fingerprint
+    version = getattr(engine, 'vectorizer_version', None)
+    if version is None:
+        description = json.dumps([FEATURE_LAYOUT] + _vectorizer_description(engine.vectorizer))
+        version = hashlib.sha256(description.encode()).hexdigest()[:16]
+        engine.vectorizer_version = version
+    return version
+
+
+def encode_rows(X):
+    """(indices, data) blobs per row of a dense or sparse feature matrix"""
+    X = X.tocsr() if sp.issparse(X) else sp.csr_matrix(X)
+    indices = X.indices.astype(np.int32)
+    data = X.data.astype(np.float32)
+    return [
+        (indices[start:end].tobytes(), data[start:end].tobytes())
+        for start, end in zip(X.indptr[:-1], X.indptr[1:])
+    ]
+
+
+def encode_row(engine, symptoms, age, gender):
+    """Feature-store entry for one visit, as insert_visit takes it"""
+    X = engine.features([(symptoms or '').lower()], [age], [gender])
+    indices, data = encode_rows(X)[0]
+    return vectorizer_version(engine), X.shape[1], indices, data
+
+
+def backfill(engine, batch=BACKFILL_BATCH, log=print):
+    """Store rows for every visit that has none for this engine's vectorizer"""
+    version = vectorizer_version(engine)
+    pool = get_pool()
+    last_id = stored = 0
+    while True:
+        with pool.connection() as conn:
+            rows = conn.execute(SELECT_UNFEATURIZED, (last_id, version, batch)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        ids, symptoms, ages, genders = zip(*rows)
+        X = engine.features([(s or '').lower() for s in symptoms], ages, genders)
+        with pool.transaction() as cur:
+            cur.execute(INSERT_FEATURE_SET, (version, X.shape[1]))
+            cur.executemany(INSERT_VISIT_FEATURES, [
+                (version, visit_id, indices, data) for visit_id, (indices, data) in zip(ids, encode_rows(X))
+            ])
+        stored += len(rows)
+        log(f"  {stored} visits featurized (through id {last_id})")
+    return version, stored
+
+
+def n_features(version):
+    with get_pool().connection() as conn:
+        row = conn.execute(SELECT_N_FEATURES, (version,)).fetchone()
+    if row is None:
+        raise ValueError(f"no feature rows for vectorizer version {version!r}")
+    return row[0]
+
+
+def stored_rows(version, after_id=0, upto_id=None, batch=PACK_BATCH, conn=None):
+    """Yield lists of (visit_id, indices, data) in visit id order
+
+    With conn, every batch is read on it (inside its transaction, if any).
+    """
+    pool = get_pool()
+    upto_id = (1 << 62) if upto_id is None else upto_id
+    while True:
+        if conn is not None:
+            rows = conn.execute(SELECT_FEATURE_ROWS, (version, after_id, upto_id, batch)).fetchall()
+        else:
+            with pool.connection() as pooled:
+                rows = pooled.execute(SELECT_FEATURE_ROWS, (version, after_id, upto_id, batch)).fetchall()
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        yield rows
+
+
+def read_matrix(version, after_id=0, upto_id=None):
+    """(visit_ids, CSR matrix) read from the table; meant for the unpacked tail"""
+    ids, indptr, indices, data = [], [0], [], []
+    for rows in stored_rows(version, after_id, upto_id):
+        for visit_id, row_indices, row_data in rows:
+            ids.append(visit_id)
+            indices.append(np.frombuffer(row_indices, dtype=np.int32))
+            data.append(np.frombuffer(row_data, dtype=np.float32))
+            indptr.append(indptr[-1] + len(indices[-1]))
+    matrix = sp.csr_matrix((
+        np.concatenate(data) if data else np.zeros(0, np.float32),
+        np.concatenate(indices) if indices else np.zeros(0, np.int32),
+        np.array(indptr, dtype=np.int64),
+    ), shape=(len(ids), n_features(version)))
+    return np.array(ids, dtype=np.int64), matrix
+
+
+def pack(version, directory=FEATURES_DIR, log=print):
+    """Write all stored rows of version as memory-mappable .npy arrays
+
+    Arrays are preallocated from the table's totals and filled chunk by
+    chunk, so memory stays bounded by PACK_BATCH rows. Totals and rows are
+    read in one read transaction, so a backfill running meanwhile cannot
+    make them disagree. The set is written under a temporary name and
+    renamed into place.
+    """
+    with get_pool().connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            return _pack(conn, version, directory, log)
+        finally:
+            conn.execute("COMMIT")
+
+
+def _pack(conn, version, directory, log):
+    count, nnz, upto_id = conn.execute(SELECT_FEATURE_TOTALS, (version,)).fetchone()
+    index_dtype = np.int32 if nnz < 2 ** 31 else np.int64
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    staging = directory / f".{version}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+    try:
+        open_array = lambda name, length, dtype: np.lib.format.open_memmap(
+            staging / f"{name}.npy", mode='w+', dtype=dtype, shape=(length,))
+        ids = open_array('visit_ids', count, np.int64)
+        indptr = open_array('indptr', count + 1, index_dtype)
+        indices = open_array('indices', nnz, index_dtype)
+        data = open_array('data', nnz, np.float32)
+        indptr[0] = row = offset = 0
+        for rows in stored_rows(version, 0, upto_id, conn=conn):
+            for visit_id, row_indices, row_data in rows:
+                width = len(row_indices) // 4
+                ids[row] = visit_id
+                indices[offset:offset + width] = np.frombuffer(row_indices, dtype=np.int32)
+                data[offset:offset + width] = np.frombuffer(row_data, dtype=np.float32)
+                row += 1
+                offset += width
+                indptr[row] = offset
+        for array in (ids, indptr, indices, data):
+            array.flush()
+        del ids, indptr, indices, data
+        with open(staging / 'meta.json', 'w') as f:
+            json.dump({'vectorizer_version': version, 'rows': count, 'nnz': nnz,
+                       'n_features': n_features(version), 'through_visit': upto_id}, f, indent=2)
+
+        target = directory / version
+        retired = directory / f".{version}.old"
+        if target.exists():
+            os.rename(target, retired)
+        os.rename(staging, target)
+        shutil.rmtree(retired, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    log(f"✓ Packed {count} rows ({nnz} non-zeros) of {version} into {directory / version}")
+    return directory / version
+
+
+def load_packed(version, directory=FEATURES_DIR, mmap=True):
+    """(visit_ids, CSR matrix, meta) of a packed set; arrays are memory-mapped"""
+    path = Path(directory) / version
+    with open(path / 'meta.json') as f:
+        meta = json.load(f)
+    ids, indptr, indices, data = (
+        np.load(path / f"{name}.npy", mmap_mode='r' if mmap else None) for name in ARRAYS
+    )
+    matrix = sp.csr_matrix((data, indices, indptr), shape=(meta['rows'], meta['n_features']), copy=False)
+    return ids, matrix, meta
+
+
+def load_matrix(version, directory=FEATURES_DIR, mmap=True):
+    """(visit_ids, CSR matrix) of every stored row of version
+
+    The packed set is used as is (memory-mapped) when it is up to date;
+    rows stored since it was packed are read from the table and stacked on.
+    Those are the rows past its through_visit and, if the table now has more
+    rows up to through_visit than were packed (a backfill of older visits
+    since), the ones the pack lacks; pack again to fold them in.
+    """
+    if not (Path(directory) / version / 'meta.json').exists():
+        return read_matrix(version)
+    ids, matrix, meta = load_packed(version, directory, mmap)
+    parts_ids, parts = [], []
+    with get_pool().connection() as conn:
+        stored = conn.execute(SELECT_FEATURE_COUNT_UPTO, (version, meta['through_visit'])).fetchone()[0]
+    if stored != meta['rows']:
+        late_ids, late = read_matrix(version, upto_id=meta['through_visit'])
+        missing = ~np.isin(late_ids, ids)
+        parts_ids.append(late_ids[missing])
+        parts.append(late[missing])
+    tail_ids, tail = read_matrix(version, after_id=meta['through_visit'])
+    parts_ids.append(tail_ids)
+    parts.append(tail)
+    if not sum(len(part) for part in parts_ids):
+        return ids, matrix
+    return np.concatenate([ids] + parts_ids), sp.vstack([matrix] + parts, format='csr')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the visit feature store")
+    parser.add_argument('command', choices=['stats', 'backfill', 'pack'])
+    parser.add_argument('--db', help="database path (default: med4me.db next to the app)")
+    parser.add_argument('--version', help="vectorizer version to pack (default: the served model's)")
+    args = parser.parse_args()
+
+    from med4me_db import init_db, set_db_path
+    if args.db:
+        set_db_path(args.db)
+    init_db()
+
+    if args.command == 'stats':
+        with get_pool().connection() as conn:
+            for version, width, created_at, rows in conn.execute(SELECT_FEATURE_SETS):
+                packed = Path(FEATURES_DIR / version / 'meta.json').exists()
+                print(f"{version}  {width:5d} features  {rows:8d} rows  "
+                      f"{'packed' if packed else 'unpacked'}  since {created_at}")
+        return
+
+    version = args.version
+    if args.command == 'backfill' or version is None:
+        from med4me_registry import ActiveModel
+        engine = ActiveModel().get().engine
+        if args.command == 'backfill':
+            version, stored = backfill(engine)
+            print(f"✓ {stored} visits featurized for vectorizer {version}")
+            return
+        version = vectorizer_version(engine)
+    pack(version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Vectorized random forest evaluation.
+
+The fitted trees are flattened into one set of node arrays (feature,
+threshold, left, right, class probabilities) with global node ids. A batch
+is evaluated by depth-stepping: every (row, tree) pair holds its current
+node, and each step moves all of them one level down with a handful of
+array operations. Leaves point at themselves, so pairs that reach a leaf
+early just stay put until the deepest tree is done. Wide CSR batches are
+read in place: each step looks the pairs' feature values up among the
+batch's stored entries, so no dense copy of the features is made.
+
+Results match RandomForestClassifier.predict_proba bit for bit: rows are
+compared as float32 against the float64 thresholds, exactly as sklearn's
+trees do, and tree probabilities are summed in estimator order before the
+final division.
+"""
+import numpy as np
+
+TREE_LEAF = -1
+CHUNK_ROWS = 256
+# CSR batches at least this wide are read in place; narrower ones are
+# cheaper to densify per block than to search (bench_forest.py --sparse)
+SPARSE_MIN_FEATURES = 16384
+
+
+def forest_arrays(model):
+    """Flat node arrays for a fitted RandomForestClassifier"""
+    import sklearn
+
+    # sklearn < 1.4 stores class counts in tree_.value and normalizes them in
+    # predict_proba; later versions store the fractions directly
+    normalize = tuple(int(part) for part in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+    features, thresholds, lefts, rights, probas, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        proba = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+        if normalize:
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        inner = left != TREE_LEAF
+        left[inner] += offset
+        right[inner] += offset
+
+        roots.append(offset)
+        features.append(tree.feature.astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(left)
+        rights.append(right)
+        probas.append(proba)
+        offset += tree.node_count
+
+    return {
+        'roots': np.array(roots, dtype=np.int32),
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts),
+        'right': np.concatenate(rights),
+        'proba': np.concatenate(probas),
+    }
+
+
+def _sparse_lookup(X):
+    """Value lookup by flat index (row * n_features + feature) into a CSR
+    batch, read from its stored entries without a dense copy"""
+    if not X.has_canonical_format:
+        X = X.copy()
+        X.sum_duplicates()
+    n_features = X.shape[1]
+    # Rows in order and sorted columns within each row: the keys are sorted
+    keys = np.repeat(np.arange(X.shape[0], dtype=np.intp) * n_features, np.diff(X.indptr)) + X.indices
+    if not len(keys):
+        return lambda flat: np.zeros(len(flat), dtype=np.float32)
+    data = np.append(X.data.astype(np.float32), np.float32(0))
+
+    def lookup(flat):
+        pos = np.searchsorted(keys, flat)
+        # Features a row does not store are zero
+        pos[keys.take(pos, mode='clip') != flat] = len(keys)
+        return data.take(pos)
+
+    return lookup
+
+
+class CompactForest:
+    """Random forest evaluator over flattened node arrays"""
+
+    def __init__(self, roots, feature, threshold, left, right, proba):
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.proba = np.asarray(proba, dtype=np.float64)
+
+        # Leaves loop back to themselves so stepping past them is a no-op
+        leaf = np.asarray(left) == TREE_LEAF
+        nodes = np.arange(len(leaf), dtype=np.intp)
+        self.feature = np.where(leaf, 0, feature).astype(np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.where(leaf, nodes, left).astype(np.intp)
+        self.right = np.where(leaf, nodes, right).astype(np.intp)
+        # children[2 * node + went_left] is the next node
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+
+        # Number of steps that takes every root down to a leaf
+        self.depth = 0
+        frontier = self.roots[~leaf[self.roots]]
+        while len(frontier):
+            children = np.concatenate([self.left[frontier], self.right[frontier]])
+            frontier = children[~leaf[children]]
+            self.depth += 1
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(**forest_arrays(model))
+
+    def apply(self, X):
+        """Leaf ids reached by each row of a dense or CSR batch, shape (rows, trees)"""
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        # One flat index per (row, tree) pair into the raveled batch
+        row_base = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, n_trees)
+        # sklearn's trees compare float32 features
+        if hasattr(X, 'indptr'):
+            lookup = _sparse_lookup(X)
+        else:
+            lookup = np.ascontiguousarray(X, dtype=np.float32).ravel().take
+        nodes = np.tile(self.roots, n_rows)
+        for _ in range(self.depth):
+            go_left = lookup(row_base + self.feature.take(nodes)) <= self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + go_left)
+        return nodes.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X):
+        """Mean class probabilities over the trees for a dense or CSR batch"""
+        out = np.empty((X.shape[0], self.proba.shape[1]), dtype=np.float64)
+        # Small row blocks keep the batch and node state cache-resident
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            block = X[start:start + CHUNK_ROWS]
+            if hasattr(block, 'toarray') and X.shape[1] < SPARSE_MIN_FEATURES:
+                block = block.toarray()
+            leaves = self.apply(block)
+            total = np.zeros((leaves.shape[0], self.proba.shape[1]), dtype=np.float64)
+            for tree_proba in self.proba.take(leaves.T, axis=0):
+                # Accumulate tree by tree, in the order RandomForestClassifier does
+                total += tree_proba
+            out[start:start + CHUNK_ROWS] = total
+        out /= len(self.roots)
+        return out
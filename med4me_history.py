@@ -0,0 +1,54 @@
+"""Lazy patient history for the consultation page.
+
+A rerun of the page needs little of a patient's history: the latest visit's
+demographics for the pre-fill (get_last_visit) and, only while the past
+visits panel is open, pages of (id, date, diagnosis) timeline rows
+(get_visit_timeline). A visit's full text is read when the doctor opens it
+and kept in the session's VisitBodies, a small LRU; visits are never edited
+after they are saved, so a cached body cannot go stale.
+"""
+from collections import OrderedDict
+
+from med4me_db import get_visit, get_visit_timeline
+
+BODY_CACHE_SIZE = 32
+
+
+def load_timeline(patient_id, doctor_id, pages):
+    """The first pages of the timeline and the cursor after them (None at the end)"""
+    visits, cursor = [], None
+    for _ in range(pages):
+        page, cursor = get_visit_timeline(patient_id, doctor_id, after=cursor)
+        visits.extend(page)
+        if cursor is None:
+            break
+    return visits, cursor
+
+
+class VisitBodies:
+    """Per-session LRU of full visit rows, read from the database on first use"""
+
+    def __init__(self, maxsize=BODY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, visit_id, doctor_id):
+        """The visit's row from get_visit, or None if it is not the doctor's"""
+        key = (doctor_id, visit_id)
+        visit = self._entries.get(key)
+        if visit is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return visit
+        self.misses += 1
+        visit = get_visit(visit_id, doctor_id)
+        if visit is not None:
+            self._entries[key] = visit
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return visit
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
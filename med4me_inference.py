@@ -0,0 +1,92 @@
+import pickle
+
+import numpy as np
+import scipy.sparse as sp
+
+from med4me_encoding import encode_age, encode_gender
+from med4me_forest import CompactForest
+
+COMPACT_MAX_ROWS = 1024
+
+# Differential diagnosis: the likeliest classes per consultation, dropping
+# those below DIFFERENTIAL_MIN
+DIFFERENTIAL_K = 3
+DIFFERENTIAL_MIN = 0.05
+
+
+def build_features(vectorizer, symptoms, ages, genders):
+    """CSR feature matrix for parallel sequences of symptoms, ages and genders"""
+    text = vectorizer.transform(symptoms)
+    demographics = np.column_stack([
+        [encode_age(age) for age in ages],
+        [encode_gender(gender) for gender in genders],
+    ]).astype(text.dtype)
+    return sp.hstack([text, sp.csr_matrix(demographics)], format='csr')
+
+
+def differential(classes, probabilities, k=DIFFERENTIAL_K, floor=DIFFERENTIAL_MIN):
+    """Per row, ((label, probability), ...) of the k likeliest classes, likeliest first.
+
+    Read off the probabilities an engine's predict_many already returned, so
+    it costs one sort of a short row each. The first entry is always the
+    predicted label (the sort is stable, as argmax takes the first maximum);
+    the others are kept only at or above floor.
+    """
+    top = np.argsort(-probabilities, axis=1, kind='stable')[:, :k]
+    labels = classes[top].tolist()
+    values = np.take_along_axis(probabilities, top, axis=1).tolist()
+    return [
+        tuple((str(label), p) for rank, (label, p) in enumerate(zip(row_labels, row_values))
+              if rank == 0 or p >= floor)
+        for row_labels, row_values in zip(labels, values)
+    ]
+
+
+class InferenceEngine:
+    """Builds feature rows and scores them with the trained forest.
+
+    Rows are TF-IDF symptom columns followed by age and gender. The TF-IDF
+    block stays sparse and the two demographic columns are appended as
+    sparse columns, so no dense copy of the vocabulary-wide row is made.
+    Probabilities are computed once per call and the label is their argmax,
+    which is exactly what ``RandomForestClassifier.predict`` does internally.
+    Batches of up to COMPACT_MAX_ROWS rows are scored by CompactForest, which
+    gives the same probabilities without sklearn's per-call validation and
+    joblib dispatch; larger ones go to sklearn's compiled tree walk, which
+    overtakes the numpy stepping at roughly that size.
+    """
+
+    def __init__(self, model, vectorizer):
+        self.model = model
+        self.vectorizer = vectorizer
+        self.classes = model.classes_
+        self.forest = CompactForest.from_model(model)
+
+    def features(self, symptoms, ages, genders):
+        return build_features(self.vectorizer, symptoms, ages, genders)
+
+    def predict_proba(self, X):
+        if X.shape[0] <= COMPACT_MAX_ROWS:
+            return self.forest.predict_proba(X)
+        return self.model.predict_proba(X)
+
+    def predict_many(self, symptoms, ages, genders):
+        """Return (labels, confidences, probabilities) for a batch of consultations"""
+        probabilities = self.predict_proba(self.features(symptoms, ages, genders))
+        best = np.argmax(probabilities, axis=1)
+        return self.classes[best], probabilities[np.arange(len(best)), best], probabilities
+
+    def predict(self, symptoms, age, gender):
+        """Return (label, confidence, probabilities) for one consultation"""
+        probabilities = self.predict_proba(self.features([symptoms], [age], [gender]))[0]
+        best = int(np.argmax(probabilities))
+        return self.classes[best], float(probabilities[best]), probabilities
+
+
+def load_engine(model_path, vectorizer_path):
+    """Unpickle the trained model and vectorizer into an InferenceEngine"""
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    with open(vectorizer_path, 'rb') as f:
+        vectorizer = pickle.load(f)
+    return InferenceEngine(model, vectorizer)
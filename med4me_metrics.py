@@ -0,0 +1,201 @@
+"""Latency instrumentation for the consultation hot path.
+
+Stages are timed with ``timed(name)`` (decorator) or ``timer(name)`` (context
+manager) into fixed-bucket histograms, which keep constant memory however
+many samples arrive and give p50/p95/p99 by interpolating inside the bucket
+that holds the quantile. SQL statements are timed by the connection factory
+in med4me_db; any call slower than SLOW_QUERY_MS lands in a bounded
+slow-query log with its statement text.
+
+Everything is process-wide, so the numbers cover every Streamlit session
+served by this process. Export with ``METRICS.to_json()`` or
+``METRICS.to_prometheus()`` (Prometheus text exposition format).
+"""
+import copy
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Bucket upper bounds in seconds, 100µs to 10s
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+SLOW_QUERY_MS = float(os.environ.get('MED4ME_SLOW_QUERY_MS', 50))
+SLOW_LOG_SIZE = 200
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """Add another histogram's samples (same buckets) to this one"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimated q-quantile in seconds, interpolated within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        summary = {
+            'count': self.count,
+            'mean_ms': self.sum / self.count * 1000 if self.count else 0.0,
+            'max_ms': self.max * 1000,
+        }
+        for q in QUANTILES:
+            summary[f'p{round(q * 100)}_ms'] = self.quantile(q) * 1000
+        return summary
+
+
+class Metrics:
+    """Named histograms plus the slow-query log, shared by every thread"""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_log_size=SLOW_LOG_SIZE):
+        self.enabled = os.environ.get('MED4ME_METRICS', '1') != '0'
+        self.slow_query_ms = slow_query_ms
+        self.started = time.time()
+        self._histograms = {}
+        self._gauges = {}
+        self._slow_queries = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def set_gauge(self, name, value):
+        """Record the current value of a level, e.g. a queue depth"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe_query(self, sql, seconds, phase='execute'):
+        """Record one SQL call; slow ones are kept with their statement text"""
+        self.observe(f'sql.{phase}', seconds)
+        if seconds * 1000 >= self.slow_query_ms:
+            with self._lock:
+                self._slow_queries.append({
+                    'at': time.time(),
+                    'ms': seconds * 1000,
+                    'phase': phase,
+                    'sql': ' '.join(sql.split()),
+                })
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator timing every call of the wrapped function as stage name"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def histograms(self):
+        """Copies of every histogram by name, e.g. to merge across processes"""
+        with self._lock:
+            return {name: copy.deepcopy(h) for name, h in self._histograms.items()}
+
+    def snapshot(self):
+        """Per-stage summaries and the slow-query log, newest first"""
+        with self._lock:
+            stages = {name: h.summary() for name, h in sorted(self._histograms.items())}
+            gauges = dict(sorted(self._gauges.items()))
+            slow = list(reversed(self._slow_queries))
+        return {
+            'uptime_s': time.time() - self.started,
+            'slow_query_ms': self.slow_query_ms,
+            'stages': stages,
+            'gauges': gauges,
+            'slow_queries': slow,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition of every histogram"""
+        lines = [
+            "# HELP med4me_stage_seconds Latency of instrumented Med4Me stages",
+            "# TYPE med4me_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(h.buckets, h.counts):
+                    cumulative += bucket_count
+                    lines.append(f'med4me_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'med4me_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'med4me_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+                lines.append(f'med4me_stage_seconds_count{{stage="{name}"}} {h.count}')
+            lines.append("# HELP med4me_gauge Current value of instrumented levels")
+            lines.append("# TYPE med4me_gauge gauge")
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f'med4me_gauge{{name="{name}"}} {value}')
+            lines.append("# HELP med4me_slow_queries Slow SQL calls currently in the log")
+            lines.append("# TYPE med4me_slow_queries gauge")
+            lines.append(f"med4me_slow_queries {len(self._slow_queries)}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._gauges.clear()
+            self._slow_queries.clear()
+            self.started = time.time()
+
+
+METRICS = Metrics()
+timer = METRICS.timer
+timed = METRICS.timed
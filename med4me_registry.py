@@ -0,0 +1,381 @@
+"""Versioned model artifacts.
+
+Every training run publishes its artifacts into models/<version>/ and then
+points models/CURRENT at that version. Both steps are atomic renames: the
+version directory is written under a temporary name and renamed into place,
+and CURRENT is replaced with os.replace, so a reader sees either the old
+version or the complete new one, never a half-written set. The app re-reads
+CURRENT from a background thread and hot-swaps to the new version without a
+restart.
+
+Each version carries a manifest.json, written last, with the size and
+SHA-256 of every other file. Loading reads each file once, checks it against
+the manifest and deserializes from those same bytes, so a truncated, edited
+or partially copied version is refused rather than served.
+
+ActiveModel holds the served (version, engine, treatment_db) triple as one
+immutable object. A new version is loaded and verified off the request path
+and then swapped in with a single reference assignment: a request that has
+already taken the old triple finishes with it, the next one gets the new
+one, and nobody waits on the load. A version that fails verification is
+skipped and the last good one keeps serving.
+
+    python med4me_registry.py list | verify VERSION | activate VERSION
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+from pathlib import Path
+
+from med4me_metrics import METRICS
+
+basedir = Path(__file__).parent
+REGISTRY_DIR = basedir / 'models'
+CURRENT_FILE = 'CURRENT'
+
+MODEL_FILE = 'ml_model.pkl'
+VECTORIZER_FILE = 'vectorizer.pkl'
+ARTIFACT_FILE = 'ml_model.npz'
+TREATMENT_FILE = 'treatment_db.json'
+META_FILE = 'meta.json'
+MANIFEST_FILE = 'manifest.json'
+POLL_INTERVAL = float(os.environ.get('MED4ME_MODEL_POLL_SECONDS', 2))
+
+
+def new_version():
+    """Sortable version id: UTC timestamp plus a short random suffix"""
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:6]}"
+
+
+def _fsync_dir(path):
+    # Directory fsync makes the rename itself durable (not supported everywhere)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_file(path, write, mode='wb'):
+    with open(path, mode) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def build_manifest(directory, version):
+    """Size and SHA-256 of every artifact file in directory"""
+    files = {}
+    for path in sorted(Path(directory).iterdir()):
+        if path.is_file() and path.name != MANIFEST_FILE:
+            data = path.read_bytes()
+            files[path.name] = {'bytes': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+    return {'version': version, 'files': files}
+
+
+def publish(model, vectorizer, treatment_db, meta=None, registry=REGISTRY_DIR):
+    """Write a complete artifact set as a new version and make it current"""
+    from med4me_artifacts import export_artifacts
+
+    registry = Path(registry)
+    registry.mkdir(parents=True, exist_ok=True)
+    version = new_version()
+    staging = registry / f".{version}.tmp"
+    staging.mkdir()
+    try:
+        _write_file(staging / MODEL_FILE, lambda f: pickle.dump(model, f))
+        _write_file(staging / VECTORIZER_FILE, lambda f: pickle.dump(vectorizer, f))
+        _write_file(staging / TREATMENT_FILE, lambda f: json.dump(treatment_db, f, indent=2), 'w')
+        _write_file(staging / ARTIFACT_FILE, lambda f: export_artifacts(model, vectorizer, f))
+        meta = dict(meta or {}, version=version, created_at=datetime.now(timezone.utc).isoformat())
+        _write_file(staging / META_FILE, lambda f: json.dump(meta, f, indent=2), 'w')
+        manifest = build_manifest(staging, version)
+        _write_file(staging / MANIFEST_FILE, lambda f: json.dump(manifest, f, indent=2), 'w')
+        _fsync_dir(staging)
+        os.rename(staging, registry / version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _fsync_dir(registry)
+    set_current(version, registry)
+    return version
+
+
+def set_current(version, registry=REGISTRY_DIR):
+    """Atomically point CURRENT at an already published version"""
+    registry = Path(registry)
+    verify_version(version, registry)
+    pointer = registry / f".{CURRENT_FILE}.{uuid.uuid4().hex}"
+    _write_file(pointer, lambda f: f.write(version + '\n'), 'w')
+    os.replace(pointer, registry / CURRENT_FILE)
+    _fsync_dir(registry)
+
+
+def current_version(registry=REGISTRY_DIR):
+    """Version CURRENT points at, or None when nothing is published"""
+    try:
+        return (Path(registry) / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(version, registry=REGISTRY_DIR):
+    return Path(registry) / version
+
+
+def list_versions(registry=REGISTRY_DIR):
+    """Published versions, oldest first"""
+    registry = Path(registry)
+    if not registry.is_dir():
+        return []
+    return sorted(p.name for p in registry.iterdir() if p.is_dir() and not p.name.startswith('.'))
+
+
+def read_meta(version, registry=REGISTRY_DIR):
+    with open(version_dir(version, registry) / META_FILE) as f:
+        return json.load(f)
+
+
+def read_manifest(version, registry=REGISTRY_DIR):
+    directory = version_dir(version, registry)
+    if not directory.is_dir():
+        raise ValueError(f"unknown model version {version!r}")
+    try:
+        with open(directory / MANIFEST_FILE) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"model version {version!r} has no readable manifest: {e}")
+    if manifest.get('version') != version:
+        raise ValueError(f"manifest of {version!r} describes {manifest.get('version')!r}")
+    return manifest
+
+
+def read_verified(version, name, manifest, registry=REGISTRY_DIR):
+    """Bytes of one artifact file, checked against the manifest"""
+    expected = manifest['files'].get(name)
+    if expected is None:
+        raise ValueError(f"{name} is not listed in the manifest of {version!r}")
+    data = (version_dir(version, registry) / name).read_bytes()
+    if len(data) != expected['bytes'] or hashlib.sha256(data).hexdigest() != expected['sha256']:
+        raise ValueError(f"{name} of model version {version!r} does not match its manifest")
+    return data
+
+
+def verify_version(version, registry=REGISTRY_DIR):
+    """Check every file of a version against its manifest; returns the manifest"""
+    manifest = read_manifest(version, registry)
+    for name in manifest['files']:
+        read_verified(version, name, manifest, registry)
+    return manifest
+
+
+class CurrentVersion:
+    """Cheap poller for CURRENT: re-reads the file only when its stat changes"""
+
+    def __init__(self, registry=REGISTRY_DIR):
+        self.path = Path(registry) / CURRENT_FILE
+        self._signature = None
+        self._version = None
+
+    def get(self):
+        try:
+            stat = self.path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            self._signature, self._version = None, None
+            return None
+        if signature != self._signature:
+            self._version = current_version(self.path.parent)
+            self._signature = signature
+        return self._version
+
+
+def load_version(version, registry=REGISTRY_DIR):
+    """Verified inference engine and treatment database for a published version"""
+    manifest = read_manifest(version, registry)
+    treatment_db = json.loads(read_verified(version, TREATMENT_FILE, manifest, registry))
+    if ARTIFACT_FILE in manifest['files']:
+        from med4me_artifacts import load_compact_engine
+        data = read_verified(version, ARTIFACT_FILE, manifest, registry)
+        return load_compact_engine(io.BytesIO(data)), treatment_db
+    from med4me_inference import InferenceEngine
+    model = pickle.loads(read_verified(version, MODEL_FILE, manifest, registry))
+    vectorizer = pickle.loads(read_verified(version, VECTORIZER_FILE, manifest, registry))
+    return InferenceEngine(model, vectorizer), treatment_db
+
+
+def load_bundled(directory=basedir):
+    """Engine and treatment database shipped in the app directory
+
+    The version label is derived from the model file's checksum, so visits
+    scored by the bundled model still say exactly which model that was.
+    """
+    directory = Path(directory)
+    treatment_db = {}
+    if (directory / TREATMENT_FILE).exists():
+        with open(directory / TREATMENT_FILE) as f:
+            treatment_db = json.load(f)
+    if (directory / ARTIFACT_FILE).exists():
+        # numpy-only engine: no sklearn import, no unpickling
+        from med4me_artifacts import load_compact_engine
+        data = (directory / ARTIFACT_FILE).read_bytes()
+        engine = load_compact_engine(io.BytesIO(data))
+    else:
+        from med4me_inference import InferenceEngine
+        data = (directory / MODEL_FILE).read_bytes()
+        with open(directory / VECTORIZER_FILE, 'rb') as f:
+            engine = InferenceEngine(pickle.loads(data), pickle.load(f))
+    return f"bundled-{hashlib.sha256(data).hexdigest()[:12]}", engine, treatment_db
+
+
+def has_bundled(directory=basedir):
+    directory = Path(directory)
+    return (directory / ARTIFACT_FILE).exists() or (
+        (directory / MODEL_FILE).exists() and (directory / VECTORIZER_FILE).exists())
+
+
+def load_model(version, registry=REGISTRY_DIR):
+    """Verified, unpickled (model, vectorizer) of a published version, for retraining"""
+    manifest = read_manifest(version, registry)
+    model = pickle.loads(read_verified(version, MODEL_FILE, manifest, registry))
+    vectorizer = pickle.loads(read_verified(version, VECTORIZER_FILE, manifest, registry))
+    return model, vectorizer
+
+
+ServedModel = namedtuple('ServedModel', 'version engine treatment_db')
+
+
+class ActiveModel:
+    """The model being served, swapped to new versions in the background
+
+    Nothing is loaded until the first get(). From then on a daemon thread
+    polls CURRENT every poll_interval seconds and, when it moves, loads and
+    verifies that version before replacing the served triple.
+    """
+
+    def __init__(self, registry=REGISTRY_DIR, bundled_dir=basedir, poll_interval=POLL_INTERVAL):
+        self.registry = Path(registry)
+        self.bundled_dir = Path(bundled_dir)
+        self.poll_interval = poll_interval
+        self.swaps = 0
+        self.last_error = None
+        self._current = CurrentVersion(registry)
+        self._served = None
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def available(self):
+        """Whether there is any model to serve"""
+        return self._served is not None or self._current.get() is not None or has_bundled(self.bundled_dir)
+
+    @property
+    def version(self):
+        """Version being served, or None before the first load"""
+        served = self._served
+        return served.version if served is not None else None
+
+    def get(self):
+        """Served (version, engine, treatment_db); loads on the first call only"""
+        served = self._served
+        if served is None:
+            with self._lock:
+                if self._served is None:
+                    self._served = self._load_first()
+                    self._thread = threading.Thread(target=self._poll, name='med4me-model-poller', daemon=True)
+                    self._thread.start()
+                served = self._served
+        return served
+
+    def _load(self, version):
+        start = time.perf_counter()
+        engine, treatment_db = load_version(version, self.registry)
+        METRICS.observe('model.swap_load', time.perf_counter() - start)
+        return ServedModel(version, engine, treatment_db)
+
+    def _load_first(self):
+        version = self._current.get()
+        if version is not None:
+            try:
+                return self._load(version)
+            except Exception as e:
+                self._reject(version, e)
+        if not has_bundled(self.bundled_dir):
+            raise FileNotFoundError("no verified model version and no bundled model")
+        return ServedModel(*load_bundled(self.bundled_dir))
+
+    def _reject(self, version, error):
+        self._failed.add(version)
+        self.last_error = f"{version}: {error}"
+        METRICS.set_gauge('model.rejected_versions', len(self._failed))
+
+    def check(self):
+        """Swap to CURRENT if it names a new, verifiable version"""
+        version = self._current.get()
+        if version is None or version == self.version or version in self._failed:
+            return False
+        try:
+            served = self._load(version)
+        except Exception as e:
+            self._reject(version, e)
+            return False
+        # One reference assignment: requests holding the old triple keep it
+        self._served = served
+        self.swaps += 1
+        self.last_error = None
+        METRICS.set_gauge('model.swaps', self.swaps)
+        return True
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.check()
+            except Exception as e:
+                # An unreadable CURRENT (permissions, a half-written file) must
+                # not stop hot-swap for good: report it and try again next poll
+                self.last_error = f"CURRENT: {type(e).__name__}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and roll the model registry")
+    parser.add_argument('--registry', default=str(REGISTRY_DIR))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="published versions, CURRENT marked with *")
+    commands.add_parser('verify', help="check a version against its manifest").add_argument('version')
+    commands.add_parser('activate', help="point CURRENT at a version (rollback)").add_argument('version')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        current = current_version(args.registry)
+        for version in list_versions(args.registry):
+            try:
+                meta = read_meta(version, args.registry)
+            except (OSError, ValueError):
+                meta = {}
+            mark = '*' if version == current else ' '
+            print(f"{mark} {version}  {meta.get('source', '?'):6s}  visits<={meta.get('trained_through_visit', '?')}")
+    elif args.command == 'verify':
+        manifest = verify_version(args.version, args.registry)
+        print(f"✓ {args.version}: {len(manifest['files'])} files match the manifest")
+    else:
+        set_current(args.version, args.registry)
+        print(f"✓ CURRENT -> {args.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Rule-based fallback recommendations.
+
+FALLBACK_RULES is the rule table, in priority order: a category key, a
+pattern in the original ``re.search`` syntax (alternatives joined by ``|``,
+each a sequence of ``\\b``-anchored terms joined by ``.*``), and the fields
+the rule sets on the recommendation. RuleMatcher compiles the whole table
+once into a single scanner that reports every matching category in one
+pass over the text.
+"""
+import re
+
+FALLBACK_DEFAULT = {
+    "Diagnosis": "General symptomatic care",
+    "Medicine": "- Paracetamol 500 mg: Every 6 hours as needed",
+    "Alternative": "- Ibuprofen 200 mg: Every 6-8 hours if no contraindications",
+    "Lifestyle": "Hydration, rest, monitor symptoms.",
+    "Red Flags": "Persistent symptoms more than 3 days, high fever, severe pain.",
+    "Follow-Up": "Review in 48-72 hours if no improvement.",
+    "Notes": "This is a rule-based recommendation. Final prescription authority lies with the licensed physician.",
+    "ml_prediction": None,
+    "ml_confidence": None
+}
+
+FALLBACK_RULES = [
+    # Fever and infections
+    (
+        'fever',
+        r"\bfever\b|\btemperature\b|\bpyrexia\b",
+        {
+            "Diagnosis": "Acute febrile illness",
+            "Medicine": "- Paracetamol 500 mg: Every 6 hours for fever\n- Maintain hydration with ORS",
+            "Alternative": "- Ibuprofen 400 mg: Every 8 hours if no contraindications\n- Cold compress",
+            "Lifestyle": "Fluids (2-3 liters/day), rest, monitor temperature.",
+            "Red Flags": "Fever >39°C for >3 days, severe headache, rash, breathing difficulty, altered consciousness.",
+            "Follow-Up": "Review in 48 hours if fever persists.",
+        },
+    ),
+    # Diabetes
+    (
+        'diabetes',
+        r"\bdiabetes\b|\bhigh.*sugar\b|\bhyperglycemi\b",
+        {
+            "Diagnosis": "Type 2 Diabetes Mellitus",
+            "Medicine": "- Metformin 500 mg: BD with meals (start low, titrate up)\n- Monitor blood glucose regularly",
+            "Alternative": "- Glimepiride 1-2 mg OD (if metformin not tolerated)\n- DPP-4 inhibitors (Sitagliptin 100 mg OD)",
+            "Lifestyle": "Low glycemic index diet, 150 min exercise/week, weight loss (if BMI >25), avoid refined sugars.",
+            "Red Flags": "Glucose >400 mg/dL, confusion, chest pain, excessive thirst, fruity breath odor, rapid breathing.",
+            "Follow-Up": "HbA1c every 3 months, annual eye/foot examination.",
+        },
+    ),
+    # Cold/URTI
+    (
+        'cold',
+        r"\bcough\b|\bcold\b|\bsneez\b|\brunny.*nose\b|\bnasal.*congest\b",
+        {
+            "Diagnosis": "Upper Respiratory Tract Infection (URTI)",
+            "Medicine": "- Cetirizine 10 mg: Once daily at bedtime\n- Dextromethorphan cough syrup: 10 mL TDS\n- Saline nasal drops",
+            "Alternative": "- Loratadine 10 mg OD (non-drowsy)\n- Steam inhalation 2-3 times daily\n- Honey (1 tsp) for cough",
+            "Lifestyle": "Rest, warm fluids (tea, soup), avoid cold beverages, humidify room air.",
+            "Red Flags": "High fever >38.5°C, chest pain, difficulty breathing, persistent symptoms >7 days.",
+            "Follow-Up": "Review if symptoms persist beyond 5-7 days or worsen.",
+        },
+    ),
+    # Headache/Migraine
+    (
+        'headache',
+        r"\bheadache\b|\bmigrain\b|\bhead.*pain\b",
+        {
+            "Diagnosis": "Tension headache / Migraine",
+            "Medicine": "- Paracetamol 500 mg: Every 6-8 hours (max 4g/day)\n- For migraine: Sumatriptan 50 mg as needed",
+            "Alternative": "- Ibuprofen 400 mg TDS\n- Naproxen 250 mg BD\n- Rest in dark, quiet room",
+            "Lifestyle": "Stress management, regular sleep (7-8 hrs), hydration, avoid triggers (caffeine, alcohol, screens).",
+            "Red Flags": "Sudden severe headache (thunderclap), vision changes, confusion, neck stiffness, fever with headache.",
+            "Follow-Up": "Review if headaches increase in frequency or severity. Consider CT if red flags present.",
+        },
+    ),
+    # Hypertension
+    (
+        'hypertension',
+        r"\bhypertension\b|\bhigh.*blood.*pressure\b|\bhbp\b",
+        {
+            "Diagnosis": "Essential Hypertension",
+            "Medicine": "- Amlodipine 5 mg: Once daily\n- Monitor BP regularly (home monitoring)",
+            "Alternative": "- Losartan 50 mg OD (ARB)\n- Enalapril 5 mg OD (ACE inhibitor)\n- Hydrochlorothiazide 12.5 mg OD",
+            "Lifestyle": "Low sodium diet (<2g/day), DASH diet, regular exercise (30 min/day), weight reduction, limit alcohol, quit smoking.",
+            "Red Flags": "BP >180/120, chest pain, severe headache, vision changes, shortness of breath, nosebleeds.",
+            "Follow-Up": "BP monitoring weekly initially, then monthly. Review medications every 3 months.",
+        },
+    ),
+    # Asthma/Breathing problems
+    (
+        'asthma',
+        r"\basthma\b|\bwheezing\b|\bshortness.*breath\b|\bbreathe\b",
+        {
+            "Diagnosis": "Asthma / Reactive Airway Disease",
+            "Medicine": "- Salbutamol inhaler (2 puffs): PRN for symptoms\n- Budesonide inhaler 200 mcg: BD (controller)",
+            "Alternative": "- Montelukast 10 mg: Once daily at bedtime\n- Formoterol + Budesonide combination inhaler",
+            "Lifestyle": "Avoid triggers (dust, smoke, cold air), breathing exercises, maintain healthy weight, flu vaccination.",
+            "Red Flags": "Severe difficulty breathing, blue lips/fingers, unable to speak full sentences, chest tightness not relieved by inhaler.",
+            "Follow-Up": "Review in 2 weeks, peak flow monitoring, pulmonary function tests if persistent.",
+        },
+    ),
+    # Gastritis/Acid reflux
+    (
+        'gastric',
+        r"\bgastric\b|\bacid\b|\bheart.*burn\b|\bindigestion\b|\bstomach.*pain\b|\bepigastric\b",
+        {
+            "Diagnosis": "Gastritis / Gastroesophageal Reflux Disease (GERD)",
+            "Medicine": "- Omeprazole 20 mg: Once daily before breakfast\n- Antacid (Magaldrate) syrup: 10 mL after meals",
+            "Alternative": "- Pantoprazole 40 mg OD\n- Ranitidine 150 mg BD\n- Sucralfate 1g QID",
+            "Lifestyle": "Small frequent meals, avoid spicy/fatty foods, no late meals (3 hrs before bed), elevate head while sleeping, avoid alcohol/smoking.",
+            "Red Flags": "Severe abdominal pain, vomiting blood, black tarry stools, weight loss, difficulty swallowing.",
+            "Follow-Up": "Review in 4 weeks. Consider endoscopy if symptoms persist or red flags present.",
+        },
+    ),
+    # Allergic reactions
+    (
+        'allergy',
+        r"\ballerg\b|\brash\b|\bitch\b|\bhives\b|\burticaria\b",
+        {
+            "Diagnosis": "Allergic Reaction / Urticaria",
+            "Medicine": "- Cetirizine 10 mg: Once daily\n- Hydrocortisone cream 1%: Apply BD to affected areas\n- Avoid known allergens",
+            "Alternative": "- Loratadine 10 mg OD\n- Fexofenadine 120 mg OD (non-sedating)\n- Calamine lotion for local relief",
+            "Lifestyle": "Identify and avoid triggers, wear loose cotton clothing, avoid hot showers, keep skin moisturized.",
+            "Red Flags": "Difficulty breathing, swelling of face/throat/tongue, rapid pulse, dizziness, loss of consciousness (anaphylaxis).",
+            "Follow-Up": "Review in 1 week. Allergy testing if recurrent. Carry epinephrine auto-injector if severe allergies.",
+        },
+    ),
+    # Arthritis/Joint pain
+    (
+        'arthritis',
+        r"\barthritis\b|\bjoint.*pain\b|\bknee.*pain\b|\bback.*pain\b|\bosteo\b",
+        {
+            "Diagnosis": "Osteoarthritis / Degenerative Joint Disease",
+            "Medicine": "- Ibuprofen 400 mg: TDS after meals\n- Glucosamine 1500 mg + Chondroitin 1200 mg: Once daily\n- Topical diclofenac gel",
+            "Alternative": "- Naproxen 250 mg BD\n- Paracetamol 1g TDS\n- Hot/cold therapy\n- Capsaicin cream 0.025%",
+            "Lifestyle": "Weight reduction if overweight, low-impact exercises (swimming, cycling), physical therapy, avoid prolonged standing.",
+            "Red Flags": "Severe pain, joint swelling/warmth/redness, fever, inability to bear weight, deformity.",
+            "Follow-Up": "Review in 2 weeks. X-rays if severe. Consider physiotherapy referral.",
+        },
+    ),
+    # Anxiety/Depression
+    (
+        'mental_health',
+        r"\banxiety\b|\bdepression\b|\bstress\b|\bpanic\b|\bmental\b|\bsad\b|\bworr\b",
+        {
+            "Diagnosis": "Anxiety / Depression - Requires Mental Health Evaluation",
+            "Medicine": "- Escitalopram 10 mg: Once daily (after psychiatric evaluation)\n- Consider counseling/psychotherapy first",
+            "Alternative": "- Sertraline 50 mg OD\n- Cognitive Behavioral Therapy (CBT)\n- Mindfulness-based therapy",
+            "Lifestyle": "Regular exercise (30 min/day), adequate sleep (7-9 hrs), social support, relaxation techniques (meditation, yoga), limit caffeine/alcohol.",
+            "Red Flags": "Suicidal thoughts, self-harm, severe panic attacks, inability to perform daily activities, hallucinations.",
+            "Follow-Up": "Psychiatric referral recommended. Review in 1 week initially, then every 2-4 weeks.",
+        },
+    ),
+    # Urinary Tract Infection
+    (
+        'uti',
+        r"\buti\b|\burinary\b|\bburn.*urin\b|\bfrequent.*urin\b|\bdysuria\b",
+        {
+            "Diagnosis": "Urinary Tract Infection (UTI)",
+            "Medicine": "- Nitrofurantoin 100 mg: BD for 5 days\n- Increase fluid intake (2-3 liters/day)",
+            "Alternative": "- Trimethoprim 200 mg BD for 3 days\n- Ciprofloxacin 500 mg BD for 3 days\n- Cranberry supplements",
+            "Lifestyle": "Hydration (8-10 glasses water/day), urinate frequently, avoid holding urine, proper hygiene, cranberry juice.",
+            "Red Flags": "High fever, flank pain, blood in urine, nausea/vomiting, confusion (especially in elderly).",
+            "Follow-Up": "Review if symptoms persist after 48 hours. Urine culture if recurrent UTIs.",
+        },
+    ),
+    # Thyroid disorders
+    (
+        'thyroid',
+        r"\bthyroid\b|\bhypothyroid\b|\bhyperthyroid\b|\bfatigue\b|\bweight.*gain\b",
+        {
+            "Diagnosis": "Thyroid Disorder (Requires lab confirmation)",
+            "Medicine": "- Levothyroxine 50 mcg: Once daily (for hypothyroidism, after TSH confirmation)\n- Take on empty stomach",
+            "Alternative": "- Dosage adjustment based on TSH levels\n- Regular monitoring required",
+            "Lifestyle": "Regular medication timing, avoid soy/calcium supplements near medication time, balanced diet, regular exercise.",
+            "Red Flags": "Severe fatigue, rapid heart rate, tremors, significant weight changes, neck swelling.",
+            "Follow-Up": "TSH levels every 6-8 weeks initially, then every 6 months once stable.",
+        },
+    ),
+    # Skin infections
+    (
+        'skin',
+        r"\bskin.*infection\b|\bfungal\b|\bringworm\b|\beczema\b|\bdermatitis\b",
+        {
+            "Diagnosis": "Skin Infection / Dermatitis",
+            "Medicine": "- Clotrimazole cream 1%: Apply BD for fungal infections\n- Hydrocortisone cream 1%: BD for inflammation (max 7 days)",
+            "Alternative": "- Terbinafine cream 1% BD\n- Mupirocin ointment (if bacterial)\n- Calamine lotion for soothing",
+            "Lifestyle": "Keep area clean and dry, avoid tight clothing, change clothes daily, avoid sharing towels.",
+            "Red Flags": "Spreading infection, fever, pus discharge, severe pain, no improvement in 1 week.",
+            "Follow-Up": "Review in 1 week if no improvement. Skin scraping/culture if persistent.",
+        },
+    ),
+    # Anemia
+    (
+        'anemia',
+        r"\banemia\b|\banemic\b|\blow.*iron\b|\bfatigue\b|\bpale\b|\bdizz\b",
+        {
+            "Diagnosis": "Iron Deficiency Anemia (Requires lab confirmation)",
+            "Medicine": "- Ferrous sulfate 325 mg: Once daily with vitamin C\n- Take on empty stomach or with orange juice",
+            "Alternative": "- Ferrous gluconate 300 mg OD (if GI side effects)\n- Iron polymaltose complex\n- Vitamin B12 if deficient",
+            "Lifestyle": "Iron-rich foods (red meat, spinach, lentils, fortified cereals), vitamin C with meals (enhances absorption), avoid tea/coffee with meals.",
+            "Red Flags": "Severe fatigue, chest pain, shortness of breath, rapid heartbeat, severe dizziness, blood in stool.",
+            "Follow-Up": "Hemoglobin check in 4-6 weeks. Continue iron for 3-6 months to replenish stores.",
+        },
+    ),
+    # Insomnia/Sleep disorders
+    (
+        'insomnia',
+        r"\binsomnia\b|\bsleep\b|\bcan't.*sleep\b|\bawake\b",
+        {
+            "Diagnosis": "Insomnia / Sleep Disorder",
+            "Medicine": "- Melatonin 3 mg: 30 minutes before bedtime\n- Short-term: Zolpidem 5 mg (if severe, max 2 weeks)",
+            "Alternative": "- Diphenhydramine 25 mg at bedtime\n- Trazodone 50 mg (if depression present)\n- CBT for insomnia (CBT-I)",
+            "Lifestyle": "Sleep hygiene: regular sleep schedule, dark/cool room, avoid screens 1 hr before bed, no caffeine after 2 PM, relaxation techniques.",
+            "Red Flags": "Sleep apnea symptoms (snoring, gasping), severe daytime impairment, depression with insomnia.",
+            "Follow-Up": "Review in 2 weeks. Sleep study if suspected sleep apnea.",
+        },
+    ),
+]
+
+
+def trie_pattern(words):
+    """Regex alternation of words factored into a prefix trie"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+class RuleMatcher:
+    """Single-pass matcher for a FALLBACK_RULES-style table.
+
+    The literal text of every distinct term is compiled into one trie-shaped
+    alternation (plus newline), which the regex engine can skip through with
+    its first-character scan. Each hit offset is then checked against the few
+    terms sharing its first two characters, with their ``\\b`` anchors, so
+    terms that overlap or share a start are all found. ``a.*b`` sequences are
+    tracked incrementally: the earliest end of each matched term is kept, and
+    progress resets at newlines because ``.`` does not cross them. Nothing
+    ever backtracks over ``.*``, so the cost is linear in the text.
+    """
+
+    def __init__(self, rules):
+        self.keys = [key for key, _, _ in rules]
+        terms = []
+        term_index = {}
+        sequences = []
+        for rule_index, (_, pattern, _) in enumerate(rules):
+            for alternative in pattern.split('|'):
+                ids = []
+                for term in alternative.split('.*'):
+                    if term not in term_index:
+                        term_index[term] = len(terms)
+                        terms.append(term)
+                    ids.append(term_index[term])
+                sequences.append((rule_index, ids))
+
+        self.terms = [re.compile(term) for term in terms]
+        literals = [term.replace(r'\b', '') for term in terms]
+        self.scanner = re.compile(trie_pattern(set(literals)) + r'|\n')
+        self.candidates = {}
+        for i, literal in enumerate(literals):
+            self.candidates.setdefault(literal[:2], []).append(i)
+
+        # Single-term alternatives match outright; longer sequences need state
+        self.term_rules = [[] for _ in terms]
+        self.term_sequences = [[] for _ in terms]
+        self.sequences = []
+        for rule_index, ids in sequences:
+            if len(ids) == 1:
+                self.term_rules[ids[0]].append(rule_index)
+            else:
+                for position, term in enumerate(ids):
+                    self.term_sequences[term].append((len(self.sequences), position))
+                self.sequences.append((rule_index, len(ids)))
+
+    def match(self, text):
+        """Return the keys of every rule matching text, in priority order"""
+        matched = [False] * len(self.keys)
+        progress = [0] * len(self.sequences)
+        ready_at = [0] * len(self.sequences)
+
+        pos = 0
+        search = self.scanner.search
+        while True:
+            m = search(text, pos)
+            if m is None:
+                break
+            start = m.start()
+            pos = start + 1
+
+            if text[start] == '\n':
+                progress = [0] * len(self.sequences)
+                ready_at = [0] * len(self.sequences)
+                continue
+
+            for term in self.candidates.get(text[start:start + 2], ()):
+                term_match = self.terms[term].match(text, start)
+                if term_match is None:
+                    continue
+                for rule_index in self.term_rules[term]:
+                    matched[rule_index] = True
+                for sequence, position in self.term_sequences[term]:
+                    if progress[sequence] == position and start >= ready_at[sequence]:
+                        progress[sequence] += 1
+                        ready_at[sequence] = term_match.end()
+                        rule_index, length = self.sequences[sequence]
+                        if progress[sequence] == length:
+                            matched[rule_index] = True
+
+        return [key for key, hit in zip(self.keys, matched) if hit]
+
+
+FALLBACK_MATCHER = RuleMatcher(FALLBACK_RULES)
+FALLBACK_TREATMENTS = {key: fields for key, _, fields in FALLBACK_RULES}
+
+def match_categories(symptoms):
+    """Every fallback category matching the symptoms, highest priority first"""
+    return FALLBACK_MATCHER.match((symptoms or "").lower())
@@ -0,0 +1,125 @@
+"""In-process micro-batching for recommendation scoring.
+
+Concurrent sessions hand single consultations to MicroBatcher.run(). A
+scheduler thread takes the first waiting request, keeps collecting for up to
+window_ms or until max_batch requests are in hand, and scores them all with
+one call (one vectorize + forest pass for the batch); each session then gets
+its own row back. Under load this replaces many single-row passes, each with
+its fixed numpy and Python overhead, with a few wide ones.
+
+With the default window of 0 the batch is simply everything that queued up
+while the previous one was being scored, so a lone request is never held
+back and batches grow with load; a longer window (MED4ME_BATCH_WINDOW_MS)
+only added latency in bench_microbatch.py at every load level measured.
+
+Latency bound: a request waits at most window_ms for its batch to close,
+then for that batch to be scored. If its result has not arrived within
+deadline_ms, run() withdraws the request (when it has not been picked up
+yet) and scores it inline instead, so a stalled scheduler costs one deadline
+at most.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from med4me_metrics import METRICS
+
+BATCH_WINDOW_MS = float(os.environ.get('MED4ME_BATCH_WINDOW_MS', 0))
+BATCH_MAX = int(os.environ.get('MED4ME_BATCH_MAX', 32))
+BATCH_DEADLINE_MS = 250
+
+
+class MicroBatcher:
+    """Gathers concurrent score requests into batched calls of score(records)
+
+    score takes a list of records and returns one result per record, in order.
+    """
+
+    def __init__(self, score, window_ms=BATCH_WINDOW_MS, max_batch=BATCH_MAX, deadline_ms=BATCH_DEADLINE_MS):
+        self.score = score
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.deadline = deadline_ms / 1000
+        self.requests = 0
+        self.batches = 0
+        self.inline = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='med4me-micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        """Queue one record; the Future yields its result"""
+        future = Future()
+        self._queue.put((future, time.perf_counter(), record))
+        return future
+
+    def run(self, record):
+        """Score one record as part of a batch, within the deadline"""
+        future = self.submit(record)
+        try:
+            return future.result(timeout=self.deadline)
+        except TimeoutError:
+            if not future.cancel():
+                # Already being scored: the batch is about to finish
+                return future.result()
+        self.inline += 1
+        return self.score([record])[0]
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        closes = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = closes - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _score_batch(self, records):
+        """One result per record; if the batch fails, its records are scored
+        one by one so only the bad ones get the exception"""
+        try:
+            return self.score(records)
+        except Exception as e:
+            if len(records) == 1:
+                return [e]
+        results = []
+        for record in records:
+            try:
+                results.extend(self.score([record]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _run(self):
+        while True:
+            # Requests withdrawn by run() after their deadline are skipped
+            batch = [item for item in self._next_batch() if item[0].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            results = self._score_batch([record for _, _, record in batch])
+            done = time.perf_counter()
+            self.requests += len(batch)
+            self.batches += 1
+            METRICS.observe('batcher.score', done - start)
+            for (future, queued_at, _), result in zip(batch, results):
+                METRICS.observe('batcher.wait', start - queued_at)
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            for name, value in self.stats().items():
+                METRICS.set_gauge(f'batcher.{name}', value)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch': self.requests / self.batches if self.batches else 0.0,
+            'inline': self.inline,
+            'queue_depth': self._queue.qsize(),
+        }
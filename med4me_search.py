@@ -0,0 +1,191 @@
+"""Hyperparameter search for the recommendation model.
+
+Every candidate in the grid is a pair of TF-IDF settings (max_features,
+ngram_range) and forest settings (n_estimators, max_depth). Candidates are
+scored with stratified k-fold cross-validation. The vectorizer is fitted once
+per (TF-IDF settings, fold) in the parent and the resulting feature matrices
+are handed to every worker once, through the pool initializer, so forest
+candidates sharing TF-IDF settings never recompute it.
+
+Forest fits run on a process pool (one worker per core by default). Each
+worker also fits its candidate on all rows and returns the exported .npz
+bytes; the parent then measures artifact size, load time and per-row
+latency one candidate at a time, so the timings are not skewed by workers
+competing for the cores.
+"""
+import io
+import itertools
+import os
+import pickle
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from med4me_inference import build_features
+
+DEFAULT_GRID = {
+    'max_features': [100, 300, None],
+    'ngram_range': [(1, 1), (1, 2)],
+    'n_estimators': [50, 100, 200],
+    'max_depth': [10, None],
+}
+FOLDS = 5
+RANDOM_STATE = 42
+LOAD_REPEATS = 5
+LATENCY_CALLS = 200
+
+
+def candidates(grid=DEFAULT_GRID):
+    """(vectorizer params, forest params) for every grid point"""
+    vector_keys = [k for k in ('max_features', 'ngram_range') if k in grid]
+    forest_keys = [k for k in grid if k not in vector_keys]
+    for vector_values in itertools.product(*(grid[k] for k in vector_keys)):
+        for forest_values in itertools.product(*(grid[k] for k in forest_keys)):
+            yield dict(zip(vector_keys, vector_values)), dict(zip(forest_keys, forest_values))
+
+
+def fold_count(labels, folds):
+    """Folds actually usable: stratification needs that many rows per class"""
+    return max(2, min(folds, min(Counter(labels).values())))
+
+
+def _features(vectorizer, rows):
+    symptoms, ages, genders, _ = zip(*rows)
+    return build_features(vectorizer, [s.lower() for s in symptoms], ages, genders)
+
+
+def vectorize_folds(rows, vector_grid, folds):
+    """Feature matrices per TF-IDF setting: every CV split plus the full set"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.model_selection import StratifiedKFold
+
+    labels = [row[3] for row in rows]
+    splits = list(StratifiedKFold(folds, shuffle=True, random_state=RANDOM_STATE).split(rows, labels))
+    cache = {}
+    for params in vector_grid:
+        key = tuple(sorted(params.items()))
+        fold_data = []
+        for train_index, test_index in splits:
+            train = [rows[i] for i in train_index]
+            test = [rows[i] for i in test_index]
+            vectorizer = TfidfVectorizer(**params).fit([row[0] for row in train])
+            fold_data.append((_features(vectorizer, train), [row[3] for row in train],
+                              _features(vectorizer, test), [row[3] for row in test]))
+        vectorizer = TfidfVectorizer(**params).fit([row[0] for row in rows])
+        cache[key] = {'folds': fold_data, 'full': (_features(vectorizer, rows), labels, vectorizer)}
+    return cache
+
+
+# Worker side: the fold cache arrives once per process, not once per task
+_FOLDS = None
+
+
+def _init_worker(cache):
+    global _FOLDS
+    _FOLDS = cache
+
+
+def evaluate(vector_params, forest_params):
+    """CV accuracies, fit time and the exported artifact of one candidate"""
+    from sklearn.ensemble import RandomForestClassifier
+    from med4me_artifacts import export_artifacts
+
+    entry = _FOLDS[tuple(sorted(vector_params.items()))]
+    scores = []
+    start = time.perf_counter()
+    for X_train, y_train, X_test, y_test in entry['folds']:
+        model = RandomForestClassifier(random_state=RANDOM_STATE, **forest_params).fit(X_train, y_train)
+        scores.append(model.score(X_test, y_test))
+    cv_seconds = time.perf_counter() - start
+
+    X, y, vectorizer = entry['full']
+    model = RandomForestClassifier(random_state=RANDOM_STATE, **forest_params).fit(X, y)
+    artifact = io.BytesIO()
+    export_artifacts(model, vectorizer, artifact)
+    return {
+        'params': dict(vector_params, **forest_params),
+        'cv_accuracy': statistics.mean(scores),
+        'cv_std': statistics.pstdev(scores),
+        'cv_seconds': cv_seconds,
+        'pickle_bytes': len(pickle.dumps(model)) + len(pickle.dumps(vectorizer)),
+        'artifact': artifact.getvalue(),
+    }
+
+
+def measure_serving(result, rows):
+    """Artifact size, load time and single-row latency of an evaluated candidate"""
+    from med4me_artifacts import load_compact_engine
+
+    artifact = result.pop('artifact')
+    load_times = []
+    for _ in range(LOAD_REPEATS):
+        start = time.perf_counter()
+        engine = load_compact_engine(io.BytesIO(artifact))
+        load_times.append(time.perf_counter() - start)
+
+    latencies = []
+    for symptoms, age, gender, _ in itertools.islice(itertools.cycle(rows), LATENCY_CALLS):
+        start = time.perf_counter()
+        engine.predict(symptoms.lower(), age, gender)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    result.update(
+        artifact_bytes=len(artifact),
+        load_ms=statistics.median(load_times) * 1000,
+        latency_p50_us=latencies[len(latencies) // 2] * 1e6,
+        latency_p99_us=latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6,
+    )
+    return result
+
+
+def search(rows, grid=DEFAULT_GRID, folds=FOLDS, workers=None, log=print):
+    """Evaluate every grid candidate on rows of (symptoms, age, gender, label)
+
+    Returns one result dict per candidate, best CV accuracy first (ties go to
+    the faster candidate).
+    """
+    folds = fold_count([row[3] for row in rows], folds)
+    pairs = list(candidates(grid))
+    vector_grid = list({tuple(sorted(v.items())): v for v, _ in pairs}.values())
+    workers = workers or os.cpu_count() or 1
+    log(f"✓ {len(pairs)} candidates, {len(vector_grid)} TF-IDF settings, "
+        f"{folds}-fold stratified CV on {len(rows)} rows, {workers} workers")
+
+    start = time.perf_counter()
+    cache = vectorize_folds(rows, vector_grid, folds)
+    log(f"✓ TF-IDF features cached in {time.perf_counter() - start:.2f}s")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache,)) as pool:
+        futures = [pool.submit(evaluate, v, f) for v, f in pairs]
+        for done, future in enumerate(futures, 1):
+            results.append(future.result())
+            if done % max(1, len(futures) // 10) == 0:
+                log(f"  {done}/{len(futures)} candidates evaluated")
+    log(f"✓ Cross-validation finished in {time.perf_counter() - start:.2f}s")
+
+    results = [measure_serving(result, rows) for result in results]
+    results.sort(key=lambda r: (-r['cv_accuracy'], r['latency_p50_us']))
+    return results
+
+
+def format_report(results, top=None):
+    """Plain-text table of search results"""
+    lines = [
+        f"{'max_feat':>8} {'ngram':>6} {'trees':>5} {'depth':>5} | {'cv acc':>13} | "
+        f"{'npz KB':>7} {'pkl KB':>7} {'load ms':>7} {'p50 µs':>7} {'p99 µs':>7}",
+    ]
+    lines.append('-' * len(lines[0]))
+    for r in results[:top]:
+        p = r['params']
+        lines.append(
+            f"{str(p.get('max_features')):>8} {'%d-%d' % p.get('ngram_range', (1, 1)):>6} "
+            f"{p.get('n_estimators', 100):>5} {str(p.get('max_depth')):>5} | "
+            f"{r['cv_accuracy'] * 100:6.1f}% ±{r['cv_std'] * 100:4.1f} | "
+            f"{r['artifact_bytes'] / 1024:7.0f} {r['pickle_bytes'] / 1024:7.0f} {r['load_ms']:7.2f} "
+            f"{r['latency_p50_us']:7.0f} {r['latency_p99_us']:7.0f}"
+        )
+    return '\n'.join(lines)
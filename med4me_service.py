@@ -0,0 +1,355 @@
+"""Local inference service.
+
+One process hosts the model for every Streamlit server on the machine: a
+ThreadingHTTPServer on localhost takes single-consultation requests, a
+batcher thread groups whatever arrived while the workers were busy (up to
+BATCH_MAX rows, or BATCH_WAIT_MS after the first) and a ProcessPoolExecutor
+scores each group with one predict_many call. Every worker process loads the
+model once and keeps it, so CPU-heavy forest evaluation runs on all cores
+and never on a Streamlit script thread.
+
+The batcher keeps at most one batch in flight per worker; requests queue up
+behind them, so batches grow with load instead of flooding the pool. New
+registry versions are picked up from CURRENT on the next batch; a version
+the workers fail to load is skipped and the last good one keeps serving.
+
+The app talks to it through ServiceClient when MED4ME_INFERENCE_URL is set
+and falls back to the rule-based recommendation on timeout or error.
+
+    python med4me_service.py [--host 127.0.0.1] [--port 8765] [--workers N]
+
+    POST /recommend  {"symptoms": ..., "age": ..., "gender": ...}
+         -> {"prediction", "confidence", "differential", "model_version", "treatment"}
+    GET  /health     GET /metrics (Prometheus text)
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from med4me_metrics import METRICS
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+BATCH_MAX = 64
+BATCH_WAIT_MS = 0
+REQUEST_TIMEOUT = 5
+CLIENT_TIMEOUT = float(os.environ.get('MED4ME_INFERENCE_TIMEOUT', 1.0))
+
+
+# Worker processes: one engine per model version, loaded on first use
+_ENGINES = {}
+_WORKER_DIRS = None
+
+
+def _init_worker(registry, bundled_dir):
+    global _WORKER_DIRS
+    _WORKER_DIRS = (registry, bundled_dir)
+
+
+def _engine(version):
+    from med4me_registry import load_bundled, load_version
+
+    served = _ENGINES.get(version)
+    if served is None:
+        registry, bundled_dir = _WORKER_DIRS
+        if version is None:
+            served = load_bundled(bundled_dir)
+        else:
+            served = (version,) + load_version(version, registry)
+        # Keep the previous version only until the new one is in use
+        while len(_ENGINES) >= 2:
+            _ENGINES.pop(next(iter(_ENGINES)))
+        _ENGINES[version] = served
+    return served
+
+
+class ModelLoadError(Exception):
+    """A worker could not load the model version it was asked to serve"""
+
+
+def _score(engine, records):
+    from med4me_inference import differential
+
+    symptoms, ages, genders = zip(*records)
+    labels, confidences, probabilities = engine.predict_many([(s or '').lower() for s in symptoms], ages, genders)
+    labels = [str(label) for label in labels.tolist()]
+    return list(zip(labels, confidences.tolist(), differential(engine.classes, probabilities)))
+
+
+def score_batch(version, records):
+    """(model_version, results, {label: treatment}) for records.
+
+    A result is (label, confidence, differential), or the exception that
+    record raised: if the batch fails, its records are scored one by one so
+    only the bad ones fail. ModelLoadError means the version itself is bad.
+    """
+    try:
+        model_version, engine, treatment_db = _engine(version)
+    except Exception as e:
+        raise ModelLoadError(f"model {version or 'bundled'}: {type(e).__name__}: {e}") from None
+    try:
+        results = _score(engine, records)
+    except Exception:
+        results = []
+        for record in records:
+            try:
+                results.extend(_score(engine, [record]))
+            except Exception as e:
+                results.append(ValueError(f"{type(e).__name__}: {e}"))
+    labels = {result[0] for result in results if not isinstance(result, Exception)}
+    treatments = {label: treatment_db.get(label, treatment_db.get('general', {})) for label in labels}
+    return model_version, results, treatments
+
+
+class InferenceService:
+    """Micro-batching front end for a process pool of model workers"""
+
+    def __init__(self, workers=None, batch_max=BATCH_MAX, batch_wait_ms=BATCH_WAIT_MS,
+                 registry=None, bundled_dir=None):
+        from med4me_registry import REGISTRY_DIR, CurrentVersion, basedir
+
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_max = batch_max
+        self.batch_wait = batch_wait_ms / 1000
+        self.registry = registry or REGISTRY_DIR
+        self.requests = 0
+        self.batches = 0
+        self.failed_versions = set()
+        self.good_version = None
+        self._current = CurrentVersion(self.registry)
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(self.workers)
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                         initargs=(self.registry, bundled_dir or basedir))
+        self._thread = threading.Thread(target=self._run, name='med4me-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, symptoms, age, gender):
+        """Queue one consultation; the Future yields (label, confidence, version, treatment, differential)"""
+        future = Future()
+        self._queue.put((future, time.perf_counter(), (symptoms, age, gender)))
+        return future
+
+    def version(self):
+        version = self._current.get()
+        if version in self.failed_versions:
+            return self.good_version
+        return version
+
+    def warm_up(self):
+        """Load the model in every worker before taking traffic"""
+        version = self.version()
+        for future in [self._pool.submit(score_batch, version, [('', None, '')]) for _ in range(self.workers)]:
+            future.result()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Wait for a free worker first: meanwhile requests pile up into the next batch
+            self._slots.acquire()
+            batch = self._next_batch()
+            self.requests += len(batch)
+            version = self.version()
+            for name, value in self.stats().items():
+                if name != 'model_version':
+                    METRICS.set_gauge(f'service.{name}', value)
+            future = self._pool.submit(score_batch, version, [record for _, _, record in batch])
+            future.add_done_callback(lambda done, batch=batch, version=version: self._resolve(done, batch, version))
+
+    def _resolve(self, done, batch, version):
+        self._slots.release()
+        self.batches += 1
+        now = time.perf_counter()
+        try:
+            model_version, results, treatments = done.result()
+        except Exception as e:
+            # Only a version that cannot be loaded is skipped from now on
+            if isinstance(e, ModelLoadError) and version is not None and version != self.good_version:
+                self.failed_versions.add(version)
+            for future, _, _ in batch:
+                future.set_exception(e)
+            return
+        self.good_version = version
+        for (future, queued_at, _), result in zip(batch, results):
+            METRICS.observe('service.request', now - queued_at)
+            if isinstance(result, Exception):
+                future.set_exception(result)
+                continue
+            label, confidence, top = result
+            future.set_result((label, confidence, model_version, treatments[label], top))
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch': self.requests / self.batches if self.batches else 0.0,
+            'queue_depth': self._queue.qsize(),
+            'model_version': self.good_version,
+        }
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+def parse_request(body):
+    """(symptoms, age, gender) from a /recommend body; ValueError if malformed"""
+    request = json.loads(body)
+    if not isinstance(request, dict):
+        raise ValueError("expected a JSON object")
+    symptoms, age, gender = request.get('symptoms'), request.get('age'), request.get('gender')
+    if not isinstance(symptoms, str):
+        raise ValueError("symptoms must be a string")
+    if age is not None and (isinstance(age, bool) or not isinstance(age, (str, int, float))):
+        raise ValueError("age must be a string or a number")
+    if gender is not None and not isinstance(gender, str):
+        raise ValueError("gender must be a string")
+    return symptoms, age, gender or ''
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, each
+    # response would wait out the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    service = None
+
+    def _send(self, status, body, content_type='application/json'):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, self.service.stats())
+        elif self.path == '/metrics':
+            self._send(200, METRICS.to_prometheus(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/recommend':
+            self._send(404, {'error': 'not found'})
+            return
+        try:
+            symptoms, age, gender = parse_request(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError as e:
+            # Rejected before it can join, and fail, a batch
+            self._send(400, {'error': str(e)})
+            return
+        future = self.service.submit(symptoms, age, gender)
+        try:
+            label, confidence, model_version, treatment, top = future.result(timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            self._send(503, {'error': str(e) or type(e).__name__})
+            return
+        self._send(200, {'prediction': label, 'confidence': confidence, 'differential': top,
+                         'model_version': model_version, 'treatment': treatment})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every app session may connect at once; the default backlog of 5 resets them
+    request_queue_size = 128
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, workers=None, batch_max=BATCH_MAX,
+          batch_wait_ms=BATCH_WAIT_MS, ready=None):
+    """Run the service until interrupted"""
+    service = InferenceService(workers, batch_max, batch_wait_ms)
+    service.warm_up()
+    handler = type('Handler', (ServiceHandler,), {'service': service})
+    server = ServiceServer((host, port), handler)
+    print(f"✓ Inference service on http://{host}:{server.server_port} "
+          f"({service.workers} workers, model {service.version() or 'bundled'})", flush=True)
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+
+
+class ServiceClient:
+    """Keep-alive HTTP client for the inference service, one connection per thread"""
+
+    def __init__(self, url, timeout=CLIENT_TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.model_version = None
+        self.failures = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def recommend(self, symptoms, age, gender):
+        """(label, confidence, model_version, treatment, differential); raises on timeout or error"""
+        body = json.dumps({'symptoms': symptoms, 'age': age, 'gender': gender})
+        conn = self._connection()
+        try:
+            conn.request('POST', '/recommend', body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            payload = json.loads(response.read())
+        except Exception:
+            # Timed out or dropped: never reuse a connection with a response pending
+            conn.close()
+            self._local.conn = None
+            self.failures += 1
+            raise
+        if response.status != 200:
+            self.failures += 1
+            raise RuntimeError(f"inference service: {payload.get('error', response.status)}")
+        self.model_version = payload['model_version']
+        # JSON turns the (label, probability) pairs into lists
+        differential = tuple(tuple(entry) for entry in payload.get('differential', ()))
+        return (payload['prediction'], payload['confidence'], payload['model_version'],
+                payload['treatment'], differential)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Med4Me recommendations to local app servers")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--workers', type=int, help="model processes (default: one per core)")
+    parser.add_argument('--batch-max', type=int, default=BATCH_MAX)
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_WAIT_MS)
+    args = parser.parse_args()
+    # Turn SIGTERM into a normal exit so the worker processes are shut down too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    serve(args.host, args.port, args.workers, args.batch_max, args.batch_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
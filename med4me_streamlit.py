@@ -1,14 +1,26 @@
 import streamlit as st
-import sqlite3
+import hashlib
 import os
-import pickle
-import json
+import queue
 import re
-import hashlib
+from concurrent.futures import Future
 from datetime import datetime
-import numpy as np
 from pathlib import Path
 
+from med4me_db import (
+    init_db, authenticate_user, register_user, get_doctor_patients_page,
+    get_last_visit, save_visit, DATA_VERSIONS
+)
+from med4me_history import VisitBodies, load_timeline
+from med4me_catalog import card_markdown, catalog_for, fallback_recommendation, model_recommendation
+from med4me_cache import QueryCache, RecommendationCache, recommendation_key
+from med4me_metrics import METRICS, timed, timer
+from med4me_writer import get_writer, ACK_TIMEOUT, WriterClosed
+import med4me_registry
+import med4me_export
+from med4me_service import ServiceClient
+from med4me_scheduler import MicroBatcher
+
 # Page configuration
 st.set_page_config(
     page_title="Med4Me - Clinical Decision Support",
@@ -17,83 +29,26 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-st.markdown("""
-<style>
-    .main {
-        background: linear-gradient(135deg, #1a1a2e, #16213e);
-    }
-    .stButton>button {
-        background: linear-gradient(135deg, #3282b8, #0f4c75);
-        color: white;
-        border: none;
-        border-radius: 10px;
-        padding: 0.5rem 2rem;
-        font-weight: 700;
-        width: 100%;
-    }
-    .stButton>button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(50, 130, 184, 0.4);
-    }
-    .rec-section {
-        background: rgba(15, 76, 117, 0.1);
-        border-left: 3px solid #3282b8;
-        padding: 1rem;
-        margin: 0.5rem 0;
-        border-radius: 8px;
-    }
-    .rec-section.warning {
-        border-left-color: #e74c3c;
-        background: rgba(231, 76, 60, 0.1);
-    }
-    div[data-testid="stSidebar"] {
-        background: rgba(255, 255, 255, 0.05);
-    }
-    /* Center login form */
-    .block-container {
-        max-width: 500px;
-        padding-top: 3rem;
-    }
-    [data-testid="stForm"] {
-        background: rgba(255, 255, 255, 0.05);
-        padding: 2rem;
-        border-radius: 16px;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        box-shadow: 0 20px 60px rgba(0, 0, 0, 0.4);
-    }
-    .stTextInput>div>div>input {
-        background: rgba(255, 255, 255, 0.08);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 10px;
-        color: white;
-    }
-    .stTextInput>div>div>input:focus {
-        border-color: #3282b8;
-        box-shadow: 0 0 0 1px #3282b8;
-    }
-    /* Center title */
-    h1, h2, h3 {
-        text-align: center;
-    }
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-        justify-content: center;
-    }
-    .stTabs [data-baseweb="tab"] {
-        background-color: rgba(255, 255, 255, 0.05);
-        border-radius: 10px;
-        padding: 10px 30px;
-    }
-    .stTabs [aria-selected="true"] {
-        background: linear-gradient(135deg, #3282b8, #0f4c75);
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Database setup
+# Paths
 basedir = Path(__file__).parent
-DB_PATH = basedir / 'med4me.db'
+STYLESHEET = basedir / 'static' / 'med4me.css'
+
+# Custom CSS. Served as a static asset (.streamlit/config.toml enables
+# static serving) the browser fetches once and revalidates, instead of a
+# <style> block resent in every rerun's payload; the query string changes
+# with the file, so an edit is picked up. Inlined when static serving is off.
+@st.cache_resource
+def stylesheet_link():
+    version = hashlib.sha256(STYLESHEET.read_bytes()).hexdigest()[:12]
+    return f'<link rel="stylesheet" href="app/static/{STYLESHEET.name}?v={version}">'
+
+if st.get_option('server.enableStaticServing'):
+    st.markdown(stylesheet_link(), unsafe_allow_html=True)
+else:
+    st.html(STYLESHEET)
+
+# Accounts allowed to see the latency dashboard
+ADMIN_USERS = set(os.environ.get('MED4ME_ADMINS', 'admin').split(','))
 
 # Initialize session state
 if 'authenticated' not in st.session_state:
@@ -108,435 +63,161 @@ if 'patient_data' not in st.session_state:
     st.session_state.patient_data = {}
 if 'step' not in st.session_state:
     st.session_state.step = 0
+if 'patient_pages' not in st.session_state:
+    st.session_state.patient_pages = 1
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
+if 'visit_bodies' not in st.session_state:
+    st.session_state.visit_bodies = VisitBodies()
+# Sidebar and history reads, kept until this doctor's data changes
+if 'query_cache' not in st.session_state:
+    st.session_state.query_cache = QueryCache(DATA_VERSIONS)
 
-# Password hashing functions
-def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+def reset_patient_pages():
+    """Start the sidebar list from the first page after the search changes"""
+    st.session_state.patient_pages = 1
 
-def verify_password(password, hashed):
-    """Verify a password against its hash"""
-    return hash_password(password) == hashed
+# Model artifacts: the published registry version if any, else the bundled files
+MODEL_ARTIFACT = basedir / 'ml_model.npz'
+MODEL_PATH = basedir / 'ml_model.pkl'
+VECTORIZER_PATH = basedir / 'vectorizer.pkl'
+TREATMENT_PATH = basedir / 'treatment_db.json'
 
-# Database functions
-def init_db():
-    """Initialize database tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    
-    # Users table
-    cur.execute('''CREATE TABLE IF NOT EXISTS user (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    # Doctor-Patient mapping
-    cur.execute('''CREATE TABLE IF NOT EXISTS doctor_patient (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        doctor_id INTEGER NOT NULL,
-        patient_id TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(doctor_id, patient_id),
-        FOREIGN KEY (doctor_id) REFERENCES user(id)
-    )''')
-    
-    # Visits table
-    cur.execute('''CREATE TABLE IF NOT EXISTS visit (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id TEXT NOT NULL,
-        doctor_id INTEGER,
-        date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        symptoms TEXT,
-        age TEXT,
-        gender TEXT,
-        genetic_history TEXT,
-        medicine TEXT,
-        diagnosis TEXT,
-        lifestyle TEXT,
-        follow_up TEXT,
-        ml_prediction TEXT,
-        ml_confidence REAL,
-        FOREIGN KEY (doctor_id) REFERENCES user(id)
-    )''')
-    
-    # Create default admin user
-    try:
-        cur.execute("SELECT * FROM user WHERE username = 'admin'")
-        if not cur.fetchone():
-            password_hash = hash_password('admin123')
-            cur.execute("INSERT INTO user (username, password_hash) VALUES (?, ?)", 
-                       ('admin', password_hash))
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
+# Loaded on first use, so pages that never score don't wait for it; after
+# that new registry versions are verified and swapped in off the request path.
+@st.cache_resource
+def get_active_model():
+    """Served model, shared by every session"""
+    return med4me_registry.ActiveModel(bundled_dir=basedir)
+
+ACTIVE_MODEL = get_active_model()
+
+# With MED4ME_INFERENCE_URL set, scoring goes to med4me_service and this
+# process never loads the model itself
+INFERENCE_URL = os.environ.get('MED4ME_INFERENCE_URL')
 
-# Load ML Model
 @st.cache_resource
-def load_ml_model():
-    """Load ML model if available"""
-    try:
-        model_path = basedir / 'ml_model.pkl'
-        vectorizer_path = basedir / 'vectorizer.pkl'
-        treatment_path = basedir / 'treatment_db.json'
-        
-        if model_path.exists() and vectorizer_path.exists():
-            with open(model_path, 'rb') as f:
-                model = pickle.load(f)
-            with open(vectorizer_path, 'rb') as f:
-                vectorizer = pickle.load(f)
-            treatment_db = {}
-            if treatment_path.exists():
-                with open(treatment_path, 'r') as f:
-                    treatment_db = json.load(f)
-            return model, vectorizer, treatment_db, True
-    except Exception as e:
-        st.sidebar.warning(f"ML Model not found: {e}")
-    return None, None, {}, False
-
-ML_MODEL, VECTORIZER, TREATMENT_DB, USE_ML = load_ml_model()
-
-# Authentication functions
-def authenticate_user(username, password):
-    """Authenticate user credentials"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, password_hash FROM user WHERE username = ?", (username,))
-    result = cur.fetchone()
-    conn.close()
-    
-    if result and verify_password(password, result[1]):
-        return result[0]
-    return None
-
-def register_user(username, password):
-    """Register new user"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+def get_inference_client():
+    """Client for the shared inference service, if one is configured"""
+    return ServiceClient(INFERENCE_URL) if INFERENCE_URL else None
+
+INFERENCE_CLIENT = get_inference_client()
+USE_ML = INFERENCE_CLIENT is not None or ACTIVE_MODEL.available()
+
+@st.cache_resource
+def get_recommendation_batcher():
+    """Scores concurrent sessions' consultations in shared batches"""
+    active_model = get_active_model()
+
+    def score(records):
+        # Imported on the first batch, with the model, not on the login page
+        from med4me_inference import differential
+
+        # One served triple per batch, so every row of it names the same version
+        model_version, engine, treatment_db = active_model.get()
+        symptoms, ages, genders = zip(*records)
+        labels, confidences, probabilities = engine.predict_many(
+            [s.lower() for s in symptoms], ages, genders)
+        # The differential comes from the same probabilities, not another pass
+        return [
+            (model_version, treatment_db, label, confidence, top)
+            for label, confidence, top in zip(labels.tolist(), confidences.tolist(),
+                                              differential(engine.classes, probabilities))
+        ]
+    return MicroBatcher(score)
+
+RECOMMENDATION_BATCHER = get_recommendation_batcher()
+
+@st.cache_resource
+def get_recommendation_cache():
+    """Recommendation cache shared by every session"""
+    # Registry versions are part of the key; only the bundled files are watched
+    return RecommendationCache(watch=[MODEL_ARTIFACT, MODEL_PATH, VECTORIZER_PATH, TREATMENT_PATH])
+
+RECOMMENDATION_CACHE = get_recommendation_cache()
+
+def service_recommendation(symptoms, age, gender, genetic_history, key):
+    """Score through the inference service; rule-based if it is slow or down"""
     try:
-        password_hash = hash_password(password)
-        cur.execute("INSERT INTO user (username, password_hash) VALUES (?, ?)", 
-                   (username, password_hash))
-        conn.commit()
-        user_id = cur.lastrowid
-        conn.close()
-        return user_id, None
-    except sqlite3.IntegrityError:
-        conn.close()
-        return None, "Username already exists"
+        with timer('model.service'):
+            prediction, confidence, model_version, treatment, top = INFERENCE_CLIENT.recommend(symptoms, age, gender)
     except Exception as e:
-        conn.close()
-        return None, str(e)
-
-# Patient management functions
-def get_doctor_patients(doctor_id):
-    """Get all patients for a doctor"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT DISTINCT dp.patient_id, dp.created_at,
-               (SELECT COUNT(*) FROM visit WHERE doctor_id = ? AND patient_id = dp.patient_id) as visit_count,
-               (SELECT date FROM visit WHERE doctor_id = ? AND patient_id = dp.patient_id ORDER BY date DESC LIMIT 1) as last_visit,
-               (SELECT symptoms FROM visit WHERE doctor_id = ? AND patient_id = dp.patient_id ORDER BY date DESC LIMIT 1) as last_symptoms
-        FROM doctor_patient dp
-        WHERE dp.doctor_id = ?
-        ORDER BY dp.created_at DESC
-    """, (doctor_id, doctor_id, doctor_id, doctor_id))
-    patients = cur.fetchall()
-    conn.close()
-    return patients
-
-def get_patient_history(patient_id, doctor_id):
-    """Get patient visit history"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT v.*, u.username 
-        FROM visit v
-        LEFT JOIN user u ON v.doctor_id = u.id
-        WHERE v.patient_id = ? AND v.doctor_id = ?
-        ORDER BY v.date ASC
-    """, (patient_id, doctor_id))
-    history = cur.fetchall()
-    conn.close()
-    return history
-
-def add_doctor_patient_mapping(doctor_id, patient_id):
-    """Add doctor-patient mapping"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    try:
-        cur.execute("INSERT OR IGNORE INTO doctor_patient (doctor_id, patient_id) VALUES (?, ?)",
-                   (doctor_id, patient_id))
-        conn.commit()
-    except:
-        pass
-    conn.close()
+        METRICS.set_gauge('model.service_failures', INFERENCE_CLIENT.failures)
+        st.warning(f"Model service unavailable ({type(e).__name__}); showing the rule-based recommendation")
+        # Not cached, so the service is tried again on the next request
+        return fallback_recommendation(symptoms, age, gender, genetic_history)
+    record = catalog_for(model_version).lookup(prediction, treatment)
+    rec = model_recommendation(record, prediction, confidence, model_version, top)
+    RECOMMENDATION_CACHE.put((model_version,) + key[1:], rec)
+    return rec
 
 # ML Recommendation function
+@timed('ml_recommendation')
 def ml_recommendation(symptoms, age, gender, genetic_history=None):
     """Generate medical recommendation using ML or fallback"""
-    if USE_ML and ML_MODEL and VECTORIZER:
+    served_version = INFERENCE_CLIENT.model_version if INFERENCE_CLIENT else ACTIVE_MODEL.version
+    key = (served_version,) + recommendation_key(symptoms, age, gender)
+    cached = RECOMMENDATION_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
+    if INFERENCE_CLIENT:
+        return service_recommendation(symptoms, age, gender, genetic_history, key)
+    
+    if USE_ML:
         try:
-            text_vector = VECTORIZER.transform([symptoms.lower()])
-            age_val = int(age) if str(age).isdigit() else 30
-            gender_val = 0 if gender.lower() in ['male', 'm'] else 1
-            
-            X = np.hstack([
-                text_vector.toarray(),
-                np.array([[age_val]]),
-                np.array([[gender_val]])
-            ])
-            
-            prediction = ML_MODEL.predict(X)[0]
-            probabilities = ML_MODEL.predict_proba(X)[0]
-            confidence = float(max(probabilities))
-            
-            treatment = TREATMENT_DB.get(prediction, TREATMENT_DB.get('general', {}))
+            # Batched with other sessions' requests; version, treatments and
+            # prediction all come from the same served model
+            with timer('model.predict'):
+                model_version, treatment_db, prediction, confidence, top = \
+                    RECOMMENDATION_BATCHER.run((symptoms, age, gender))
             
-            diagnosis_map = {
-                'fever': 'Acute Febrile Illness',
-                'diabetes': 'Type 2 Diabetes Mellitus',
-                'cold': 'Upper Respiratory Tract Infection (URTI)',
-                'headache': 'Tension Headache / Migraine',
-                'hypertension': 'Hypertension',
-                'asthma': 'Asthma',
-                'gastric': 'Gastritis',
-                'allergy': 'Allergic Reaction',
-                'arthritis': 'Osteoarthritis',
-                'mental_health': 'Anxiety/Depression - Requires Specialist',
-                'general': 'General Symptomatic Care'
-            }
-            
-            diagnosis = diagnosis_map.get(prediction, 'Condition Requiring Further Assessment')
-            
-            return {
-                "Diagnosis": diagnosis,
-                "Medicine": treatment.get("Medicine", "Symptomatic treatment recommended"),
-                "Alternative": treatment.get("Alternative", "Consult specialist for alternatives"),
-                "Lifestyle": treatment.get("Lifestyle", "Healthy lifestyle, adequate rest"),
-                "Red Flags": treatment.get("Red Flags", "Worsening symptoms, no improvement in 3 days"),
-                "Follow-Up": treatment.get("Follow-Up", "Review in 48-72 hours"),
-                "Notes": f"ML Model Prediction: {prediction} (Confidence: {confidence*100:.1f}%). This is an AI-assisted recommendation.",
-                "ml_prediction": prediction,
-                "ml_confidence": confidence
-            }
+            record = catalog_for(model_version, treatment_db).lookup(prediction)
+            rec = model_recommendation(record, prediction, confidence, model_version, top)
+            RECOMMENDATION_CACHE.put((model_version,) + key[1:], rec)
+            return rec
         except Exception as e:
             st.error(f"ML prediction error: {e}")
+            # Not cached, so the model is tried again on the next request
+            return fallback_recommendation(symptoms, age, gender, genetic_history)
     
-    return fallback_recommendation(symptoms, age, gender, genetic_history)
-
-def fallback_recommendation(symptoms, age, gender, genetic_history=None):
-    """Rule-based fallback recommendation"""
-    s = (symptoms or "").lower()
-    age_val = int(age) if str(age).isdigit() else 30
-    
-    rec = {
-        "Diagnosis": "General symptomatic care",
-        "Medicine": "- Paracetamol 500 mg: Every 6 hours as needed",
-        "Alternative": "- Ibuprofen 200 mg: Every 6-8 hours if no contraindications",
-        "Lifestyle": "Hydration, rest, monitor symptoms.",
-        "Red Flags": "Persistent symptoms more than 3 days, high fever, severe pain.",
-        "Follow-Up": "Review in 48-72 hours if no improvement.",
-        "Notes": "This is a rule-based recommendation. Final prescription authority lies with the licensed physician.",
-        "ml_prediction": None,
-        "ml_confidence": None
-    }
-    
-    # Fever and infections
-    if re.search(r"\bfever\b|\btemperature\b|\bpyrexia\b", s):
-        rec.update({
-            "Diagnosis": "Acute febrile illness",
-            "Medicine": "- Paracetamol 500 mg: Every 6 hours for fever\n- Maintain hydration with ORS",
-            "Alternative": "- Ibuprofen 400 mg: Every 8 hours if no contraindications\n- Cold compress",
-            "Lifestyle": "Fluids (2-3 liters/day), rest, monitor temperature.",
-            "Red Flags": "Fever >39°C for >3 days, severe headache, rash, breathing difficulty, altered consciousness.",
-            "Follow-Up": "Review in 48 hours if fever persists."
-        })
-    
-    # Diabetes
-    elif re.search(r"\bdiabetes\b|\bhigh.*sugar\b|\bhyperglycemi\b", s):
-        rec.update({
-            "Diagnosis": "Type 2 Diabetes Mellitus",
-            "Medicine": "- Metformin 500 mg: BD with meals (start low, titrate up)\n- Monitor blood glucose regularly",
-            "Alternative": "- Glimepiride 1-2 mg OD (if metformin not tolerated)\n- DPP-4 inhibitors (Sitagliptin 100 mg OD)",
-            "Lifestyle": "Low glycemic index diet, 150 min exercise/week, weight loss (if BMI >25), avoid refined sugars.",
-            "Red Flags": "Glucose >400 mg/dL, confusion, chest pain, excessive thirst, fruity breath odor, rapid breathing.",
-            "Follow-Up": "HbA1c every 3 months, annual eye/foot examination."
-        })
-    
-    # Cold/URTI
-    elif re.search(r"\bcough\b|\bcold\b|\bsneez\b|\brunny.*nose\b|\bnasal.*congest\b", s):
-        rec.update({
-            "Diagnosis": "Upper Respiratory Tract Infection (URTI)",
-            "Medicine": "- Cetirizine 10 mg: Once daily at bedtime\n- Dextromethorphan cough syrup: 10 mL TDS\n- Saline nasal drops",
-            "Alternative": "- Loratadine 10 mg OD (non-drowsy)\n- Steam inhalation 2-3 times daily\n- Honey (1 tsp) for cough",
-            "Lifestyle": "Rest, warm fluids (tea, soup), avoid cold beverages, humidify room air.",
-            "Red Flags": "High fever >38.5°C, chest pain, difficulty breathing, persistent symptoms >7 days.",
-            "Follow-Up": "Review if symptoms persist beyond 5-7 days or worsen."
-        })
-    
-    # Headache/Migraine
-    elif re.search(r"\bheadache\b|\bmigrain\b|\bhead.*pain\b", s):
-        rec.update({
-            "Diagnosis": "Tension headache / Migraine",
-            "Medicine": "- Paracetamol 500 mg: Every 6-8 hours (max 4g/day)\n- For migraine: Sumatriptan 50 mg as needed",
-            "Alternative": "- Ibuprofen 400 mg TDS\n- Naproxen 250 mg BD\n- Rest in dark, quiet room",
-            "Lifestyle": "Stress management, regular sleep (7-8 hrs), hydration, avoid triggers (caffeine, alcohol, screens).",
-            "Red Flags": "Sudden severe headache (thunderclap), vision changes, confusion, neck stiffness, fever with headache.",
-            "Follow-Up": "Review if headaches increase in frequency or severity. Consider CT if red flags present."
-        })
-    
-    # Hypertension
-    elif re.search(r"\bhypertension\b|\bhigh.*blood.*pressure\b|\bhbp\b", s):
-        rec.update({
-            "Diagnosis": "Essential Hypertension",
-            "Medicine": "- Amlodipine 5 mg: Once daily\n- Monitor BP regularly (home monitoring)",
-            "Alternative": "- Losartan 50 mg OD (ARB)\n- Enalapril 5 mg OD (ACE inhibitor)\n- Hydrochlorothiazide 12.5 mg OD",
-            "Lifestyle": "Low sodium diet (<2g/day), DASH diet, regular exercise (30 min/day), weight reduction, limit alcohol, quit smoking.",
-            "Red Flags": "BP >180/120, chest pain, severe headache, vision changes, shortness of breath, nosebleeds.",
-            "Follow-Up": "BP monitoring weekly initially, then monthly. Review medications every 3 months."
-        })
-    
-    # Asthma/Breathing problems
-    elif re.search(r"\basthma\b|\bwheezing\b|\bshortness.*breath\b|\bbreathe\b", s):
-        rec.update({
-            "Diagnosis": "Asthma / Reactive Airway Disease",
-            "Medicine": "- Salbutamol inhaler (2 puffs): PRN for symptoms\n- Budesonide inhaler 200 mcg: BD (controller)",
-            "Alternative": "- Montelukast 10 mg: Once daily at bedtime\n- Formoterol + Budesonide combination inhaler",
-            "Lifestyle": "Avoid triggers (dust, smoke, cold air), breathing exercises, maintain healthy weight, flu vaccination.",
-            "Red Flags": "Severe difficulty breathing, blue lips/fingers, unable to speak full sentences, chest tightness not relieved by inhaler.",
-            "Follow-Up": "Review in 2 weeks, peak flow monitoring, pulmonary function tests if persistent."
-        })
-    
-    # Gastritis/Acid reflux
-    elif re.search(r"\bgastric\b|\bacid\b|\bheart.*burn\b|\bindigestion\b|\bstomach.*pain\b|\bepigastric\b", s):
-        rec.update({
-            "Diagnosis": "Gastritis / Gastroesophageal Reflux Disease (GERD)",
-            "Medicine": "- Omeprazole 20 mg: Once daily before breakfast\n- Antacid (Magaldrate) syrup: 10 mL after meals",
-            "Alternative": "- Pantoprazole 40 mg OD\n- Ranitidine 150 mg BD\n- Sucralfate 1g QID",
-            "Lifestyle": "Small frequent meals, avoid spicy/fatty foods, no late meals (3 hrs before bed), elevate head while sleeping, avoid alcohol/smoking.",
-            "Red Flags": "Severe abdominal pain, vomiting blood, black tarry stools, weight loss, difficulty swallowing.",
-            "Follow-Up": "Review in 4 weeks. Consider endoscopy if symptoms persist or red flags present."
-        })
-    
-    # Allergic reactions
-    elif re.search(r"\ballerg\b|\brash\b|\bitch\b|\bhives\b|\burticaria\b", s):
-        rec.update({
-            "Diagnosis": "Allergic Reaction / Urticaria",
-            "Medicine": "- Cetirizine 10 mg: Once daily\n- Hydrocortisone cream 1%: Apply BD to affected areas\n- Avoid known allergens",
-            "Alternative": "- Loratadine 10 mg OD\n- Fexofenadine 120 mg OD (non-sedating)\n- Calamine lotion for local relief",
-            "Lifestyle": "Identify and avoid triggers, wear loose cotton clothing, avoid hot showers, keep skin moisturized.",
-            "Red Flags": "Difficulty breathing, swelling of face/throat/tongue, rapid pulse, dizziness, loss of consciousness (anaphylaxis).",
-            "Follow-Up": "Review in 1 week. Allergy testing if recurrent. Carry epinephrine auto-injector if severe allergies."
-        })
-    
-    # Arthritis/Joint pain
-    elif re.search(r"\barthritis\b|\bjoint.*pain\b|\bknee.*pain\b|\bback.*pain\b|\bosteo\b", s):
-        rec.update({
-            "Diagnosis": "Osteoarthritis / Degenerative Joint Disease",
-            "Medicine": "- Ibuprofen 400 mg: TDS after meals\n- Glucosamine 1500 mg + Chondroitin 1200 mg: Once daily\n- Topical diclofenac gel",
-            "Alternative": "- Naproxen 250 mg BD\n- Paracetamol 1g TDS\n- Hot/cold therapy\n- Capsaicin cream 0.025%",
-            "Lifestyle": "Weight reduction if overweight, low-impact exercises (swimming, cycling), physical therapy, avoid prolonged standing.",
-            "Red Flags": "Severe pain, joint swelling/warmth/redness, fever, inability to bear weight, deformity.",
-            "Follow-Up": "Review in 2 weeks. X-rays if severe. Consider physiotherapy referral."
-        })
-    
-    # Anxiety/Depression
-    elif re.search(r"\banxiety\b|\bdepression\b|\bstress\b|\bpanic\b|\bmental\b|\bsad\b|\bworr\b", s):
-        rec.update({
-            "Diagnosis": "Anxiety / Depression - Requires Mental Health Evaluation",
-            "Medicine": "- Escitalopram 10 mg: Once daily (after psychiatric evaluation)\n- Consider counseling/psychotherapy first",
-            "Alternative": "- Sertraline 50 mg OD\n- Cognitive Behavioral Therapy (CBT)\n- Mindfulness-based therapy",
-            "Lifestyle": "Regular exercise (30 min/day), adequate sleep (7-9 hrs), social support, relaxation techniques (meditation, yoga), limit caffeine/alcohol.",
-            "Red Flags": "Suicidal thoughts, self-harm, severe panic attacks, inability to perform daily activities, hallucinations.",
-            "Follow-Up": "Psychiatric referral recommended. Review in 1 week initially, then every 2-4 weeks."
-        })
-    
-    # Urinary Tract Infection
-    elif re.search(r"\buti\b|\burinary\b|\bburn.*urin\b|\bfrequent.*urin\b|\bdysuria\b", s):
-        rec.update({
-            "Diagnosis": "Urinary Tract Infection (UTI)",
-            "Medicine": "- Nitrofurantoin 100 mg: BD for 5 days\n- Increase fluid intake (2-3 liters/day)",
-            "Alternative": "- Trimethoprim 200 mg BD for 3 days\n- Ciprofloxacin 500 mg BD for 3 days\n- Cranberry supplements",
-            "Lifestyle": "Hydration (8-10 glasses water/day), urinate frequently, avoid holding urine, proper hygiene, cranberry juice.",
-            "Red Flags": "High fever, flank pain, blood in urine, nausea/vomiting, confusion (especially in elderly).",
-            "Follow-Up": "Review if symptoms persist after 48 hours. Urine culture if recurrent UTIs."
-        })
-    
-    # Thyroid disorders
-    elif re.search(r"\bthyroid\b|\bhypothyroid\b|\bhyperthyroid\b|\bfatigue\b|\bweight.*gain\b", s):
-        rec.update({
-            "Diagnosis": "Thyroid Disorder (Requires lab confirmation)",
-            "Medicine": "- Levothyroxine 50 mcg: Once daily (for hypothyroidism, after TSH confirmation)\n- Take on empty stomach",
-            "Alternative": "- Dosage adjustment based on TSH levels\n- Regular monitoring required",
-            "Lifestyle": "Regular medication timing, avoid soy/calcium supplements near medication time, balanced diet, regular exercise.",
-            "Red Flags": "Severe fatigue, rapid heart rate, tremors, significant weight changes, neck swelling.",
-            "Follow-Up": "TSH levels every 6-8 weeks initially, then every 6 months once stable."
-        })
-    
-    # Skin infections
-    elif re.search(r"\bskin.*infection\b|\bfungal\b|\bringworm\b|\beczema\b|\bdermatitis\b", s):
-        rec.update({
-            "Diagnosis": "Skin Infection / Dermatitis",
-            "Medicine": "- Clotrimazole cream 1%: Apply BD for fungal infections\n- Hydrocortisone cream 1%: BD for inflammation (max 7 days)",
-            "Alternative": "- Terbinafine cream 1% BD\n- Mupirocin ointment (if bacterial)\n- Calamine lotion for soothing",
-            "Lifestyle": "Keep area clean and dry, avoid tight clothing, change clothes daily, avoid sharing towels.",
-            "Red Flags": "Spreading infection, fever, pus discharge, severe pain, no improvement in 1 week.",
-            "Follow-Up": "Review in 1 week if no improvement. Skin scraping/culture if persistent."
-        })
-    
-    # Anemia
-    elif re.search(r"\banemia\b|\banemic\b|\blow.*iron\b|\bfatigue\b|\bpale\b|\bdizz\b", s):
-        rec.update({
-            "Diagnosis": "Iron Deficiency Anemia (Requires lab confirmation)",
-            "Medicine": "- Ferrous sulfate 325 mg: Once daily with vitamin C\n- Take on empty stomach or with orange juice",
-            "Alternative": "- Ferrous gluconate 300 mg OD (if GI side effects)\n- Iron polymaltose complex\n- Vitamin B12 if deficient",
-            "Lifestyle": "Iron-rich foods (red meat, spinach, lentils, fortified cereals), vitamin C with meals (enhances absorption), avoid tea/coffee with meals.",
-            "Red Flags": "Severe fatigue, chest pain, shortness of breath, rapid heartbeat, severe dizziness, blood in stool.",
-            "Follow-Up": "Hemoglobin check in 4-6 weeks. Continue iron for 3-6 months to replenish stores."
-        })
-    
-    # Insomnia/Sleep disorders
-    elif re.search(r"\binsomnia\b|\bsleep\b|\bcan't.*sleep\b|\bawake\b", s):
-        rec.update({
-            "Diagnosis": "Insomnia / Sleep Disorder",
-            "Medicine": "- Melatonin 3 mg: 30 minutes before bedtime\n- Short-term: Zolpidem 5 mg (if severe, max 2 weeks)",
-            "Alternative": "- Diphenhydramine 25 mg at bedtime\n- Trazodone 50 mg (if depression present)\n- CBT for insomnia (CBT-I)",
-            "Lifestyle": "Sleep hygiene: regular sleep schedule, dark/cool room, avoid screens 1 hr before bed, no caffeine after 2 PM, relaxation techniques.",
-            "Red Flags": "Sleep apnea symptoms (snoring, gasping), severe daytime impairment, depression with insomnia.",
-            "Follow-Up": "Review in 2 weeks. Sleep study if suspected sleep apnea."
-        })
-    
+    rec = fallback_recommendation(symptoms, age, gender, genetic_history)
+    RECOMMENDATION_CACHE.put(key, rec)
     return rec
 
-def save_visit(patient_id, doctor_id, data, recommendation):
-    """Save visit to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    
-    # Add doctor-patient mapping
-    add_doctor_patient_mapping(doctor_id, patient_id)
-    
-    cur.execute("""
-        INSERT INTO visit (patient_id, doctor_id, symptoms, age, gender, genetic_history,
-                          medicine, diagnosis, lifestyle, follow_up, ml_prediction, ml_confidence)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        patient_id, doctor_id, data.get('symptoms'), data.get('age'), data.get('gender'),
-        data.get('genetic_history'), recommendation.get('Medicine'), recommendation.get('Diagnosis'),
-        recommendation.get('Lifestyle'), recommendation.get('Follow-Up'),
-        recommendation.get('ml_prediction'), recommendation.get('ml_confidence')
-    ))
-    
-    conn.commit()
-    conn.close()
-
 # Initialize database
 init_db()
+VISIT_WRITER = get_writer()
+
+def visit_features(data):
+    """Feature-store row for a visit, if a model is already loaded to build it"""
+    if ACTIVE_MODEL.version is None:
+        return None
+    # Imported here: it pulls in numpy and scipy, which the login page never needs
+    from med4me_features import encode_row
+    try:
+        return encode_row(ACTIVE_MODEL.get().engine, data.get('symptoms'), data.get('age'), data.get('gender'))
+    except Exception:
+        # The store is best effort; backfill covers anything missed here
+        return None
+
+def submit_visit(patient_id, doctor_id, data, recommendation):
+    """Hand the visit to the background writer; returns its acknowledgement"""
+    features = visit_features(data)
+    try:
+        return VISIT_WRITER.submit(patient_id, doctor_id, data, recommendation, features)
+    except (queue.Full, WriterClosed):
+        # Writer is saturated or has stopped: fall back to a direct write rather than drop the visit
+        return save_visit(patient_id, doctor_id, data, recommendation, features)
+
+def confirm_saved(ack):
+    """Wait until the visit is durable and say so under the recommendation"""
+    try:
+        if isinstance(ack, Future):
+            ack.result(timeout=ACK_TIMEOUT)
+        st.caption("✓ Visit saved")
+    except Exception as e:
+        st.error(f"Visit could not be saved: {e}")
 
 # Main app logic
 def main():
@@ -608,7 +289,19 @@ def main():
         
         st.divider()
         
-        patients = get_doctor_patients(st.session_state.user_id)
+        search = st.text_input("🔍 Search patients", key="patient_search",
+                               placeholder="Patient ID or symptom",
+                               on_change=reset_patient_pages)
+        
+        # Walk the keyset pages loaded so far; only PAGE_SIZE rows per "Load more"
+        patients, cursor = [], None
+        for _ in range(st.session_state.patient_pages):
+            page, cursor = st.session_state.query_cache.call(
+                get_doctor_patients_page, st.session_state.user_id,
+                st.session_state.user_id, after=cursor, search=search)
+            patients.extend(page)
+            if cursor is None:
+                break
         
         if patients:
             for patient in patients:
@@ -624,7 +317,15 @@ def main():
                 ):
                     st.session_state.current_patient = patient_id
                     st.session_state.step = 0
+                    st.session_state.history_pages = 1
                     st.rerun()
+            
+            if cursor is not None:
+                if st.button("⬇️ Load more", use_container_width=True):
+                    st.session_state.patient_pages += 1
+                    st.rerun()
+        elif search:
+            st.info("No matching patients")
         else:
             st.info("No patients yet")
         
@@ -637,37 +338,54 @@ def main():
         
         if USE_ML:
             st.success("✅ ML Model Active")
+            if INFERENCE_CLIENT:
+                st.caption(f"Model version: {INFERENCE_CLIENT.model_version or 'pending'} (service {INFERENCE_URL})")
+            else:
+                st.caption(f"Model version: {ACTIVE_MODEL.version or 'loads on first use'}")
+            if ACTIVE_MODEL.last_error and st.session_state.username in ADMIN_USERS:
+                st.warning(f"Model version rejected: {ACTIVE_MODEL.last_error}")
         else:
             st.warning("⚠️ Rule-based System")
+        if VISIT_WRITER.last_error and st.session_state.username in ADMIN_USERS:
+            st.warning(f"Visit writer stopped, saving directly: {VISIT_WRITER.last_error}")
+        
+        cache_stats = RECOMMENDATION_CACHE.stats()
+        st.caption(f"Recommendation cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        query_stats = st.session_state.query_cache.stats()
+        st.caption(f"Query cache: {query_stats['hit_rate']:.0%} hit rate "
+                   f"({query_stats['hits']} hits / {query_stats['misses']} misses)")
+        
+        if st.session_state.username in ADMIN_USERS:
+            st.toggle("📊 Latency dashboard", key="show_metrics")
+        
+        export_panel()
     
     # Main content area
-    if st.session_state.current_patient:
+    if st.session_state.username in ADMIN_USERS and st.session_state.get('show_metrics'):
+        metrics_dashboard()
+    elif st.session_state.current_patient:
         # Show patient history
         st.subheader(f"Patient: {st.session_state.current_patient}")
         
-        history = get_patient_history(st.session_state.current_patient, st.session_state.user_id)
+        last_visit = st.session_state.query_cache.call(
+            get_last_visit, st.session_state.user_id,
+            st.session_state.current_patient, st.session_state.user_id)
         
-        if history:
-            with st.expander("📋 Past Visits", expanded=False):
-                for visit in history:
-                    st.markdown(f"""
-                    **Visit Date:** {visit[3]}  
-                    **Symptoms:** {visit[4]}  
-                    **Diagnosis:** {visit[9]}  
-                    **Medicine:** {visit[8][:100]}...
-                    """)
-                    st.divider()
+        if last_visit:
+            # Nothing but the latest visit is read unless the panel is open
+            if st.toggle("📋 Past Visits", key="show_history"):
+                past_visits(st.session_state.current_patient)
             
             # Pre-fill data from last visit
-            last_visit = history[-1]
+            _, _, age, gender, genetic_history = last_visit
             st.session_state.patient_data = {
                 'patient_id': st.session_state.current_patient,
-                'age': last_visit[5],
-                'gender': last_visit[6],
-                'genetic_history': last_visit[7] or "Not provided"
+                'age': age,
+                'gender': gender,
+                'genetic_history': genetic_history or "Not provided"
             }
             
-            st.info(f"Age: {last_visit[5]} | Gender: {last_visit[6]} | Genetic History: {last_visit[7] or 'Not provided'}")
+            st.info(f"Age: {age} | Gender: {gender} | Genetic History: {genetic_history or 'Not provided'}")
             
             # Only ask for symptoms
             with st.form("symptoms_form"):
@@ -684,15 +402,16 @@ def main():
                             st.session_state.patient_data['gender'],
                             st.session_state.patient_data['genetic_history']
                         )
-                        
-                        save_visit(
-                            st.session_state.current_patient,
-                            st.session_state.user_id,
-                            st.session_state.patient_data,
-                            recommendation
-                        )
-                        
-                        show_recommendation(recommendation)
+                    
+                    # Persist in the background; render first, then wait for the ack
+                    ack = submit_visit(
+                        st.session_state.current_patient,
+                        st.session_state.user_id,
+                        st.session_state.patient_data,
+                        recommendation
+                    )
+                    show_recommendation(recommendation)
+                    confirm_saved(ack)
         else:
             st.info("No past history. Creating new patient record.")
             # New patient workflow
@@ -702,6 +421,115 @@ def main():
         st.subheader("New Patient Consultation")
         new_patient_form()
 
+def past_visits(patient_id):
+    """Visit timeline, newest first; a visit's details are read when opened"""
+    doctor_id = st.session_state.user_id
+    visits, cursor = st.session_state.query_cache.call(
+        load_timeline, doctor_id, patient_id, doctor_id, st.session_state.history_pages)
+    for visit_id, date, diagnosis in visits:
+        if st.toggle(f"{(date or '')[:16]} · {diagnosis or 'No diagnosis'}", key=f"visit_{visit_id}"):
+            visit = st.session_state.visit_bodies.get(visit_id, doctor_id)
+            if visit is None:
+                continue
+            _, date, symptoms, diagnosis, medicine, lifestyle, follow_up = visit[:7]
+            st.markdown(f"""
+            **Visit Date:** {date}  
+            **Symptoms:** {symptoms}  
+            **Diagnosis:** {diagnosis}  
+            **Medicine:** {medicine}  
+            **Lifestyle:** {lifestyle}  
+            **Follow-Up:** {follow_up}
+            """)
+    if cursor is not None:
+        if st.button("⬇️ Older visits", use_container_width=True):
+            st.session_state.history_pages += 1
+            st.rerun()
+    st.divider()
+
+def show_metrics():
+    """Stage percentiles, slow SQL and exports from the process-wide METRICS"""
+    snapshot = METRICS.snapshot()
+    st.caption(f"Since {datetime.fromtimestamp(METRICS.started):%Y-%m-%d %H:%M:%S} "
+               f"· slow-query threshold {snapshot['slow_query_ms']:.0f} ms")
+    
+    stages = [
+        {'Stage': name, 'Calls': stage['count'], 'p50 (ms)': round(stage['p50_ms'], 2),
+         'p95 (ms)': round(stage['p95_ms'], 2), 'p99 (ms)': round(stage['p99_ms'], 2),
+         'Max (ms)': round(stage['max_ms'], 2)}
+        for name, stage in snapshot['stages'].items()
+    ]
+    if stages:
+        st.dataframe(stages, use_container_width=True, hide_index=True)
+    else:
+        st.info("No samples yet")
+    
+    if snapshot['gauges']:
+        st.markdown("**Gauges**")
+        st.dataframe([{'Gauge': name, 'Value': value} for name, value in snapshot['gauges'].items()],
+                     use_container_width=True, hide_index=True)
+    
+    st.markdown("**Slow queries**")
+    if snapshot['slow_queries']:
+        st.dataframe([
+            {'At': datetime.fromtimestamp(q['at']).strftime('%H:%M:%S'), 'ms': round(q['ms'], 1),
+             'Phase': q['phase'], 'SQL': q['sql']}
+            for q in snapshot['slow_queries']
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.caption("None above the threshold")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("⬇️ JSON", METRICS.to_json(), "med4me_metrics.json", "application/json")
+    with col2:
+        st.download_button("⬇️ Prometheus", METRICS.to_prometheus(), "med4me_metrics.prom", "text/plain")
+    with col3:
+        if st.button("♻️ Reset"):
+            METRICS.reset()
+            st.rerun()
+
+# Refresh the dashboard in place every few seconds where fragments are supported
+if hasattr(st, 'fragment'):
+    show_metrics = st.fragment(run_every=5)(show_metrics)
+
+def metrics_dashboard():
+    """Admin-only live latency view"""
+    st.subheader("📊 Latency Dashboard")
+    show_metrics()
+
+def export_panel():
+    """Sidebar export of visits; admins may export every doctor's"""
+    with st.expander("📤 Export visits"):
+        scopes = ["My visits"]
+        if st.session_state.username in ADMIN_USERS:
+            scopes.append("All doctors")
+        scope = st.radio("Scope", scopes, key="export_scope", horizontal=True)
+        formats = [f for f in med4me_export.FORMATS if f != 'parquet' or med4me_export.parquet_available()]
+        fmt = st.selectbox("Format", formats, key="export_format")
+        since = until = None
+        if st.checkbox("Limit to dates", key="export_dated"):
+            since = st.date_input("From", key="export_since")
+            until = st.date_input("To", key="export_until")
+        
+        if st.button("Prepare export", use_container_width=True):
+            doctor = st.session_state.username if scope == "My visits" else None
+            # Streamlit buffers a download in full, so the UI export is capped;
+            # med4me_export.py streams any size to a file
+            with st.spinner("Exporting..."), timer('export.ui'):
+                data = b''.join(med4me_export.stream_export(
+                    fmt, st.session_state.user_id if doctor else None, since, until,
+                    limit=med4me_export.UI_MAX_ROWS,
+                ))
+            st.session_state.export = (
+                data, med4me_export.export_filename(fmt, doctor, since, until), med4me_export.FORMATS[fmt][1]
+            )
+        
+        if st.session_state.get('export'):
+            data, filename, mime = st.session_state.export
+            st.download_button(f"⬇️ {filename} ({len(data) / 1024:.0f} KB)", data, filename, mime,
+                               use_container_width=True)
+            st.caption(f"At most {med4me_export.UI_MAX_ROWS:,} visits; use med4me_export.py for larger exports")
+
 def new_patient_form():
     """Form for new patient consultation"""
     with st.form("new_patient_form"):
@@ -734,66 +562,20 @@ def new_patient_form():
             
             with st.spinner("Generating recommendation..."):
                 recommendation = ml_recommendation(symptoms, age, gender.lower(), genetic_history)
-                
-                save_visit(patient_id, st.session_state.user_id, data, recommendation)
-                
-                st.session_state.current_patient = patient_id
-                show_recommendation(recommendation)
+            
+            ack = submit_visit(patient_id, st.session_state.user_id, data, recommendation)
+            st.session_state.current_patient = patient_id
+            show_recommendation(recommendation)
+            confirm_saved(ack)
 
 def show_recommendation(rec):
     """Display medical recommendation"""
     st.success("✅ Recommendation Generated")
     
-    st.markdown("### 📋 Medical Recommendation")
-    
-    st.markdown(f"""
-    <div class="rec-section">
-    <strong>🔍 Diagnosis:</strong><br/>
-    {rec.get('Diagnosis', 'N/A')}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-    <div class="rec-section">
-    <strong>💊 Medication:</strong><br/>
-    {rec.get('Medicine', 'N/A').replace('- ', '<br/>- ')}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-    <div class="rec-section">
-    <strong>🔄 Alternative Medication:</strong><br/>
-    {rec.get('Alternative', 'N/A').replace('- ', '<br/>- ')}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-    <div class="rec-section">
-    <strong>🏃 Lifestyle Recommendations:</strong><br/>
-    {rec.get('Lifestyle', 'N/A')}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-    <div class="rec-section warning">
-    <strong>⚠️ Red Flags / Warning Signs:</strong><br/>
-    {rec.get('Red Flags', 'N/A')}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-    <div class="rec-section">
-    <strong>📅 Follow-Up:</strong><br/>
-    {rec.get('Follow-Up', 'N/A')}
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-    <div class="rec-section">
-    <strong>📝 Notes:</strong><br/>
-    <em>{rec.get('Notes', 'N/A')}</em>
-    </div>
-    """, unsafe_allow_html=True)
+    # One element: the card pre-rendered per category and model version by
+    # the treatment catalog, with this recommendation's notes
+    st.markdown(card_markdown(rec), unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
+    with timer('streamlit.rerun'):
+        main()
@@ -0,0 +1,244 @@
+"""Synthetic Med4Me data for benchmarks at scale.
+
+Generates doctor accounts (user), their patients (doctor_patient) and visits.
+Each visit belongs to one category from treatment_db.json or the fallback
+rules. Its symptom text is phrases that category's rule matches, now and then
+one from another category, padded with clinical filler to a word count drawn
+from a range. Its treatment fields and ml_prediction come from the same
+category, so history, export and training paths see realistic rows.
+
+Rows go in with executemany on a dedicated connection, CHUNK visits per
+transaction with synchronous off (it is a fixture: a crash just means
+generating again). patient_summary and the symptom FTS index are rebuilt
+once at the end instead of row by row. The same arguments and seed give the
+same rows, so every benchmark can share one fixture.
+
+Only columns the original schema already had are written, so populate() also
+fills pre-migration databases for before/after benchmarks.
+
+    python med4me_synthetic.py [--db PATH] [--doctors 20] [--patients 250] [--visits 20]
+                               [--words 3-12] [--seed 42] [--prefix doctor]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import med4me_db
+from med4me_rules import FALLBACK_DEFAULT, FALLBACK_RULES, FALLBACK_TREATMENTS
+
+basedir = Path(__file__).parent
+TREATMENT_PATH = basedir / 'treatment_db.json'
+
+CHUNK = 100000
+PASSWORD = 'synthetic'
+START = datetime(2023, 1, 1, 8, 0)
+SPAN_DAYS = 730
+
+# Patient IDs are P<doctor number * PATIENT_STRIDE + patient number>
+PATIENT_STRIDE = 100000
+
+# Symptoms for the 'general' category, which has no fallback rule
+GENERAL_PHRASES = ["tiredness", "body ache", "weakness", "loss of appetite", "feeling unwell", "mild discomfort"]
+
+FILLER = ["for two days", "since last week", "on and off", "mild", "severe", "worse at night",
+          "after meals", "in the morning", "no relief with rest", "getting worse", "started suddenly",
+          "also complains of", "similar episodes before", "no recent travel"]
+
+# Symptom texts are drawn from a pool per category rather than built per
+# visit: generating them, not inserting, would otherwise bound the row rate
+TEXT_POOL = 2048
+
+INSERT_SYNTHETIC_USER = "INSERT OR IGNORE INTO user (username, password_hash) VALUES (?, ?)"
+
+INSERT_SYNTHETIC_MAPPING = """
+    INSERT OR IGNORE INTO doctor_patient (doctor_id, patient_id, created_at) VALUES (?, ?, ?)
+"""
+
+INSERT_SYNTHETIC_VISIT = """
+    INSERT INTO visit (patient_id, doctor_id, date, symptoms, age, gender, genetic_history,
+                       medicine, diagnosis, lifestyle, follow_up, ml_prediction, ml_confidence)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SELECT_FTS_TRIGGER = "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'visit_fts_insert'"
+
+GENETIC_HISTORY = ["None", "None", "None", "Family history of diabetes", "Family history of hypertension",
+                   "Mother has asthma", "Father had heart disease"]
+
+
+def rule_phrases(pattern):
+    """Plain phrases a fallback pattern matches: '\\bhigh.*sugar\\b' -> 'high sugar'"""
+    return [' '.join(term.replace('\\b', '') for term in alternative.split('.*'))
+            for alternative in pattern.split('|')]
+
+
+def load_categories(treatment_path=TREATMENT_PATH):
+    """(category, phrases, visit fields) for every treatment_db and rule category"""
+    with open(treatment_path) as f:
+        treatment_db = json.load(f)
+    phrases = {key: rule_phrases(pattern) for key, pattern, _ in FALLBACK_RULES}
+    categories = []
+    for key in list(treatment_db) + [key for key in phrases if key not in treatment_db]:
+        treatment = treatment_db.get(key) or FALLBACK_TREATMENTS[key]
+        fields = (
+            treatment.get('Medicine', FALLBACK_DEFAULT['Medicine']),
+            FALLBACK_TREATMENTS.get(key, FALLBACK_DEFAULT)['Diagnosis'],
+            treatment.get('Lifestyle', FALLBACK_DEFAULT['Lifestyle']),
+            treatment.get('Follow-Up', FALLBACK_DEFAULT['Follow-Up']),
+            # Only treatment_db categories are model labels
+            key if key in treatment_db else None,
+        )
+        categories.append((key, phrases.get(key, GENERAL_PHRASES), fields))
+    return categories
+
+
+def symptom_text(rng, phrases, other_phrases, words):
+    """Symptom text of about words words built around a category's phrases"""
+    parts = rng.sample(phrases, min(len(phrases), rng.randint(1, 2)))
+    if rng.random() < 0.2:
+        parts.append(rng.choice(other_phrases))
+    count = sum(part.count(' ') + 1 for part in parts)
+    while count < words:
+        filler = rng.choice(FILLER)
+        parts.insert(rng.randrange(1, len(parts) + 1), filler)
+        count += filler.count(' ') + 1
+    return ' '.join(parts)
+
+
+def patient_ids(doctor_number, patients):
+    return [f"P{doctor_number * PATIENT_STRIDE + p}" for p in range(patients)]
+
+
+def doctor_names(doctors, prefix='doctor'):
+    return [f"{prefix}{n}" for n in range(1, doctors + 1)]
+
+
+def populate(conn, doctors=20, patients=250, visits=20, words=(3, 12), seed=42, prefix='doctor',
+             password=PASSWORD, chunk=CHUNK, log=None):
+    """Insert synthetic doctors, patients and visits on conn; returns the doctor ids"""
+    rng = random.Random(seed)
+    categories = load_categories()
+    all_phrases = [phrase for _, phrases, _ in categories for phrase in phrases]
+    pools = [
+        ([symptom_text(rng, phrases, all_phrases, rng.randint(*words)) for _ in range(TEXT_POOL)], fields)
+        for _, phrases, fields in categories
+    ]
+
+    conn.execute("BEGIN")
+    password_hash = med4me_db.hash_password(password)
+    names = doctor_names(doctors, prefix)
+    conn.executemany(INSERT_SYNTHETIC_USER, [(name, password_hash) for name in names])
+    doctor_ids = [conn.execute(med4me_db.SELECT_USER, (name,)).fetchone()[0] for name in names]
+    conn.execute("COMMIT")
+
+    mappings, rows = [], []
+    written = 0
+
+    def flush():
+        nonlocal written
+        conn.execute("BEGIN")
+        conn.executemany(INSERT_SYNTHETIC_MAPPING, mappings)
+        conn.executemany(INSERT_SYNTHETIC_VISIT, rows)
+        conn.execute("COMMIT")
+        written += len(rows)
+        mappings.clear()
+        rows.clear()
+        if log:
+            log(f"  {written:,} visits")
+
+    for number, doctor_id in enumerate(doctor_ids, start=1):
+        for patient_id in patient_ids(number, patients):
+            age = rng.randint(1, 90)
+            gender = rng.choice(('male', 'female'))
+            genetic_history = rng.choice(GENETIC_HISTORY)
+            date = START + timedelta(days=rng.uniform(0, SPAN_DAYS))
+            mappings.append((doctor_id, patient_id, date.strftime('%Y-%m-%d %H:%M:%S')))
+            for _ in range(visits):
+                texts, (medicine, diagnosis, lifestyle, follow_up, label) = pools[int(rng.random() * len(pools))]
+                rows.append((
+                    patient_id, doctor_id, date.strftime('%Y-%m-%d %H:%M:%S'),
+                    texts[int(rng.random() * TEXT_POOL)], str(age), gender, genetic_history,
+                    medicine, diagnosis, lifestyle, follow_up, label, round(rng.uniform(0.35, 0.99), 3) if label else None,
+                ))
+                date += timedelta(days=rng.uniform(1, 60))
+            if len(rows) >= chunk:
+                flush()
+    if rows or mappings:
+        flush()
+    return doctor_ids
+
+
+@contextmanager
+def fts_deferred(conn):
+    """Drop the FTS insert trigger for a bulk load, then rebuild the index once"""
+    row = conn.execute(SELECT_FTS_TRIGGER).fetchone()
+    if row is None:
+        yield
+        return
+    conn.execute("DROP TRIGGER visit_fts_insert")
+    try:
+        yield
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("BEGIN")
+        conn.execute("INSERT INTO visit_fts (visit_fts) VALUES ('rebuild')")
+        conn.execute(row[0])
+        conn.execute("COMMIT")
+
+
+def generate(doctors=20, patients=250, visits=20, words=(3, 12), seed=42, prefix='doctor',
+             password=PASSWORD, log=None):
+    """Create or migrate the current database and fill it; returns the doctor ids"""
+    med4me_db.init_db()
+    conn = med4me_db.connect(med4me_db.get_pool().db_path)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        # Reindexing the symptoms in one pass costs far less than the trigger per row
+        with fts_deferred(conn):
+            doctor_ids = populate(conn, doctors, patients, visits, words, seed, prefix, password, log=log)
+        conn.execute("BEGIN")
+        med4me_db.rebuild_patient_summary(conn.cursor())
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return doctor_ids
+
+
+def parse_words(value):
+    low, _, high = value.partition('-')
+    return int(low), int(high or low)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a Med4Me database with synthetic doctors, patients and visits")
+    parser.add_argument('--db', help="database path (default: med4me.db next to the app)")
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=250, help="patients per doctor")
+    parser.add_argument('--visits', type=int, default=20, help="visits per patient")
+    parser.add_argument('--words', type=parse_words, default=(3, 12), help="symptom words per visit, e.g. 3-12")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--prefix', default='doctor', help="doctor usernames are <prefix>1, <prefix>2 ...")
+    parser.add_argument('--password', default=PASSWORD, help="password of every synthetic doctor")
+    args = parser.parse_args()
+
+    if args.db:
+        med4me_db.set_db_path(args.db)
+    total = args.doctors * args.patients * args.visits
+    print(f"Generating {args.doctors} doctors x {args.patients} patients x {args.visits} visits "
+          f"({total:,} visits)", file=sys.stderr)
+    start = time.perf_counter()
+    generate(args.doctors, args.patients, args.visits, args.words, args.seed, args.prefix, args.password,
+             log=lambda line: print(line, file=sys.stderr))
+    elapsed = time.perf_counter() - start
+    print(f"✓ {total:,} visits in {elapsed:.1f} s ({total / elapsed * 60 / 1e6:.2f}M rows/min) "
+          f"to {med4me_db.get_pool().db_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
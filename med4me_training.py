@@ -0,0 +1,149 @@
+"""Incremental retraining from recorded visits.
+
+Labeled visits are streamed out of the visit table in id order, CHUNK_SIZE
+rows at a time (keyset pagination, one short read per chunk), so memory is
+bounded by a chunk whatever the table size. The learner is the existing
+RandomForestClassifier grown with ``warm_start``: every chunk adds
+TREES_PER_CHUNK trees fitted on that chunk plus a small fixed anchor set
+(the seed examples and the first recorded visit of each class), which keeps
+every class present in every fit so all trees share one ``classes_``. The
+vectorizer vocabulary is kept from the base model, so old and new trees read
+the same feature columns.
+
+A visit's label is the category recorded with it: ``ml_prediction`` when the
+model made the recommendation, otherwise the fallback rule whose diagnosis
+was saved.
+"""
+from med4me_db import get_pool
+from med4me_inference import build_features
+from med4me_rules import FALLBACK_DEFAULT, FALLBACK_RULES, FALLBACK_TREATMENTS
+
+CHUNK_SIZE = 50000
+TREES_PER_CHUNK = 10
+MAX_TREES = 300
+
+DIAGNOSIS_LABELS = {fields['Diagnosis']: key for key, _, fields in FALLBACK_RULES}
+DIAGNOSIS_LABELS[FALLBACK_DEFAULT['Diagnosis']] = 'general'
+
+SELECT_MAX_VISIT_ID = "SELECT COALESCE(MAX(id), 0) FROM visit"
+
+SELECT_VISIT_COUNT = "SELECT COUNT(*) FROM visit WHERE id > ? AND id <= ?"
+
+SELECT_LABELED_CHUNK = """
+    SELECT id, symptoms, age, gender, ml_prediction, diagnosis FROM visit
+    WHERE id > ? AND id <= ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+
+def visit_label(ml_prediction, diagnosis):
+    """Category recorded with a visit, or None if it cannot be told"""
+    return ml_prediction or DIAGNOSIS_LABELS.get(diagnosis)
+
+
+def labeled_chunks(after_id, upto_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of (symptoms, age, gender, label) for visits in (after_id, upto_id]"""
+    pool = get_pool()
+    last_id = after_id
+    while True:
+        with pool.connection() as conn:
+            rows = conn.execute(SELECT_LABELED_CHUNK, (last_id, upto_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        chunk = [
+            (symptoms, age, gender or '', label)
+            for _, symptoms, age, gender, prediction, diagnosis in rows
+            if symptoms and (label := visit_label(prediction, diagnosis))
+        ]
+        if chunk:
+            yield chunk
+
+
+def treatment_table(treatment_db, classes):
+    """treatment_db plus a fallback rule's treatment for every class it lacks
+
+    Visits labeled by the fallback rules bring classes (uti, thyroid, ...)
+    the bundled treatment_db never had; the published version must still
+    recommend their treatment rather than the general one.
+    """
+    table = dict(treatment_db)
+    for label in classes:
+        if label not in table and label in FALLBACK_TREATMENTS:
+            table[label] = dict(FALLBACK_TREATMENTS[label])
+    return table
+
+
+def fit_chunk(model, vectorizer, rows):
+    """Add the model's next batch of trees, fitted on rows"""
+    symptoms, ages, genders, labels = zip(*rows)
+    X = build_features(vectorizer, [s.lower() for s in symptoms], ages, genders)
+    model.fit(X, list(labels))
+
+
+def retrain(model, vectorizer, anchors, after_id=0, chunk_size=CHUNK_SIZE,
+            trees_per_chunk=TREES_PER_CHUNK, max_trees=MAX_TREES, log=print):
+    """Grow model on visits newer than after_id; returns (model, summary)
+
+    anchors are (symptoms, age, gender, label) rows mixed into every chunk;
+    together they must cover every class the model already knows (the
+    summary's ``anchors`` - one row per class - is meant to be stored with
+    the published version and passed back next time). If the visits
+    introduce a class the model has never seen, its trees cannot be
+    extended, so a fresh forest with the same settings and as many trees as
+    the one it replaces (up to max_trees) is grown from every visit instead.
+    """
+    from sklearn.base import clone
+
+    with get_pool().connection() as conn:
+        upto_id = conn.execute(SELECT_MAX_VISIT_ID).fetchone()[0]
+
+    # First pass: label set and one example per label, still chunk by chunk
+    first_seen = {}
+    for row in anchors:
+        first_seen.setdefault(row[3], tuple(row))
+    for chunk in labeled_chunks(after_id, upto_id, chunk_size):
+        for row in chunk:
+            first_seen.setdefault(row[3], row)
+    classes = sorted(first_seen)
+
+    if set(map(str, model.classes_)) != set(classes):
+        log(f"✓ Classes changed ({len(model.classes_)} -> {len(classes)}), growing a fresh forest from all visits")
+        # As large as the forest it replaces, spread over the chunks to come
+        target = min(max(len(model.estimators_), trees_per_chunk), max_trees)
+        with get_pool().connection() as conn:
+            expected_chunks = -(-conn.execute(SELECT_VISIT_COUNT, (0, upto_id)).fetchone()[0] // chunk_size)
+        trees_per_chunk = max(trees_per_chunk, -(-target // max(expected_chunks, 1)))
+        model = clone(model).set_params(n_estimators=0)
+        model.estimators_ = []
+        after_id = 0
+    anchor_rows = list(dict.fromkeys([tuple(row) for row in anchors] + list(first_seen.values())))
+
+    model.set_params(warm_start=True)
+    visits = chunks = 0
+    for chunk in labeled_chunks(after_id, upto_id, chunk_size):
+        model.set_params(n_estimators=len(model.estimators_) + trees_per_chunk)
+        fit_chunk(model, vectorizer, chunk + anchor_rows)
+        visits += len(chunk)
+        chunks += 1
+        log(f"  chunk {chunks}: {len(chunk)} visits, {len(model.estimators_)} trees")
+    if chunks == 0 and not model.estimators_:
+        # No visits at all: the anchors alone still make a usable forest
+        model.set_params(n_estimators=trees_per_chunk)
+        fit_chunk(model, vectorizer, anchor_rows)
+    model.set_params(warm_start=False)
+
+    if len(model.estimators_) > max_trees:
+        # Oldest trees go first; every later chunk was fitted with the anchors
+        model.estimators_ = model.estimators_[-max_trees:]
+        model.set_params(n_estimators=max_trees)
+
+    return model, {
+        'visits': visits,
+        'chunks': chunks,
+        'trained_through_visit': upto_id,
+        'n_trees': len(model.estimators_),
+        'classes': classes,
+        'anchors': [list(first_seen[label]) for label in classes],
+    }
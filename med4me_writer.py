@@ -0,0 +1,222 @@
+"""Write-behind visit persistence.
+
+Sessions hand visits to VisitWriter.submit(), which returns a Future at once;
+a single background thread drains the bounded queue and commits everything
+that arrived while the previous commit was running (up to GROUP_COMMIT_MAX
+visits) in one transaction. GROUP_COMMIT_WAIT_MS can hold each batch open a
+little longer for stragglers; it defaults to 0, since with natural batching
+the batch already grows with the commit cost. Under concurrent doctors this
+turns one fsync per submit into one per batch, and nobody waits on SQLite's
+writer lock while the recommendation is rendered.
+
+A future resolves with the visit id only after its batch has committed on a
+synchronous=FULL connection, so an acknowledged visit survives a crash or
+power loss. Each visit runs in its own savepoint: a bad row fails only its
+own future. When the queue is full, submit() blocks (backpressure) for up to
+SUBMIT_TIMEOUT seconds before raising queue.Full. close() - also registered
+with atexit - stops intake and commits everything still queued. If the
+writer thread itself fails (say the database cannot be opened), it fails
+every waiting visit, records last_error and closes, so submit() raises
+WriterClosed at once and callers write directly instead.
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from med4me_db import DATA_VERSIONS, connect, insert_visit, get_pool
+from med4me_metrics import METRICS
+
+QUEUE_SIZE = 1024
+GROUP_COMMIT_MAX = 64
+GROUP_COMMIT_WAIT_MS = 0
+SUBMIT_TIMEOUT = 10
+ACK_TIMEOUT = 15
+
+_STOP = object()
+
+
+class WriterClosed(RuntimeError):
+    """The writer no longer accepts visits"""
+
+
+class VisitWriter:
+    """Background group-committing writer for visits"""
+
+    def __init__(self, db_path=None, queue_size=QUEUE_SIZE, batch_max=GROUP_COMMIT_MAX,
+                 batch_wait_ms=GROUP_COMMIT_WAIT_MS):
+        self.db_path = db_path
+        self.batch_max = batch_max
+        self.batch_wait = batch_wait_ms / 1000
+        self.submitted = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.blocked = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='med4me-visit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, patient_id, doctor_id, data, recommendation, features=None, timeout=SUBMIT_TIMEOUT):
+        """Queue a visit; the returned Future yields its id once durable"""
+        future = Future()
+        item = (future, time.perf_counter(), (patient_id, doctor_id, dict(data), dict(recommendation), features))
+        with self._lock:
+            if self._closed:
+                raise WriterClosed("visit writer is closed")
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: the writer is behind, so the caller waits for room
+            with self._lock:
+                self.blocked += 1
+            start = time.perf_counter()
+            try:
+                self._queue.put(item, timeout=timeout)
+            finally:
+                METRICS.observe('writer.enqueue_wait', time.perf_counter() - start)
+        # Counted once queued: a put that times out raises queue.Full instead
+        with self._lock:
+            self.submitted += 1
+        if self.last_error is not None:
+            # The thread died after the closed check: nothing else drains the queue
+            self._drain(WriterClosed(f"visit writer stopped: {self.last_error}"))
+        METRICS.set_gauge('writer.queue_depth', self._queue.qsize())
+        return future
+
+    def _next_batch(self):
+        """Block for one item, then gather more until full or the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_max and batch[-1] is not _STOP:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        batch = []
+        try:
+            conn = connect(self.db_path)
+            # Acknowledged means on disk, not just in the WAL page cache
+            conn.execute("PRAGMA synchronous = FULL")
+            stopping = False
+            while not stopping:
+                batch = self._next_batch()
+                if batch[-1] is _STOP:
+                    batch.pop()
+                    stopping = True
+                if batch:
+                    self._commit(conn, batch)
+                batch = []
+                for name, value in self.stats().items():
+                    METRICS.set_gauge(f'writer.{name}', value)
+        except Exception as e:
+            self._fail(e, batch)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _fail(self, error, batch):
+        """Stop intake after a fatal error and fail every visit still waiting"""
+        with self._lock:
+            self._closed = True
+            self.last_error = f"{type(error).__name__}: {error}"
+        failure = WriterClosed(f"visit writer stopped: {self.last_error}")
+        for future, _, _ in batch:
+            if not future.done():
+                future.set_exception(failure)
+        self._drain(failure)
+
+    def _drain(self, error):
+        """Fail every visit left in the queue"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and not item[0].done():
+                item[0].set_exception(error)
+
+    def _commit(self, conn, batch):
+        results = []
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.cursor()
+            for future, _, visit in batch:
+                cur.execute("SAVEPOINT visit")
+                try:
+                    results.append(insert_visit(cur, *visit))
+                    cur.execute("RELEASE visit")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO visit")
+                    cur.execute("RELEASE visit")
+                    results.append(e)
+            conn.commit()
+            # Before any ack: the session's next rerun must not read cached results
+            for doctor_id in {visit[1] for _, _, visit in batch}:
+                DATA_VERSIONS.bump(doctor_id)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            results = [e] * len(batch)
+        done = time.perf_counter()
+        METRICS.observe('writer.commit', done - start)
+        self.batches += 1
+
+        for (future, submitted_at, _), result in zip(batch, results):
+            METRICS.observe('writer.ack', done - submitted_at)
+            if isinstance(result, Exception):
+                self.failed += 1
+                future.set_exception(result)
+            else:
+                self.committed += 1
+                future.set_result(result)
+
+    def close(self, timeout=None):
+        """Stop accepting visits and commit everything already queued"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            # Visits that raced with close() and landed behind the stop marker
+            self._drain(WriterClosed("visit writer is closed"))
+
+    def stats(self):
+        """Queue depth and counters for the dashboard"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+            'submitted': self.submitted,
+            'committed': self.committed,
+            'failed': self.failed,
+            'batches': self.batches,
+            'mean_batch': (self.committed + self.failed) / self.batches if self.batches else 0.0,
+            'blocked_submits': self.blocked,
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return the process-wide VisitWriter for the current database"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = VisitWriter(get_pool().db_path)
+                atexit.register(_writer.close)
+    return _writer
@@ -1,11 +1,17 @@
 import pandas as pd
-import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import LabelEncoder
+import argparse
 import pickle
 import json
 
+from med4me_inference import InferenceEngine, build_features
+from med4me_encoding import AGE_BINS, AGE_BAND_LABELS
+from med4me_training import CHUNK_SIZE, TREES_PER_CHUNK, MAX_TREES
+from med4me_artifacts import export_artifacts
+import med4me_registry
+
 # Medical training dataset
 training_data = [
     # Fever/Flu cases
@@ -142,100 +148,210 @@ treatment_db = {
     }
 }
 
-print("="*60)
-print("Med4Me ML Model Training Script")
-print("="*60)
-
-# Create DataFrame
-df = pd.DataFrame(training_data)
-print(f"\n✓ Loaded {len(df)} training samples")
-
-# Feature engineering
-df['age_group'] = pd.cut(df['age'], bins=[0, 18, 35, 50, 65, 100], labels=['child', 'young_adult', 'middle_age', 'senior', 'elderly'])
-df['gender_encoded'] = df['gender'].map({'male': 0, 'female': 1})
-
-# Prepare features
-X_text = df['symptoms']
-X_age = df['age'].values.reshape(-1, 1)
-X_gender = df['gender_encoded'].values.reshape(-1, 1)
-y = df['category']
-
-# Text vectorization
-print("\n✓ Creating TF-IDF vectorizer...")
-vectorizer = TfidfVectorizer(max_features=100, ngram_range=(1, 2))
-X_text_vectors = vectorizer.fit_transform(X_text)
-
-# Combine features
-X_combined = np.hstack([
-    X_text_vectors.toarray(),
-    X_age,
-    X_gender
-])
-
-print(f"✓ Feature matrix shape: {X_combined.shape}")
-
-# Train model
-print("\n✓ Training Random Forest model...")
-model = RandomForestClassifier(n_estimators=100, random_state=42, max_depth=10)
-model.fit(X_combined, y)
-
-# Calculate training accuracy
-train_accuracy = model.score(X_combined, y)
-print(f"✓ Training accuracy: {train_accuracy*100:.2f}%")
-
-# Feature importance
-feature_names = vectorizer.get_feature_names_out().tolist() + ['age', 'gender']
-importances = model.feature_importances_
-top_features = sorted(zip(feature_names, importances), key=lambda x: x[1], reverse=True)[:10]
-print("\n✓ Top 10 important features:")
-for feat, imp in top_features:
-    print(f"  - {feat}: {imp:.4f}")
-
-# Save model and vectorizer
-print("\n✓ Saving model files...")
-with open('ml_model.pkl', 'wb') as f:
-    pickle.dump(model, f)
-
-with open('vectorizer.pkl', 'wb') as f:
-    pickle.dump(vectorizer, f)
-
-with open('treatment_db.json', 'w') as f:
-    json.dump(treatment_db, f, indent=2)
-
-print("\n✓ Model saved as: ml_model.pkl")
-print("✓ Vectorizer saved as: vectorizer.pkl")
-print("✓ Treatment database saved as: treatment_db.json")
-
-# Test prediction
-print("\n" + "="*60)
-print("Testing Model with Sample Cases")
-print("="*60)
-
-test_cases = [
-    {"symptoms": "high fever and body ache", "age": 30, "gender": "male"},
-    {"symptoms": "frequent urination and excessive thirst", "age": 55, "gender": "female"},
-    {"symptoms": "severe headache with nausea", "age": 35, "gender": "female"},
-]
+def train_seed(max_features=100, ngram_range=(1, 2), n_estimators=100, max_depth=10):
+    """Train from the built-in examples and publish"""
+    # Create DataFrame
+    df = pd.DataFrame(training_data)
+    print(f"\n✓ Loaded {len(df)} training samples")
 
-for i, test in enumerate(test_cases, 1):
-    # Prepare test features
-    test_vector = vectorizer.transform([test['symptoms']])
-    test_age = np.array([[test['age']]])
-    test_gender = np.array([[0 if test['gender'] == 'male' else 1]])
-    test_combined = np.hstack([test_vector.toarray(), test_age, test_gender])
-    
-    # Predict
-    prediction = model.predict(test_combined)[0]
-    probabilities = model.predict_proba(test_combined)[0]
-    confidence = max(probabilities) * 100
-    
-    print(f"\nTest Case {i}:")
-    print(f"  Symptoms: {test['symptoms']}")
-    print(f"  Age: {test['age']}, Gender: {test['gender']}")
-    print(f"  Predicted: {prediction} (Confidence: {confidence:.1f}%)")
-
-print("\n" + "="*60)
-print("✓ Model training completed successfully!")
-print("="*60)
-print("\nNext step: Run the Flask app with 'python app.py'")
-print("The app will automatically use the ML model.")
\ No newline at end of file
+    # Feature engineering
+    df['age_group'] = pd.cut(df['age'], bins=AGE_BINS, labels=AGE_BAND_LABELS)
+    df['gender_encoded'] = df['gender'].map({'male': 0, 'female': 1})
+
+    # Prepare features
+    X_text = df['symptoms']
+    y = df['category']
+
+    # Text vectorization
+    print("\n✓ Creating TF-IDF vectorizer...")
+    vectorizer = TfidfVectorizer(max_features=max_features, ngram_range=ngram_range)
+    vectorizer.fit(X_text)
+
+    # Combine features (same sparse rows the app builds at inference time)
+    X_combined = build_features(vectorizer, X_text, df['age'], df['gender'])
+
+    print(f"✓ Feature matrix shape: {X_combined.shape}")
+
+    # Train model
+    print("\n✓ Training Random Forest model...")
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, max_depth=max_depth)
+    model.fit(X_combined, y)
+
+    # Calculate training accuracy
+    train_accuracy = model.score(X_combined, y)
+    print(f"✓ Training accuracy: {train_accuracy*100:.2f}%")
+
+    # Feature importance
+    feature_names = vectorizer.get_feature_names_out().tolist() + ['age', 'gender']
+    importances = model.feature_importances_
+    top_features = sorted(zip(feature_names, importances), key=lambda x: x[1], reverse=True)[:10]
+    print("\n✓ Top 10 important features:")
+    for feat, imp in top_features:
+        print(f"  - {feat}: {imp:.4f}")
+
+    # Save model and vectorizer
+    print("\n✓ Saving model files...")
+    with open('ml_model.pkl', 'wb') as f:
+        pickle.dump(model, f)
+
+    with open('vectorizer.pkl', 'wb') as f:
+        pickle.dump(vectorizer, f)
+
+    with open('treatment_db.json', 'w') as f:
+        json.dump(treatment_db, f, indent=2)
+
+    export_artifacts(model, vectorizer, 'ml_model.npz')
+
+    print("\n✓ Model saved as: ml_model.pkl")
+    print("✓ Vectorizer saved as: vectorizer.pkl")
+    print("✓ Compact serving artifact saved as: ml_model.npz")
+    print("✓ Treatment database saved as: treatment_db.json")
+
+    version = med4me_registry.publish(model, vectorizer, treatment_db, {
+        'source': 'seed',
+        'samples': len(df),
+        'trained_through_visit': 0,
+        'train_accuracy': train_accuracy,
+        'params': {'max_features': max_features, 'ngram_range': list(ngram_range),
+                   'n_estimators': n_estimators, 'max_depth': max_depth},
+    })
+    print(f"✓ Published model version: {version}")
+    return model, vectorizer
+
+
+def retrain_from_db(args):
+    """Grow the current model on recorded visits and publish"""
+    from med4me_training import retrain, treatment_table
+
+    if args.db:
+        from med4me_db import set_db_path
+        set_db_path(args.db)
+
+    anchors = [(row['symptoms'], row['age'], row['gender'], row['category']) for row in training_data]
+    base_version = med4me_registry.current_version()
+    if base_version:
+        model, vectorizer = med4me_registry.load_model(base_version)
+        meta = med4me_registry.read_meta(base_version)
+        after_id = meta.get('trained_through_visit', 0)
+        anchors += [tuple(row) for row in meta.get('anchors', [])]
+    else:
+        with open('ml_model.pkl', 'rb') as f:
+            model = pickle.load(f)
+        with open('vectorizer.pkl', 'rb') as f:
+            vectorizer = pickle.load(f)
+        after_id = 0
+    print(f"✓ Base model: {base_version or 'bundled ml_model.pkl'} ({len(model.estimators_)} trees), "
+          f"visits after id {after_id}")
+
+    model, summary = retrain(model, vectorizer, anchors, after_id=after_id, chunk_size=args.chunk_size,
+                             trees_per_chunk=args.trees_per_chunk, max_trees=args.max_trees)
+    if summary['chunks'] == 0 and base_version:
+        print("✓ No new labeled visits; current version kept")
+        return model, vectorizer
+
+    version = med4me_registry.publish(model, vectorizer, treatment_table(treatment_db, summary['classes']), dict(
+        summary, source='visits', base_version=base_version,
+    ))
+    print(f"✓ Trained on {summary['visits']} visits in {summary['chunks']} chunks, "
+          f"{summary['n_trees']} trees, {len(summary['classes'])} classes")
+    print(f"✓ Published model version: {version}")
+    return model, vectorizer
+
+
+def run_search(args):
+    """Cross-validate a grid of settings and print the trade-off table"""
+    from med4me_search import search, format_report
+
+    rows = [(row['symptoms'], row['age'], row['gender'], row['category']) for row in training_data]
+    if args.from_db:
+        from med4me_training import labeled_chunks, SELECT_MAX_VISIT_ID
+        from med4me_db import get_pool, set_db_path
+        if args.db:
+            set_db_path(args.db)
+        with get_pool().connection() as conn:
+            upto_id = conn.execute(SELECT_MAX_VISIT_ID).fetchone()[0]
+        for chunk in labeled_chunks(0, upto_id):
+            rows += chunk[:args.search_limit - len(rows)]
+            if len(rows) >= args.search_limit:
+                break
+
+    results = search(rows, folds=args.folds, workers=args.workers)
+    print("\n" + format_report(results, top=args.top))
+    best = results[0]['params']
+    print(f"\n✓ Best: {best}")
+    print("  Train it with: python train.py"
+          f" --max-features {best['max_features'] or 0} --ngram-max {best['ngram_range'][1]}"
+          f" --n-estimators {best['n_estimators']} --max-depth {best['max_depth'] or 0}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Full report saved as: {args.report}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Med4Me recommendation model")
+    parser.add_argument('--from-db', action='store_true',
+                        help="grow the current model on labeled visits recorded in the database")
+    parser.add_argument('--db', help="database path (default: med4me.db next to the app)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="visits per chunk")
+    parser.add_argument('--trees-per-chunk', type=int, default=TREES_PER_CHUNK)
+    parser.add_argument('--max-trees', type=int, default=MAX_TREES)
+    parser.add_argument('--max-features', type=int, default=100, help="TF-IDF vocabulary size (0: unlimited)")
+    parser.add_argument('--ngram-max', type=int, default=2, help="longest word n-gram")
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--max-depth', type=int, default=10, help="0: unlimited")
+    parser.add_argument('--search', action='store_true',
+                        help="cross-validate a grid of settings instead of training")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, help="search processes (default: one per core)")
+    parser.add_argument('--top', type=int, help="rows of the search table to print")
+    parser.add_argument('--report', help="write every search result to this JSON file")
+    parser.add_argument('--search-limit', type=int, default=20000,
+                        help="most rows to search on with --from-db")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Med4Me ML Model Training Script")
+    print("="*60)
+
+    if args.search:
+        run_search(args)
+        return
+    if args.from_db:
+        model, vectorizer = retrain_from_db(args)
+    else:
+        model, vectorizer = train_seed(args.max_features or None, (1, args.ngram_max),
+                                       args.n_estimators, args.max_depth or None)
+
+    # Test prediction
+    print("\n" + "="*60)
+    print("Testing Model with Sample Cases")
+    print("="*60)
+
+    test_cases = [
+        {"symptoms": "high fever and body ache", "age": 30, "gender": "male"},
+        {"symptoms": "frequent urination and excessive thirst", "age": 55, "gender": "female"},
+        {"symptoms": "severe headache with nausea", "age": 35, "gender": "female"},
+    ]
+
+    engine = InferenceEngine(model, vectorizer)
+
+    for i, test in enumerate(test_cases, 1):
+        # Predict
+        prediction, confidence, probabilities = engine.predict(test['symptoms'], test['age'], test['gender'])
+        confidence *= 100
+
+        print(f"\nTest Case {i}:")
+        print(f"  Symptoms: {test['symptoms']}")
+        print(f"  Age: {test['age']}, Gender: {test['gender']}")
+        print(f"  Predicted: {prediction} (Confidence: {confidence:.1f}%)")
+
+    print("\n" + "="*60)
+    print("✓ Model training completed successfully!")
+    print("="*60)
+    print("\nNext step: Run the Flask app with 'python app.py'")
+    print("The app will automatically use the ML model.")
+
+
+if __name__ == "__main__":
+    main()